@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BudgetDetails, MandatoryExpense, BasicNeedsExpense, SuddenExpense, BudgetSummary,UserAccount
+from .models import BudgetDetails, MandatoryExpense, BasicNeedsExpense, SuddenExpense, BudgetSummary,UserAccount, MonthlySpendRollup, UserSpendTotals, ReceiptFingerprint, SpendForecast, ExpenseStats, ShardMap, ExpenseArchive, Household, HouseholdBudget, HouseholdRollup
 
 # Registering models
 admin.site.register(BudgetDetails)
@@ -8,3 +8,20 @@ admin.site.register(BasicNeedsExpense)
 admin.site.register(SuddenExpense)
 admin.site.register(BudgetSummary)
 admin.site.register(UserAccount)
+admin.site.register(MonthlySpendRollup)
+admin.site.register(UserSpendTotals)
+admin.site.register(ReceiptFingerprint)
+admin.site.register(SpendForecast)
+admin.site.register(ExpenseStats)
+admin.site.register(ExpenseArchive)
+admin.site.register(Household)
+admin.site.register(HouseholdBudget)
+admin.site.register(HouseholdRollup)
+
+
+@admin.register(ShardMap)
+class ShardMapAdmin(admin.ModelAdmin):
+    # Every family across the shards, from the default database
+    list_display = ("user_id", "username", "email", "phone_number", "shard")
+    list_filter = ("shard",)
+    search_fields = ("username", "email", "phone_number")
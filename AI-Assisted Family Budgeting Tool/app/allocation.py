@@ -0,0 +1,274 @@
+"""
+Budget allocation engine.
+
+An expense is charged to its own category first and then spills over to the
+next categories in WATERFALL; anything the categories cannot cover is drawn
+from the user's lifetime savings. The summary row is updated with a
+compare-and-swap on BudgetSummary.version and the savings draw with a
+conditional UPDATE, both in the same transaction as the expense insert, so
+concurrent submissions from the same family can never lose an update.
+
+add_expenses() does the same for a batch (the JSON API's offline sync): the
+waterfall is run over the items in order in Python, then the summary and the
+savings are written once and each table gets one bulk insert.
+"""
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import F, Value
+from django.utils.timezone import now
+
+from . import anomalies, caching, fingerprints, money, receipts, rollups, sharding
+from .models import BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES
+from .utils import month_bounds
+
+# Category -> BudgetSummary fields it may draw from, in order
+WATERFALL = {
+    "Mandatory": ("mandatory", "basic_needs", "sudden_expenses"),
+    "Basic Needs": ("basic_needs", "sudden_expenses"),
+    "Sudden Expense": ("sudden_expenses", "basic_needs"),
+}
+
+# BudgetSummary field -> BudgetDetails limit it is capped by
+LIMITS = {
+    "mandatory": "mandatory_limit",
+    "basic_needs": "basic_needs_limit",
+    "sudden_expenses": "sudden_expenses_limit",
+}
+
+# How long add_expense keeps retrying while other writers hold the summary
+RETRY_SECONDS = 10
+
+
+class AllocationError(Exception):
+    """The expense could not be recorded; the message is shown to the user."""
+
+
+class NoBudget(AllocationError):
+    pass
+
+
+class InsufficientFunds(AllocationError):
+    pass
+
+
+def plan(budget, spent, category, amount):
+    """
+    Work out how an expense is covered.
+
+    ``spent`` maps BudgetSummary field -> amount already used this month.
+    Returns ``(increments, from_savings)`` where ``increments`` maps
+    BudgetSummary field -> amount to add.
+    """
+    required = amount
+    increments = {}
+    for field in WATERFALL[category]:
+        if required <= 0:
+            break
+        remaining = max(getattr(budget, LIMITS[field]) - spent[field], 0)
+        take = min(required, remaining)
+        if take:
+            increments[field] = take
+            required -= take
+    return increments, max(required, 0)
+
+
+def _try_add_expense(user, category, description, amount, image, month, year, fingerprint=None):
+    """One attempt; returns None when another writer got to the summary first."""
+    rollups.get_totals(user)  # make sure the savings row exists before drawing from it
+    budget = BudgetDetails.objects.filter(user=user, month=month, year=year).first()
+    summary = BudgetSummary.objects.select_for_update().filter(user=user, month=month, year=year).first()
+    if not budget or not summary:
+        raise NoBudget("Set a budget for this month first!")
+
+    spent = {field: getattr(summary, field) for field in LIMITS}
+    increments, from_savings = plan(budget, spent, category, amount)
+
+    updates = {field: F(field) + money.literal(value) for field, value in increments.items()}
+    if from_savings:
+        updates["savings"] = F("savings") - money.literal(from_savings)
+    swapped = BudgetSummary.objects.filter(pk=summary.pk, version=summary.version).update(
+        version=F("version") + 1, **updates
+    )
+    if not swapped:
+        return None
+
+    if from_savings and not rollups.draw_savings(user, from_savings):
+        raise InsufficientFunds("Insufficient funds!")
+
+    model, _ = EXPENSE_CATEGORIES[category]
+    expense = model.objects.create(user=user, expense=description, amount=amount, image=image)
+    rollups.record_expense(user, category, amount, expense.timestamp)
+    anomalies.record(user, category, amount)
+    if fingerprint is not None:
+        fingerprints.record(user, category, expense, fingerprint)
+    receipts.schedule(category, expense)
+    return expense
+
+
+def add_expense(user, category, description, amount, image=None, month=None, year=None, fingerprint=None):
+    """
+    Allocate an expense against the user's budget for the month and save it.
+    ``fingerprint`` (app.fingerprints.Fingerprint of ``image``) is indexed
+    with the expense. Returns the saved expense, or raises AllocationError.
+    """
+    if category not in WATERFALL:
+        raise AllocationError("Invalid category!")
+    if amount <= 0:
+        raise AllocationError("Amount must be more than zero!")
+    if month is None or year is None:
+        month, year = now().month, now().year
+    return _retry(lambda: _try_add_expense(user, category, description, amount, image, month, year, fingerprint))
+
+
+def _try_add_expenses(user, items, month, year):
+    """One attempt at add_expenses(); returns None when another writer got to the summary first."""
+    totals = rollups.get_totals(user)
+    budget = BudgetDetails.objects.filter(user=user, month=month, year=year).first()
+    summary = BudgetSummary.objects.select_for_update().filter(user=user, month=month, year=year).first()
+    if not budget or not summary:
+        raise NoBudget("Set a budget for this month first!")
+
+    spent = {field: getattr(summary, field) for field in LIMITS}
+    increments = dict.fromkeys(LIMITS, money.ZERO)
+    drawn = money.ZERO
+    results = []
+    pending = {category: [] for category in EXPENSE_CATEGORIES}
+    for category, description, amount, image, fingerprint in items:
+        if category not in WATERFALL:
+            results.append(AllocationError("Invalid category!"))
+            continue
+        if amount <= 0:
+            results.append(AllocationError("Amount must be more than zero!"))
+            continue
+        taken, from_savings = plan(budget, spent, category, amount)
+        if from_savings and drawn + from_savings > totals.savings:
+            results.append(InsufficientFunds("Insufficient funds!"))
+            continue
+        for field, value in taken.items():
+            spent[field] += value
+            increments[field] += value
+        drawn += from_savings
+        model, _ = EXPENSE_CATEGORIES[category]
+        expense = model(user=user, expense=description, amount=amount, image=image)
+        pending[category].append((expense, fingerprint))
+        results.append(expense)
+    if not any(pending.values()):
+        return results
+
+    updates = {field: F(field) + money.literal(value) for field, value in increments.items() if value}
+    if drawn:
+        updates["savings"] = F("savings") - money.literal(drawn)
+    swapped = BudgetSummary.objects.filter(pk=summary.pk, version=summary.version).update(
+        version=F("version") + 1, **updates
+    )
+    if not swapped:
+        return None
+    if drawn and not rollups.draw_savings(user, drawn):
+        transaction.set_rollback(True, using=sharding.db())  # the savings changed since they were read
+        return None
+
+    deltas = {}
+    for category, rows in pending.items():
+        if not rows:
+            continue
+        model, field = EXPENSE_CATEGORIES[category]
+        model.objects.bulk_create([expense for expense, _ in rows])
+        for expense, fingerprint in rows:
+            month_deltas = deltas.setdefault((expense.timestamp.year, expense.timestamp.month), {})
+            month_deltas[field] = month_deltas.get(field, 0) + expense.amount
+            if fingerprint is not None:
+                fingerprints.record(user, category, expense, fingerprint)
+            receipts.schedule(category, expense)
+        anomalies.record_bulk(user, category, [expense.amount for expense, _ in rows])
+    rollups.record_bulk(user, deltas)
+    caching.invalidate_dashboard(user.user_id, month, year)  # bulk_create sends no post_save
+    return results
+
+
+def add_expenses(user, items, month=None, year=None):
+    """
+    Allocate a batch of expenses, ``items`` of (category, description,
+    amount, image, fingerprint), in order against the month's budget and save
+    them in one transaction. Returns one entry per item: the saved expense,
+    or the AllocationError it was rejected with. Raises NoBudget, or
+    AllocationError when the budget stays busy.
+    """
+    if month is None or year is None:
+        month, year = now().month, now().year
+    return _retry(lambda: _try_add_expenses(user, items, month, year))
+
+
+def _retry(attempt_once):
+    """Run ``attempt_once`` in a transaction until it returns something other than None."""
+    deadline = time.monotonic() + RETRY_SECONDS
+    attempt = 0
+    while time.monotonic() < deadline:
+        try:
+            with sharding.atomic():
+                result = attempt_once()
+            if result is not None:
+                return result
+        except OperationalError as exc:
+            # SQLite reports a concurrent writer as a lock error rather than blocking
+            if "locked" not in str(exc):
+                raise
+        attempt += 1
+        time.sleep(random.uniform(0, min(0.001 * 2 ** attempt, 0.05)))
+
+    raise AllocationError("The budget is busy, please try again.")
+
+
+@sharding.atomic
+def remove_expense(user, category, expense):
+    """Delete an expense and give its amount back to this month's summary."""
+    _, field = EXPENSE_CATEGORIES[category]
+    BudgetSummary.objects.filter(user=user, month=now().month, year=now().year).update(
+        **{field: F(field) - money.literal(expense.amount)}, version=F("version") + 1
+    )
+    expense.delete()
+    rollups.remove_expense(user, category, expense.amount, expense.timestamp)
+    anomalies.remove(user, category, expense.amount)
+
+
+@sharding.atomic
+def recompute_summary(user, month, year):
+    """
+    Rebuild a month's BudgetSummary by replaying the waterfall over all of the
+    month's expenses in time order. Used after bulk writes (imports), where
+    running add_expense() once per row would be far too slow. Expenses that
+    the budget cannot cover are still counted against savings: unlike a new
+    submission, an imported expense has already happened.
+    Returns the summary, or None when the month has no budget.
+    """
+    budget = BudgetDetails.objects.filter(user=user, month=month, year=year).first()
+    if budget is None:
+        return None
+
+    start, end = month_bounds(year, month)
+    spent = dict.fromkeys(LIMITS, 0)
+    from_savings = 0
+    branches = [
+        model.objects.filter(user=user, timestamp__gte=start, timestamp__lt=end)
+        .annotate(category=Value(category))
+        .values_list("timestamp", "id", "category", "amount")
+        for category, (model, _) in EXPENSE_CATEGORIES.items()
+    ]
+    for _, _, category, amount in branches[0].union(*branches[1:], all=True).order_by("timestamp", "id").iterator():
+        increments, overflow = plan(budget, spent, category, amount)
+        for field, value in increments.items():
+            spent[field] += value
+        from_savings += overflow
+
+    savings = budget.actual_salary - budget.active_salary - from_savings
+    summary = BudgetSummary.objects.select_for_update().filter(user=user, month=month, year=year).first()
+    if summary is None:
+        summary = BudgetSummary.objects.create(user=user, month=month, year=year, savings=savings, **spent)
+        rollups.adjust_savings(user, savings)
+        return summary
+
+    rollups.adjust_savings(user, savings - summary.savings)
+    BudgetSummary.objects.filter(pk=summary.pk).update(savings=savings, version=F("version") + 1, **spent)
+    summary.refresh_from_db()
+    return summary
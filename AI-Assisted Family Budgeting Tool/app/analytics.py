@@ -0,0 +1,168 @@
+"""
+Spend, budget-vs-actual and savings per month over an arbitrary range of
+months, for the analytics page and its JSON API.
+
+Each table is read once for the whole range, whatever its length:
+
+* the three expense tables in a single UNION ALL of per-table GROUP BYs on the
+  timestamp truncated to the month in SQL, so only one row per month and
+  category comes back (the range is a timestamp filter, which seeks the
+  (user, timestamp) index like the history page);
+* the per-month totals of archived years (see app.archive), one query on the
+  (user, year) unique index, without unpacking the archived rows;
+* BudgetDetails and BudgetSummary, one query each, on their (user, year, month)
+  unique indexes.
+
+The sums are exact (integer paise in SQL, Decimals here) and only turned into
+floats for the returned report, which is served as JSON.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import get_current_timezone, localdate
+
+from . import archive, money
+from .models import BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES
+from .utils import month_bounds, shift_month
+
+MAX_MONTHS = 120
+DEFAULT_MONTHS = 12
+FIELDS = tuple(field for _, field in EXPENSE_CATEGORIES.values())
+
+
+class MonthStart(TruncMonth):
+    """
+    TruncMonth, but in UTC on SQLite it is compiled to the built-in strftime()
+    instead of Django's Python-level django_datetime_trunc(), which is called
+    once per row and dominated the time of a five-year range.
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        if self.get_tzname() not in (None, "UTC"):
+            return super().as_sqlite(compiler, connection, **extra_context)
+        sql, params = compiler.compile(self.lhs)
+        return f"strftime('%%Y-%%m-01 00:00:00', {sql})", params
+
+
+def parse_month(value):
+    """'YYYY-MM' -> (year, month); raises ValueError."""
+    try:
+        year, month = (int(part) for part in value.split("-"))
+    except ValueError:
+        year, month = 0, 0
+    if not 1 <= month <= 12 or not 1 <= year <= 9999:
+        raise ValueError(f"{value!r} is not a YYYY-MM month")
+    return year, month
+
+
+def month_range(start=None, end=None, today=None):
+    """
+    ((year, month), (year, month)) inclusive range from ?start= and ?end=
+    (YYYY-MM), defaulting to the DEFAULT_MONTHS up to this month. Raises
+    ValueError for a malformed, reversed or longer than MAX_MONTHS range.
+    """
+    today = today or localdate()
+    last = parse_month(end) if end else (today.year, today.month)
+    first = parse_month(start) if start else shift_month(*last, -(DEFAULT_MONTHS - 1))
+    months = (last[0] - first[0]) * 12 + last[1] - first[1] + 1
+    if months < 1:
+        raise ValueError("start must not be after end")
+    if months > MAX_MONTHS:
+        raise ValueError(f"at most {MAX_MONTHS} months at a time")
+    return first, last
+
+
+def _in_months(first, last):
+    """Q for (year, month) columns between two (year, month) pairs, inclusive."""
+    return (
+        (Q(year__gt=first[0]) | Q(year=first[0], month__gte=first[1]))
+        & (Q(year__lt=last[0]) | Q(year=last[0], month__lte=last[1]))
+    )
+
+
+def _monthly_spend(user_id, start, end):
+    """One query: (month start, category field, total, count) rows."""
+    branches = []
+    for model, field in EXPENSE_CATEGORIES.values():
+        branches.append(
+            model.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+            .annotate(period=MonthStart("timestamp"))
+            .values("period")
+            .annotate(field=Value(field), total=Sum("amount"), count=Count("id"))
+            .values_list("period", "field", "total", "count")
+        )
+    return branches[0].union(*branches[1:], all=True)
+
+
+def _floats(value):
+    """``value`` with every Decimal in it, however deeply nested, as a float."""
+    if isinstance(value, dict):
+        return {key: _floats(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_floats(item) for item in value]
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def report(user_id, first, last):
+    """
+    Month-by-month analytics for ``user_id`` from ``first`` to ``last``
+    ((year, month) pairs, inclusive), oldest month first.
+    """
+    start, end = month_bounds(*first)[0], month_bounds(*last)[1]
+    months = []
+    index = {}
+    year, month = first
+    while (year, month) <= last:
+        index[year, month] = len(months)
+        months.append({
+            "month": f"{year:04d}-{month:02d}",
+            "spend": dict.fromkeys(FIELDS, money.ZERO),
+            "count": 0,
+            "total": money.ZERO,
+            "budget": None,
+            "savings": None,
+        })
+        year, month = shift_month(year, month, 1)
+
+    tz = get_current_timezone()
+    for period, field, total, count in _monthly_spend(user_id, start, end):
+        period = period.astimezone(tz)
+        row = months[index[period.year, period.month]]
+        row["spend"][field] = total
+        row["count"] += count
+        row["total"] += total
+
+    for (year, month), archived in archive.month_totals(user_id, first, last).items():
+        row = months[index[year, month]]
+        for field in FIELDS:
+            row["spend"][field] += archived[field]
+            row["total"] += archived[field]
+        row["count"] += archived["count"]
+
+    budgets = BudgetDetails.objects.filter(_in_months(first, last), user_id=user_id).values_list(
+        "year", "month", "active_salary", *(f"{field}_limit" for field in FIELDS)
+    )
+    for year, month, salary, *limits in budgets:
+        row = months[index[year, month]]
+        row["budget"] = {
+            "salary": salary,
+            "limits": dict(zip(FIELDS, limits)),
+            "remaining": {field: limit - row["spend"][field] for field, limit in zip(FIELDS, limits)},
+        }
+
+    summaries = BudgetSummary.objects.filter(_in_months(first, last), user_id=user_id).values_list("year", "month", "savings")
+    for year, month, savings in summaries:
+        months[index[year, month]]["savings"] = savings
+
+    cumulative = money.ZERO
+    for row in months:
+        cumulative += row["savings"] or 0
+        row["cumulative_savings"] = cumulative
+
+    return _floats({
+        "start": months[0]["month"],
+        "end": months[-1]["month"],
+        "totals": {field: sum((row["spend"][field] for row in months), money.ZERO) for field in FIELDS},
+        "months": months,
+    })
@@ -0,0 +1,208 @@
+"""
+Online anomaly detection on expense amounts.
+
+Each (user, category) has one ExpenseStats row that is updated in place on
+every insert and delete, in the same transaction and after the raw row has
+been written, like the rollups. Checking a new amount reads that single row,
+so it costs the same however long the user's history is.
+
+An amount is flagged when it is both far above the robust range of earlier
+amounts (Tukey's far-out fence on the sketch's quartiles) and more than
+Z_THRESHOLD standard deviations above their mean, and only once there are
+MIN_SAMPLES earlier amounts to compare against.
+"""
+import math
+
+import numpy as np
+
+from . import money
+from .models import EXPENSE_CATEGORIES, ExpenseStats
+
+MIN_SAMPLES = 10
+Z_THRESHOLD = 3.0
+FENCE = 3.0
+# Sketch buckets are powers of GAMMA, so quantiles are within ~5% of the true amount
+GAMMA = 1.1
+_LOG_GAMMA = math.log(GAMMA)
+
+
+def bucket(amount):
+    return int(math.floor(math.log(amount) / _LOG_GAMMA)) if amount >= 1 else -1
+
+
+def bucket_value(index):
+    """Representative amount of a sketch bucket (its geometric midpoint)."""
+    return GAMMA ** (index + 0.5) if index >= 0 else 0.5
+
+
+def quantile(stats, q):
+    """Approximate ``q`` quantile of the amounts summarised by ``stats``, or None if empty."""
+    if not stats.count:
+        return None
+    rank = q * (stats.count - 1)
+    seen = 0
+    for index in sorted(int(key) for key in stats.sketch):
+        seen += stats.sketch[str(index)]
+        if seen > rank:
+            return bucket_value(index)
+    return bucket_value(max(int(key) for key in stats.sketch))
+
+
+def std(stats):
+    return math.sqrt(stats.m2 / (stats.count - 1)) if stats.count > 1 else 0.0
+
+
+class Verdict:
+    def __init__(self, amount, category, outlier=False, low=None, high=None, zscore=None):
+        self.amount = amount
+        self.category = category
+        self.outlier = outlier
+        self.low = low
+        self.high = high
+        self.zscore = zscore
+
+    def __bool__(self):
+        return self.outlier
+
+    @property
+    def message(self):
+        return (
+            f"₹{self.amount:,.0f} is unusually high for {self.category}: "
+            f"your usual amounts are ₹{self.low:,.0f}–₹{self.high:,.0f}."
+        )
+
+
+def check(user, category, amount):
+    """Judge ``amount`` against the user's earlier expenses in ``category``."""
+    amount = float(amount)  # the statistics are floats; amounts are exact Decimals
+    stats = ExpenseStats.objects.filter(user=user, category=category).first()
+    if stats is None or stats.count < MIN_SAMPLES:
+        return Verdict(amount, category)
+
+    q1, q3 = quantile(stats, 0.25), quantile(stats, 0.75)
+    fence = q3 + FENCE * (q3 - q1)
+    deviation = std(stats)
+    zscore = (amount - stats.mean) / deviation if deviation else math.inf
+    outlier = amount > fence and zscore > Z_THRESHOLD
+    return Verdict(amount, category, outlier, quantile(stats, 0.05), quantile(stats, 0.95), zscore)
+
+
+def _locked_stats(user, category):
+    """
+    The user's stats row for ``category``, locked for update, or None after
+    building it from the raw table (for users whose expenses predate it).
+    """
+    stats = ExpenseStats.objects.select_for_update().filter(user=user, category=category).first()
+    if stats is None:
+        rebuild(user)
+    return stats
+
+
+def record(user, category, amount):
+    """Add a newly saved expense amount to the user's running statistics."""
+    amount = float(amount)
+    stats = _locked_stats(user, category)
+    if stats is None:
+        return
+    stats.count += 1
+    delta = amount - stats.mean
+    stats.mean += delta / stats.count
+    stats.m2 += delta * (amount - stats.mean)
+    key = str(bucket(amount))
+    stats.sketch[key] = stats.sketch.get(key, 0) + 1
+    stats.save(update_fields=["count", "mean", "m2", "sketch"])
+
+
+def remove(user, category, amount):
+    """Take a deleted expense amount back out of the running statistics."""
+    amount = float(amount)
+    stats = _locked_stats(user, category)
+    if stats is None:
+        return
+    if stats.count <= 1:
+        stats.count, stats.mean, stats.m2, stats.sketch = 0, 0.0, 0.0, {}
+    else:
+        mean = (stats.count * stats.mean - amount) / (stats.count - 1)
+        stats.m2 = max(stats.m2 - (amount - stats.mean) * (amount - mean), 0.0)
+        stats.mean = mean
+        stats.count -= 1
+        key = str(bucket(amount))
+        if stats.sketch.get(key, 0) > 1:
+            stats.sketch[key] -= 1
+        else:
+            stats.sketch.pop(key, None)
+    stats.save(update_fields=["count", "mean", "m2", "sketch"])
+
+
+def record_bulk(user, category, amounts):
+    """Add a batch of saved amounts, merging their statistics in one update (Chan et al.)."""
+    if not amounts:
+        return
+    stats = _locked_stats(user, category)
+    if stats is None:
+        return
+    batch = np.asarray(amounts, dtype=np.float64)
+    count, mean = len(batch), float(batch.mean())
+    m2 = float(((batch - mean) ** 2).sum())
+    total = stats.count + count
+    delta = mean - stats.mean
+    stats.m2 += m2 + delta * delta * stats.count * count / total
+    stats.mean += delta * count / total
+    stats.count = total
+    for amount in batch:
+        key = str(bucket(amount))
+        stats.sketch[key] = stats.sketch.get(key, 0) + 1
+    stats.save(update_fields=["count", "mean", "m2", "sketch"])
+
+
+def _per_user(rows):
+    """
+    (user_id, count, mean, m2, sketch) for each user in ``rows`` of
+    (user_id, paise) ordered by user, folding in one amount at a time as
+    record() does, so only the current user's state is held.
+    """
+    current = None
+    for user_id, paise in rows:
+        if user_id != current:
+            if current is not None:
+                yield current, count, mean, m2, sketch
+            current, count, mean, m2, sketch = user_id, 0, 0.0, 0.0, {}
+        amount = paise / 100
+        count += 1
+        delta = amount - mean
+        mean += delta / count
+        m2 += delta * (amount - mean)
+        key = str(bucket(amount))
+        sketch[key] = sketch.get(key, 0) + 1
+    if current is not None:
+        yield current, count, mean, m2, sketch
+
+
+def rebuild(user=None, batch_size=5000):
+    """
+    Recompute the statistics from the expense tables for one user (or
+    everyone), replacing what was stored. Returns the number of rows written.
+    """
+    written = 0
+    for category, (model, _) in EXPENSE_CATEGORIES.items():
+        existing = ExpenseStats.objects.filter(category=category)
+        rows = model.objects.all()
+        if user is not None:
+            existing = existing.filter(user=user)
+            rows = rows.filter(user=user)
+        existing.delete()
+
+        rows = rows.order_by("user_id").values_list("user_id", money.paise("amount")).iterator(chunk_size=batch_size)
+        pending, found = [], False
+        for user_id, count, mean, m2, sketch in _per_user(rows):
+            pending.append(ExpenseStats(user_id=user_id, category=category, count=count, mean=mean, m2=m2, sketch=sketch))
+            found = True
+            if len(pending) >= batch_size:
+                ExpenseStats.objects.bulk_create(pending)
+                written += len(pending)
+                pending = []
+        if user is not None and not found:
+            pending.append(ExpenseStats(user=user, category=category, count=0, mean=0.0, m2=0.0, sketch={}))
+        ExpenseStats.objects.bulk_create(pending)
+        written += len(pending)
+    return written
@@ -0,0 +1,204 @@
+"""
+JSON API for the mobile client, which records expenses offline and syncs them.
+
+    POST   api/expenses                      submit a batch of expenses
+    GET    api/expenses?month=&year=&page_size=&after=
+    DELETE api/expenses/<category>/<id>      category: mandatory, basic_needs or sudden_expenses
+
+It uses the site's session (sign in through the login page); POST and DELETE
+need the CSRF token in an X-CSRFToken header, like any other Django post.
+Without a signed-in account every endpoint answers 401.
+
+A batch is {"expenses": [{"category", "description", "amount", "receipt"}, ...]}
+with "receipt" optional. To attach receipts, send multipart/form-data
+instead: the list in the "expenses" field and each receipt as a file part,
+named by its item's "receipt". The whole batch is allocated by
+allocation.add_expenses(), in one transaction with one summary write, and
+the response has one result per item, in order: "created" with the expense,
+or "rejected" with the reason.
+
+Listing returns the same pages as views.month_history(), newest first, with
+"next" to pass as ?after= for the following page (null on the last one).
+"""
+import json
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.timezone import now
+
+from . import allocation, anomalies, archive, classifier, fingerprints, money, views
+from .models import EXPENSE_CATEGORIES
+from .utils import month_bounds
+
+MAX_BATCH_SIZE = 500
+FIELD_CATEGORIES = {field: category for category, (_, field) in EXPENSE_CATEGORIES.items()}
+
+
+def _error(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+def account_api(view):
+    """Like @account_required, but 401 JSON instead of the login page."""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if request.account is None:
+            return _error("Not signed in", status=401)
+        return view(request, *args, **kwargs)
+    return inner
+
+
+def _receipt_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _expense_json(category, expense_id, timestamp, description, amount, image, thumbnail):
+    _, field = EXPENSE_CATEGORIES[category]
+    return {
+        "id": expense_id,
+        "category": category,
+        "description": description,
+        "amount": float(amount),
+        "timestamp": timestamp.isoformat(),
+        "receipt": _receipt_url(image),
+        "thumbnail": _receipt_url(thumbnail or image),
+        "url": reverse("api_expense", args=[field, expense_id]),
+    }
+
+
+def _parse_item(request, item):
+    """(category, description, amount, image) for one batch item; raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError("each expense must be an object")
+    category = item.get("category")
+    if category not in EXPENSE_CATEGORIES:
+        raise ValueError("Invalid category!")
+    description = str(item.get("description") or "").strip()
+    if not description:
+        raise ValueError("description is required")
+    amount = money.rupees(item.get("amount"))
+    if amount <= 0:
+        raise ValueError("amount must be positive")
+    image = None
+    if item.get("receipt"):
+        image = request.FILES.get(str(item["receipt"]))
+        if image is None:
+            raise ValueError(f"no file part named {item['receipt']!r}")
+    return category, description[:255], amount, image
+
+
+def _submit(request):
+    try:
+        if request.content_type == "application/json":
+            batch = json.loads(request.body).get("expenses")
+        else:
+            batch = json.loads(request.POST.get("expenses", ""))
+    except (AttributeError, ValueError):
+        return _error("Send {\"expenses\": [...]} as JSON, or the list in an \"expenses\" form field")
+    if not isinstance(batch, list) or not batch:
+        return _error("expenses must be a non-empty list")
+    if len(batch) > MAX_BATCH_SIZE:
+        return _error(f"At most {MAX_BATCH_SIZE} expenses per batch", status=413)
+
+    user = request.account
+    results = [None] * len(batch)
+    items, positions, warnings = [], [], []
+    for index, item in enumerate(batch):
+        try:
+            category, description, amount, image = _parse_item(request, item)
+        except ValueError as exc:
+            results[index] = {"index": index, "status": "rejected", "error": str(exc)}
+            continue
+        # Checked against the history before the batch, as the form does for one expense
+        notes = []
+        verdict = anomalies.check(user, category, amount)
+        if verdict:
+            notes.append(verdict.message)
+        fingerprint = fingerprints.fingerprint(image) if image else None
+        for match in (fingerprints.find_similar(user, fingerprint) if fingerprint else [])[:1]:
+            warning = fingerprints.describe(match)
+            if warning:
+                notes.append(warning)
+        items.append((category, description, amount, image, fingerprint))
+        positions.append(index)
+        warnings.append(notes)
+
+    try:
+        saved = allocation.add_expenses(user, items) if items else []
+    except allocation.NoBudget as exc:
+        return _error(str(exc), status=409)
+    except allocation.AllocationError as exc:
+        return _error(str(exc), status=503)
+
+    for index, notes, (category, description, *_), outcome in zip(positions, warnings, items, saved):
+        if isinstance(outcome, allocation.AllocationError):
+            results[index] = {"index": index, "status": "rejected", "error": str(outcome)}
+            continue
+        classifier.learn(description, category)
+        results[index] = {
+            "index": index,
+            "status": "created",
+            "expense": _expense_json(
+                category, outcome.pk, outcome.timestamp, outcome.expense, outcome.amount,
+                outcome.image.name, outcome.thumbnail.name,
+            ),
+            "warnings": notes,
+        }
+    created = sum(result["status"] == "created" for result in results)
+    return JsonResponse({"created": created, "rejected": len(results) - created, "results": results})
+
+
+def _list(request):
+    today = now()
+    try:
+        month = int(request.GET.get("month", today.month))
+        year = int(request.GET.get("year", today.year))
+        start, end = month_bounds(year, month)
+    except ValueError:
+        return _error("Invalid month or year")
+    page_size = views._history_page_size(request)
+    cursor = views._parse_history_cursor(request.GET.get("after"))
+
+    user_id = request.account.user_id
+    page = list(views._history_rows(user_id, start, end, cursor, page_size))
+    if not page:  # nothing left in the expense tables: maybe an archived month
+        page = archive.history_page(user_id, year, month, cursor, page_size)
+    rows, next_cursor = views._split_history_page(page, page_size)
+    return JsonResponse({
+        "month": month,
+        "year": year,
+        "expenses": [
+            _expense_json(
+                row["category"], row["id"], row["timestamp"], row["expense"], row["amount"],
+                row["image"], row["thumbnail"],
+            )
+            for row in rows
+        ],
+        "next": next_cursor,
+    })
+
+
+@account_api
+def expenses(request):
+    """GET lists a month's expenses, POST submits a batch."""
+    if request.method == "POST":
+        return _submit(request)
+    if request.method == "GET":
+        return _list(request)
+    return HttpResponse(status=405, headers={"Allow": "GET, POST"})
+
+
+@account_api
+def expense(request, category, expense_id):
+    """DELETE removes one expense, as views.delete_expense() does."""
+    if request.method != "DELETE":
+        return HttpResponse(status=405, headers={"Allow": "DELETE"})
+    category = FIELD_CATEGORIES.get(category)
+    model, _ = EXPENSE_CATEGORIES.get(category, (None, None))
+    found = model.objects.filter(id=expense_id, user=request.account).first() if model else None
+    if found is None:
+        return _error("No such expense", status=404)
+    allocation.remove_expense(request.account, category, found)
+    return HttpResponse(status=204)
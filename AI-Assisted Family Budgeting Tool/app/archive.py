@@ -0,0 +1,189 @@
+"""
+Month close: moves old expenses out of the hot expense tables.
+
+Expenses from before the archive horizon (settings.ARCHIVE_AFTER_MONTHS
+months, counting the current one) are packed into one ExpenseArchive row per
+user and year. The row holds the year's expenses as zlib-compressed JSON
+columns, plus per-month totals and counts, so reports never have to unpack
+it. Amounts are whole paise in there, as in the database columns.
+MonthlySpendRollup rows, budgets and summaries stay where they are. The
+expense tables, and every index the views read, then only cover the active
+window however long a family's history gets.
+
+Readers go through the helpers below: month_history() falls back to
+history_page() for a month with no hot rows, analytics adds month_totals(),
+and the rollup checks count raw_monthly() as raw data.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import money, sharding
+from .models import EXPENSE_CATEGORIES, ExpenseArchive, UserAccount
+from .utils import month_bounds, shift_month
+
+ARCHIVE_AFTER_MONTHS = 12
+DELETE_BATCH_SIZE = 500
+COLUMNS = ("id", "kind", "timestamp", "expense", "amount", "image", "thumbnail", "display_image")
+CATEGORIES = list(EXPENSE_CATEGORIES)  # kind -> category, numbered as in views._history_rows()
+FIELDS = [field for _, field in EXPENSE_CATEGORIES.values()]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def cutoff(today=None, months=None):
+    """Start of the oldest month kept in the hot tables."""
+    today = today or timezone.localdate()
+    months = months or getattr(settings, "ARCHIVE_AFTER_MONTHS", ARCHIVE_AFTER_MONTHS)
+    return month_bounds(*shift_month(today.year, today.month, -(months - 1)))[0]
+
+
+def _encode(rows):
+    columns = {name: [row[name] for row in rows] for name in COLUMNS}
+    columns["timestamp"] = [(timestamp - _EPOCH) // _MICROSECOND for timestamp in columns["timestamp"]]
+    columns["amount"] = [money.to_paise(amount) for amount in columns["amount"]]
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 9)
+
+
+def _decode(data):
+    columns = json.loads(zlib.decompress(bytes(data)))
+    rows = [dict(zip(COLUMNS, values)) for values in zip(*(columns[name] for name in COLUMNS))]
+    for row in rows:
+        row["timestamp"] = _EPOCH + row["timestamp"] * _MICROSECOND
+        row["amount"] = money.from_paise(row["amount"])
+        row["category"] = CATEGORIES[row["kind"]]
+    return rows
+
+
+def _month_totals(rows):
+    """{"<month>": {field: total in paise, ..., "count": n}} for the rows of one year."""
+    months = {}
+    for row in rows:
+        month = months.setdefault(str(timezone.localtime(row["timestamp"]).month), {**dict.fromkeys(FIELDS, 0), "count": 0})
+        month[FIELDS[row["kind"]]] += money.to_paise(row["amount"])
+        month["count"] += 1
+    return months
+
+
+@sharding.atomic
+def archive_user(user, before):
+    """Move the user's expenses from before ``before`` into their archive rows. Returns how many moved."""
+    by_year = {}
+    moved = 0
+    for kind, (model, _) in enumerate(EXPENSE_CATEGORIES.values()):
+        rows = list(model.objects.filter(user=user, timestamp__lt=before).values(*(name for name in COLUMNS if name != "kind")))
+        for row in rows:
+            row["kind"] = kind
+            by_year.setdefault(timezone.localtime(row["timestamp"]).year, []).append(row)
+        ids = [row["id"] for row in rows]
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            # By id, so nothing written since the read is lost; the signals drop
+            # the receipt fingerprints and cached dashboards
+            model.objects.filter(pk__in=ids[start:start + DELETE_BATCH_SIZE]).delete()
+        moved += len(rows)
+
+    existing = {archive.year: archive for archive in ExpenseArchive.objects.filter(user=user, year__in=by_year)}
+    for year, rows in by_year.items():
+        archive = existing.get(year) or ExpenseArchive(user=user, year=year)
+        if archive.data:
+            rows = _decode(archive.data) + rows
+        rows.sort(key=lambda row: (row["timestamp"], row["id"], row["kind"]))
+        archive.months = _month_totals(rows)
+        archive.rows = len(rows)
+        archive.data = _encode(rows)
+        archive.save()
+    return moved
+
+
+def close_months(months=None, today=None, users=None):
+    """
+    Archive the expenses from before the horizon of every family on the
+    active shard (or of ``users``). Returns (families, expenses) archived.
+    """
+    before = cutoff(today, months)
+    if users is None:
+        user_ids = set()
+        for model, _ in EXPENSE_CATEGORIES.values():
+            user_ids.update(model.objects.filter(timestamp__lt=before).values_list("user_id", flat=True).distinct())
+        users = UserAccount.objects.filter(user_id__in=user_ids).order_by("user_id")
+    families = expenses = 0
+    for user in users:
+        moved = archive_user(user, before)
+        if moved:
+            families += 1
+            expenses += moved
+    return families, expenses
+
+
+def archived_months(user):
+    """{(year, month)} of the user's archived months."""
+    return {
+        (year, int(month))
+        for year, months in ExpenseArchive.objects.filter(user=user).values_list("year", "months")
+        for month in months
+    }
+
+
+def raw_monthly(user):
+    """{(year, month): {field: total}} of the user's archived expenses."""
+    return {
+        (year, int(month)): {field: money.from_paise(totals[field]) for field in FIELDS}
+        for year, months in ExpenseArchive.objects.filter(user=user).values_list("year", "months")
+        for month, totals in months.items()
+    }
+
+
+def month_totals(user_id, first, last):
+    """{(year, month): {field: total, ..., "count": n}} of archived months between two (year, month) pairs."""
+    archived = ExpenseArchive.objects.filter(user_id=user_id, year__gte=first[0], year__lte=last[0])
+    return {
+        (year, int(month)): {**{field: money.from_paise(totals[field]) for field in FIELDS}, "count": totals["count"]}
+        for year, months in archived.values_list("year", "months")
+        for month, totals in months.items()
+        if first <= (year, int(month)) <= last
+    }
+
+
+def receipt_names(user):
+    """Every receipt file name (original or copy) referred to by the user's archived expenses."""
+    return {
+        row[field]
+        for data in ExpenseArchive.objects.filter(user=user).values_list("data", flat=True)
+        for row in _decode(data)
+        for field in ("image", "thumbnail", "display_image")
+        if row[field]
+    }
+
+
+def history_page(user_id, year, month, cursor, page_size):
+    """
+    The same rows as views._history_rows() for an archived month: newest
+    first, after ``cursor``, one more than ``page_size``. [] if not archived.
+    Each row has ``archived`` set: its id may belong to a live expense by now,
+    so it must not be offered for deletion.
+    """
+    today = timezone.localdate()
+    if (year, month) >= (today.year, today.month):  # never archived, so no query
+        return []
+    archive = ExpenseArchive.objects.filter(user_id=user_id, year=year).first()
+    if archive is None or str(month) not in archive.months:
+        return []
+    start, end = month_bounds(year, month)
+    rows = [{**row, "archived": True} for row in _decode(archive.data) if start <= row["timestamp"] < end]
+    rows.sort(key=lambda row: (row["timestamp"], row["id"], row["kind"]), reverse=True)
+    if cursor:
+        rows = [row for row in rows if (row["timestamp"], row["id"], row["kind"]) < cursor]
+    return rows[:page_size + 1]
+
+
+def export_rows(archives, since=None, until=None):
+    """(category, id, username, timestamp, expense, amount, image) for archived rows, as in app.exporter."""
+    for username, data in archives.values_list("user__username", "data").iterator(chunk_size=100):
+        for row in _decode(data):
+            day = timezone.localtime(row["timestamp"]).date()
+            if (since is None or day >= since) and (until is None or day <= until):
+                yield row["category"], row["id"], username, row["timestamp"], row["expense"], row["amount"], row["image"]
@@ -0,0 +1,106 @@
+"""
+Async versions of the dashboard, budget and history pages, routed in place of
+the views in app.views when the project runs under family/asgi.py
+(settings.ASYNC_VIEWS).
+
+The lookups each page needs do not depend on one another, so they are issued
+together with asyncio.gather on the async ORM. The account itself comes from
+CurrentAccountMiddleware. Form posts go to the existing
+synchronous views, whose transactions and retry loops are unchanged.
+"""
+import asyncio
+import calendar
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+from django.utils.timezone import now
+
+from . import archive, caching, rollups, views
+from .middleware import account_required
+from .models import BudgetDetails, UserSpendTotals
+from .utils import month_bounds
+
+
+@account_required
+async def first(request):
+    if request.method == "POST":
+        return await sync_to_async(views.first)(request)
+
+    user = request.account  # set by CurrentAccountMiddleware
+    month, year = now().month, now().year
+    latest_budget, totals = await asyncio.gather(
+        BudgetDetails.objects.filter(user=user, month=month, year=year).alast(),
+        UserSpendTotals.objects.filter(user=user).afirst(),
+    )
+    if totals is None:
+        totals = await sync_to_async(rollups.get_totals)(user)  # builds the rollups on first use
+
+    remaining_salary = 0
+    if latest_budget:
+        total_expenses = totals.mandatory + totals.basic_needs + totals.sudden_expenses
+        remaining_salary = latest_budget.active_salary - total_expenses
+
+    return render(request, "first.html", {
+        "user": user,
+        "total_savings": totals.savings,
+        "remaining_salary": remaining_salary,
+        "latest_budget": latest_budget,
+    })
+
+
+@account_required
+async def home(request):
+    if request.method == "POST":
+        return await sync_to_async(views.home)(request)
+
+    dashboard, hit = await caching.aget_dashboard(request.account.user_id, now().month, now().year)
+
+    response = render(request, "home.html", dashboard)
+    response["X-Dashboard-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+async def _history_page(user_id, year, month, cursor, page_size):
+    start, end = month_bounds(year, month)
+    rows = views._history_rows(user_id, start, end, cursor, page_size)
+    page = [row async for row in rows]
+    if not page:
+        page = await sync_to_async(archive.history_page)(user_id, year, month, cursor, page_size)
+    return page
+
+
+@account_required
+async def month_history(request):
+    user = request.account
+    today = datetime.now()
+    month = int(request.GET.get("month", today.month))
+    year = int(request.GET.get("year", today.year))
+    page_size = views._history_page_size(request)
+    cursor = views._parse_history_cursor(request.GET.get("after"))
+    start_number = views._history_start_number(request, cursor)
+
+    expenses = []
+    next_cursor = None
+    error_message = ""
+
+    try:
+        page = await _history_page(user.user_id, year, month, cursor, page_size)
+        expenses, next_cursor = views._split_history_page(page, page_size)
+    except ValueError:
+        error_message = "Invalid month or year selected."
+
+    return render(request, "month_history.html", {
+        "user": user,
+        "expenses": expenses,
+        "selected_month": month,
+        "selected_month_name": calendar.month_name[month],
+        "selected_year": year,
+        "months_list": list(enumerate(calendar.month_name))[1:],
+        "error_message": error_message,
+        "page_size": page_size,
+        "page_sizes": views.HISTORY_PAGE_SIZES,
+        "start_number": start_number,
+        "next_cursor": next_cursor,
+        "next_start_number": start_number + len(expenses),
+    })
@@ -0,0 +1,173 @@
+"""
+Read-through cache for the figures shown on the home() dashboard.
+
+The dashboard only changes when an expense is added or deleted or the budget
+is saved, so it is cached per user and month on Django's cache framework
+(settings.DASHBOARD_CACHE picks the backend alias) and dropped again by those
+write paths, or by model signals for edits made elsewhere, e.g. in the admin.
+
+The signed-in UserAccount is cached the same way, for a few minutes, so the
+middleware can attach it to every request without a query.
+"""
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.timezone import now
+
+from . import rollups, sharding
+from .models import BudgetDetails, BudgetSummary, SpendForecast, UserAccount, UserSpendTotals
+
+DASHBOARD_TIMEOUT = 60 * 60
+ACCOUNT_TIMEOUT = 5 * 60
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _cache():
+    return caches[getattr(settings, "DASHBOARD_CACHE", "default")]
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def stats():
+    """Hit/miss counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def account_key(user_id):
+    return f"account:{user_id}"
+
+
+def get_account(user_id):
+    """The UserAccount with this id (None if it no longer exists), cached for ACCOUNT_TIMEOUT."""
+    key = account_key(user_id)
+    account = _cache().get(key)
+    if account is None:
+        account = UserAccount.objects.filter(user_id=user_id).first()
+        if account is not None:
+            _cache().set(key, account, ACCOUNT_TIMEOUT)
+    return account
+
+
+def invalidate_account(user_id):
+    sharding.on_commit(lambda: _cache().delete(account_key(user_id)))
+
+
+def dashboard_key(user_id, month, year):
+    return f"dashboard:{user_id}:{year}:{month}"
+
+
+def forecast_rows(forecast, budget_details, budget_summary):
+    """Per-category (label, spent, projected, limit) for the dashboard, or [] without a forecast."""
+    if not forecast or not budget_details or not budget_summary:
+        return []
+    return [
+        (label, getattr(budget_summary, field), getattr(forecast, field), getattr(budget_details, f"{field}_limit"))
+        for label, field in (("Mandatory", "mandatory"), ("Basic Needs", "basic_needs"), ("Sudden Expense", "sudden_expenses"))
+    ]
+
+
+def load_dashboard(user_id, month, year):
+    """Everything home() renders, straight from the database."""
+    user = get_account(user_id)
+    budget_details = BudgetDetails.objects.filter(user=user, month=month, year=year).first()
+    budget_summary = BudgetSummary.objects.filter(user=user, month=month, year=year).first()
+    forecast = SpendForecast.objects.filter(user=user, month=month, year=year).first()
+
+    remaining_salary = 0  # No budget data available
+    if budget_details and budget_summary:
+        spent_amount = budget_summary.mandatory + budget_summary.basic_needs + budget_summary.sudden_expenses
+        remaining_salary = budget_details.active_salary - spent_amount
+
+    return {
+        "user": user,
+        "total_savings": rollups.get_totals(user).savings,
+        "remaining_salary": remaining_salary,
+        "budget_details": budget_details,
+        "budget_summary": budget_summary,
+        "forecast": forecast_rows(forecast, budget_details, budget_summary),
+    }
+
+
+async def aload_dashboard(user_id, month, year):
+    """load_dashboard() for async views, with the independent lookups run concurrently."""
+    user, budget_details, budget_summary, totals, forecast = await asyncio.gather(
+        sync_to_async(get_account)(user_id),
+        BudgetDetails.objects.filter(user_id=user_id, month=month, year=year).afirst(),
+        BudgetSummary.objects.filter(user_id=user_id, month=month, year=year).afirst(),
+        UserSpendTotals.objects.filter(user_id=user_id).afirst(),
+        SpendForecast.objects.filter(user_id=user_id, month=month, year=year).afirst(),
+    )
+    if totals is None:
+        totals = await sync_to_async(rollups.get_totals)(user)
+
+    remaining_salary = 0  # No budget data available
+    if budget_details and budget_summary:
+        spent_amount = budget_summary.mandatory + budget_summary.basic_needs + budget_summary.sudden_expenses
+        remaining_salary = budget_details.active_salary - spent_amount
+
+    return {
+        "user": user,
+        "total_savings": totals.savings,
+        "remaining_salary": remaining_salary,
+        "budget_details": budget_details,
+        "budget_summary": budget_summary,
+        "forecast": forecast_rows(forecast, budget_details, budget_summary),
+    }
+
+
+def get_dashboard(user_id, month, year):
+    """
+    Return ``(dashboard, hit)`` for the user's month, loading and caching it
+    on a miss.
+    """
+    key = dashboard_key(user_id, month, year)
+    dashboard = _cache().get(key)
+    if dashboard is not None:
+        _count("hits")
+        return dashboard, True
+
+    _count("misses")
+    dashboard = load_dashboard(user_id, month, year)
+    _cache().set(key, dashboard, DASHBOARD_TIMEOUT)
+    return dashboard, False
+
+
+async def aget_dashboard(user_id, month, year):
+    """get_dashboard() for async views."""
+    key = dashboard_key(user_id, month, year)
+    dashboard = await _cache().aget(key)
+    if dashboard is not None:
+        _count("hits")
+        return dashboard, True
+
+    _count("misses")
+    dashboard = await aload_dashboard(user_id, month, year)
+    await _cache().aset(key, dashboard, DASHBOARD_TIMEOUT)
+    return dashboard, False
+
+
+def invalidate_dashboard(user_id, month=None, year=None):
+    """
+    Drop the cached dashboard for a user once the current transaction commits.
+    Lifetime savings appear on every month, so the current month is always dropped too.
+    """
+    keys = {dashboard_key(user_id, now().month, now().year)}
+    if month is not None and year is not None:
+        keys.add(dashboard_key(user_id, month, year))
+    sharding.on_commit(lambda: _cache().delete_many(list(keys)))
+
+
+def invalidate_dashboards(user_ids, month, year):
+    """Drop the month's cached dashboard for many users at once, for batch jobs."""
+    keys = [dashboard_key(int(user_id), month, year) for user_id in user_ids]
+    for start in range(0, len(keys), 1000):
+        _cache().delete_many(keys[start:start + 1000])
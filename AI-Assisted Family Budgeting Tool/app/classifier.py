@@ -0,0 +1,195 @@
+"""
+Offline category suggestions for expense descriptions.
+
+A description is turned into hashed character 2-4-grams plus whole words,
+and a multinomial logistic regression over those features picks the
+category. It is trained with plain SGD, so it can keep learning one labelled
+expense at a time:
+
+* the train_classifier command fits it on the labelled expenses in the three
+  tables (or only those added since the last run) and saves it to
+  settings.CLASSIFIER_PATH;
+* each process loads that file lazily on first use, and again only when it
+  changes on disk;
+* expenses saved through home() are learned in-process straight away.
+"""
+import os
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from . import sharding
+from .models import EXPENSE_CATEGORIES
+
+N_FEATURES = 2 ** 18
+NGRAM_SIZES = (2, 3, 4)
+CATEGORIES = tuple(EXPENSE_CATEGORIES)
+LEARNING_RATE = 0.5
+EPOCHS = 5
+RELOAD_SECONDS = 60
+
+
+def features(text):
+    """Sorted unique feature indices of a description."""
+    words = " ".join(text.lower().split())
+    padded = f" {words} "
+    grams = {padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)}
+    grams.update(f"w:{word}" for word in words.split())
+    indices = [zlib.crc32(gram.encode()) & (N_FEATURES - 1) for gram in grams]
+    return np.unique(np.array(indices, dtype=np.int64))
+
+
+class Model:
+    def __init__(self, weights=None, bias=None, watermarks=None, samples=0):
+        self.weights = np.zeros((len(CATEGORIES), N_FEATURES), dtype=np.float32) if weights is None else weights
+        self.bias = np.zeros(len(CATEGORIES), dtype=np.float32) if bias is None else bias
+        # Category -> highest expense id trained on, for incremental training runs
+        self.watermarks = dict.fromkeys(CATEGORIES, 0) if watermarks is None else watermarks
+        self.samples = samples
+        self.lock = threading.Lock()
+
+    def _probabilities(self, indices):
+        scale = 1 / np.sqrt(max(len(indices), 1))
+        logits = self.weights[:, indices].sum(axis=1) * scale + self.bias
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum(), scale
+
+    def predict(self, text):
+        """(category, probability) for ``text``, or (None, 0.0) before any training."""
+        if not self.samples:
+            return None, 0.0
+        probabilities, _ = self._probabilities(features(text))
+        best = int(probabilities.argmax())
+        return CATEGORIES[best], float(probabilities[best])
+
+    def predict_many(self, texts):
+        return [self.predict(text) for text in texts]
+
+    def learn(self, text, category, learning_rate=LEARNING_RATE):
+        """One SGD step on a labelled description."""
+        indices = features(text)
+        with self.lock:
+            probabilities, scale = self._probabilities(indices)
+            gradient = probabilities
+            gradient[CATEGORIES.index(category)] -= 1
+            self.weights[:, indices] -= (learning_rate * scale * gradient)[:, None].astype(np.float32)
+            self.bias -= (learning_rate * 0.1 * gradient).astype(np.float32)
+            self.samples += 1
+
+    def fit(self, examples, epochs=EPOCHS, seed=0):
+        """Train on a list of (description, category), several shuffled passes."""
+        rng = random.Random(seed)
+        examples = list(examples)
+        for epoch in range(epochs):
+            rng.shuffle(examples)
+            learning_rate = LEARNING_RATE / (1 + epoch)
+            for text, category in examples:
+                self.learn(text, category, learning_rate)
+
+    def save(self, path):
+        temporary = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temporary,
+            weights=self.weights,
+            bias=self.bias,
+            watermarks=np.array([self.watermarks[category] for category in CATEGORIES]),
+            samples=np.array(self.samples),
+        )
+        os.replace(temporary, path)  # readers never see a half-written file
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                weights=data["weights"],
+                bias=data["bias"],
+                watermarks=dict(zip(CATEGORIES, data["watermarks"].tolist())),
+                samples=int(data["samples"]),
+            )
+
+
+_model = None
+_model_mtime = None
+_checked_at = 0.0
+_load_lock = threading.Lock()
+
+
+def _path():
+    return str(getattr(settings, "CLASSIFIER_PATH", settings.BASE_DIR / "classifier.npz"))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_model():
+    """
+    The process-wide model, loaded on first use and reloaded when the file on
+    disk changes (checked at most every RELOAD_SECONDS). An untrained model
+    is used until a file exists.
+    """
+    global _model, _model_mtime, _checked_at
+    if _model is not None and time.monotonic() - _checked_at < RELOAD_SECONDS:
+        return _model
+    with _load_lock:
+        path = _path()
+        mtime = _mtime(path)
+        if _model is None or mtime != _model_mtime:
+            _model = Model.load(path) if mtime is not None else Model()
+            _model_mtime = mtime
+        _checked_at = time.monotonic()
+        return _model
+
+
+def reset():
+    """Forget the loaded model, so the next call loads it again."""
+    global _model, _model_mtime, _checked_at
+    with _load_lock:
+        _model, _model_mtime, _checked_at = None, None, 0.0
+
+
+def suggest(text):
+    return get_model().predict(text)
+
+
+def suggest_many(texts):
+    return get_model().predict_many(texts)
+
+
+def learn(text, category):
+    """Learn from an expense the user has just filed under ``category``."""
+    if text and category in CATEGORIES:
+        get_model().learn(text, category)
+
+
+def train(incremental=False, epochs=EPOCHS, batch_size=5000):
+    """
+    Fit the model on the labelled expenses in the three tables and save it.
+    With ``incremental`` only expenses added since the saved model was
+    trained are used, on top of it. Returns (model, number of expenses used).
+    """
+    if incremental and sharding.enabled():
+        raise ValueError("Incremental training needs a single database: expense ids are per shard")
+    path = _path()
+    model = Model.load(path) if incremental and _mtime(path) is not None else Model()
+
+    examples = []
+    since = dict(model.watermarks)  # the same for every shard, whose ids overlap
+    for _ in sharding.each():
+        for category, (model_class, _) in EXPENSE_CATEGORIES.items():
+            rows = model_class.objects.filter(id__gt=since[category]).order_by("id")
+            for expense_id, description in rows.values_list("id", "expense").iterator(chunk_size=batch_size):
+                examples.append((description, category))
+                model.watermarks[category] = max(model.watermarks[category], expense_id)
+
+    model.fit(examples, epochs=epochs if not incremental else 1)
+    model.save(path)
+    reset()
+    return model, len(examples)
@@ -0,0 +1,124 @@
+"""
+Receipt fingerprints for spotting double entries.
+
+Each receipt gets a SHA-256 (identical file) and a 64-bit difference hash
+(dHash, same picture re-saved, re-compressed or re-screenshotted). Similar
+receipts are looked up through the indexed 16-bit bands on
+ReceiptFingerprint rather than by comparing against every stored image.
+"""
+from django.db.models import Case, IntegerField, Q, Value, When
+from PIL import Image, ImageOps
+
+from .models import EXPENSE_CATEGORIES, ReceiptFingerprint
+from .storage import content_hash
+
+# Hashes at most this many bits apart are reported as the same receipt. Only
+# distances up to 3 are guaranteed to share a band; 4-6 are found when they do.
+NEAR_DUPLICATE_DISTANCE = 6
+BANDS = 4
+BAND_BITS = 16
+# Band matches scored per lookup, most shared bands first
+MAX_BAND_CANDIDATES = 200
+
+
+class Fingerprint:
+    def __init__(self, sha256, phash):
+        self.sha256 = sha256
+        self.phash = phash  # unsigned 64-bit
+
+    @property
+    def bands(self):
+        mask = (1 << BAND_BITS) - 1
+        return [(self.phash >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+    @property
+    def signed_phash(self):
+        """The hash as stored in a signed BigIntegerField."""
+        return self.phash - (1 << 64) if self.phash >= 1 << 63 else self.phash
+
+
+def dhash(image):
+    """64-bit difference hash: brightness gradient over a 9x8 greyscale thumbnail."""
+    image.draft("L", (64, 64))  # JPEGs decode straight at a tiny size
+    small = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def fingerprint(file):
+    """Fingerprint an uploaded/stored Django File, or None if it is not an image."""
+    sha256 = content_hash(file)
+    try:
+        with Image.open(file) as image:
+            phash = dhash(image)
+    except (OSError, ValueError):
+        return None
+    finally:
+        file.seek(0)
+    return Fingerprint(sha256, phash)
+
+
+def find_similar(user, fp, limit=5):
+    """
+    The user's existing receipts that are the same file or look the same as
+    ``fp``, closest first, as (ReceiptFingerprint, distance) pairs.
+    """
+    # Identical files first, from the (user, sha256) index, so a user with
+    # many look-alike receipts can never push them out of the band candidates
+    matches = [(candidate, 0) for candidate in ReceiptFingerprint.objects.filter(user=user, sha256=fp.sha256)[:limit]]
+    if len(matches) == limit:
+        return matches
+
+    # The user goes into every branch so SQLite answers each one from its own
+    # (user, column) index (MULTI-INDEX OR) instead of walking all the user's rows.
+    # Hashes sharing more bands are closer, so those are kept when there are
+    # more candidates than the cap; ties go to the newest receipt.
+    bands = {f"band{i}": band for i, band in enumerate(fp.bands)}
+    condition = Q()
+    shared = Value(0)
+    for column, value in bands.items():
+        condition |= Q(user=user, **{column: value})
+        shared = shared + Case(When(**{column: value}, then=Value(1)), default=Value(0), output_field=IntegerField())
+    candidates = (
+        ReceiptFingerprint.objects.filter(condition).exclude(sha256=fp.sha256)
+        .annotate(shared_bands=shared).order_by("-shared_bands", "-pk")[:MAX_BAND_CANDIDATES]
+    )
+    near = []
+    for candidate in candidates:
+        distance = bin((candidate.phash ^ fp.signed_phash) & ((1 << 64) - 1)).count("1")
+        if distance <= NEAR_DUPLICATE_DISTANCE:
+            near.append((candidate, distance))
+    near.sort(key=lambda match: match[1])
+    return (matches + near)[:limit]
+
+
+def describe(match):
+    """Short description of the expense a matching fingerprint belongs to, for warnings."""
+    record, distance = match
+    model, _ = EXPENSE_CATEGORIES[record.category]
+    expense = model.objects.filter(pk=record.expense_id).first()
+    if expense is None:
+        return None
+    kind = "the same file as" if distance == 0 else "very similar to"
+    return f"This receipt is {kind} the one on \"{expense.expense}\" ({record.category}, ₹{expense.amount}, {expense.timestamp:%d-%m-%Y})."
+
+
+def record(user, category, expense, fp):
+    bands = fp.bands
+    return ReceiptFingerprint.objects.create(
+        user=user,
+        category=category,
+        expense_id=expense.pk,
+        sha256=fp.sha256,
+        phash=fp.signed_phash,
+        band0=bands[0],
+        band1=bands[1],
+        band2=bands[2],
+        band3=bands[3],
+    )
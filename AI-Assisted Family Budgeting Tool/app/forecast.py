@@ -0,0 +1,259 @@
+"""
+Month-end spending forecast per user and category.
+
+Every user's daily spend for the month (from the expense tables) and monthly
+totals for the HISTORY_MONTHS before it (from the rollups) are loaded once
+into NumPy arrays, and the projection is computed for all users at the same
+time:
+
+* day-of-month seasonality: across all users, the share of a month's spend
+  that has usually happened by today, per category, turns what a user has
+  spent so far into a month-end estimate;
+* trend: a least-squares line through each user's previous monthly totals
+  gives a second estimate;
+* the two are blended, trusting the month so far more as it progresses.
+
+The forecast_spending management command runs this in one batch and stores
+the results in SpendForecast, where home() picks them up.
+"""
+import calendar
+import time
+
+import numpy as np
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import money, sharding
+from .models import BudgetDetails, EXPENSE_CATEGORIES, MonthlySpendRollup, SpendForecast
+from .utils import month_bounds, shift_month
+
+HISTORY_MONTHS = 6
+PROFILE_MONTHS = 2
+PROFILE_SAMPLE_SIZE = 100_000  # expenses per category, plenty for a 31-day profile
+MAX_DAYS = 31
+FIELDS = tuple(field for _, field in EXPENSE_CATEGORIES.values())
+LIMIT_FIELDS = tuple(f"{field}_limit" for field in FIELDS)
+SAVE_BATCH_SIZE = 5000
+LOAD_CHUNK_SIZE = 20000
+
+
+class SpendData:
+    """
+    Arrays for one forecast run, indexed by [user, category(, day or month)]:
+
+    user_ids    (U,)          UserAccount ids, sorted
+    daily       (U, C, 31)    spend on each day of the target month
+    history     (U, C, H)     monthly totals of the H previous months, oldest first
+    profile     (C, 31)       spend by day of month over the last PROFILE_MONTHS, all users
+    """
+
+    def __init__(self, user_ids, daily, history, profile):
+        self.user_ids = user_ids
+        self.daily = daily
+        self.history = history
+        self.profile = profile
+
+
+def _expense_columns(first_year, first_month, year, month, with_user=True, sample_size=None):
+    """
+    (category, user, epoch seconds, amount) arrays for the expenses in the
+    months given; with ``sample_size``, roughly that many of them per table.
+    """
+    start, end = month_bounds(first_year, first_month)[0], month_bounds(year, month)[1]
+    fields = ("user_id", "timestamp", money.paise("amount")) if with_user else ("timestamp", money.paise("amount"))
+    categories, users, seconds, amounts = [], [], [], []
+    for category_index, (model, _) in enumerate(EXPENSE_CATEGORIES.values()):
+        rows = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        if sample_size:
+            stride = rows.count() // sample_size
+            if stride > 1:
+                rows = rows.alias(bucket=F("id") % stride).filter(bucket=0)
+        rows = rows.values_list(*fields)
+        count = 0
+        for row in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            if with_user:
+                users.append(row[0])
+            seconds.append(row[-2].timestamp())
+            amounts.append(row[-1])
+            count += 1
+        categories.append(np.full(count, category_index, dtype=np.int64))
+    return (
+        np.concatenate(categories),
+        np.array(users, dtype=np.int64),
+        np.array(seconds, dtype=np.float64),
+        np.array(amounts, dtype=np.float64) / 100,
+    )
+
+
+def _day_of_month(seconds, year, month, months):
+    """Zero-based local day of month for epoch seconds within ``months`` months from year/month."""
+    starts = np.array([month_bounds(*shift_month(year, month, i))[0].timestamp() for i in range(months)])
+    index = np.searchsorted(starts, seconds, side="right") - 1
+    return np.clip(((seconds - starts[index]) // 86400).astype(np.int64), 0, MAX_DAYS - 1)
+
+
+def load(month, year, extra_user_ids=(), history_months=HISTORY_MONTHS, profile_months=PROFILE_MONTHS):
+    """
+    Load the target month's expenses, the previous months' totals (from the
+    rollups) and the day-of-month profile for every user with expenses, a
+    rollup or an id in ``extra_user_ids``.
+    """
+    categories = len(FIELDS)
+
+    category, user, seconds, amount = _expense_columns(year, month, year, month)
+    day = _day_of_month(seconds, year, month, 1)
+
+    first_year, first_month = shift_month(year, month, -history_months)
+    rollups = MonthlySpendRollup.objects.filter(
+        Q(year__gt=first_year) | Q(year=first_year, month__gte=first_month),
+        Q(year__lt=year) | Q(year=year, month__lt=month),
+    ).values_list("user_id", "year", "month", *FIELDS)
+    history_rows = np.array(list(rollups.iterator(chunk_size=LOAD_CHUNK_SIZE)), dtype=np.float64).reshape(-1, 3 + categories)
+
+    user_ids = np.unique(np.concatenate([
+        user, history_rows[:, 0].astype(np.int64), np.asarray(list(extra_user_ids), dtype=np.int64),
+    ]))
+    users = len(user_ids)
+
+    flat = (np.searchsorted(user_ids, user) * categories + category) * MAX_DAYS + day
+    daily = np.bincount(flat, weights=amount, minlength=users * categories * MAX_DAYS)
+
+    history = np.zeros((users, categories, history_months))
+    month_index = (history_rows[:, 1] * 12 + history_rows[:, 2] - 1).astype(np.int64) - (first_year * 12 + first_month - 1)
+    history[np.searchsorted(user_ids, history_rows[:, 0].astype(np.int64)), :, month_index] = history_rows[:, 3:]
+
+    # The pooled profile needs neither per-user rows nor every expense
+    profile_year, profile_month = shift_month(year, month, -profile_months)
+    category, _, seconds, amount = _expense_columns(
+        profile_year, profile_month, *shift_month(year, month, -1), with_user=False, sample_size=PROFILE_SAMPLE_SIZE
+    )
+    day = _day_of_month(seconds, profile_year, profile_month, profile_months)
+    profile = np.bincount(category * MAX_DAYS + day, weights=amount, minlength=categories * MAX_DAYS)
+
+    return SpendData(
+        user_ids,
+        daily.reshape(users, categories, MAX_DAYS),
+        history,
+        profile.reshape(categories, MAX_DAYS),
+    )
+
+
+def share_spent_by(profile, day, days_in_month):
+    """
+    (C,) share of a month's spend that has usually happened by the end of ``day``,
+    from the pooled day-of-month profile (a straight line when there is no history).
+    """
+    totals = profile.sum(axis=1)
+    cumulative = profile.cumsum(axis=1)[:, day - 1]
+    linear = np.full(len(profile), day / days_in_month)
+    share = np.divide(cumulative, totals, out=linear, where=totals > 0)
+    return np.clip(share, 1 / days_in_month, 1.0) if day < days_in_month else np.ones(len(profile))
+
+
+def trend(history):
+    """
+    (U, C) next-month estimate from a least-squares line through each user's
+    monthly totals, and a (U, C) mask of where there was enough history.
+    Months in which a user spent nothing at all are treated as not using the
+    app rather than as zero-spend months.
+    """
+    months = history.shape[2]
+    active = history.sum(axis=1, keepdims=True) > 0  # (U, 1, H)
+    weights = np.broadcast_to(active, history.shape).astype(np.float64)
+    count = weights.sum(axis=2)
+    x = np.arange(months, dtype=np.float64)
+
+    safe_count = np.maximum(count, 1)
+    x_mean = (weights * x).sum(axis=2) / safe_count
+    y_mean = (weights * history).sum(axis=2) / safe_count
+    dx = (x - x_mean[..., None]) * weights
+    var = (dx * dx).sum(axis=2)
+    cov = (dx * (history - y_mean[..., None])).sum(axis=2)
+    slope = np.divide(cov, var, out=np.zeros_like(cov), where=var > 0)
+
+    estimate = np.maximum(y_mean + slope * (months - x_mean), 0)
+    return estimate, count > 0
+
+
+def project(data, day, days_in_month):
+    """(U, C) projected month-end spend, never below what has already been spent."""
+    spent = data.daily[:, :, :day].sum(axis=2)
+    share = share_spent_by(data.profile, day, days_in_month)  # (C,)
+    seasonal = spent / share
+    trended, has_history = trend(data.history)
+    blended = np.where(has_history, share * seasonal + (1 - share) * trended, seasonal)
+    return np.maximum(blended, spent)
+
+
+def _limits(user_ids, month, year):
+    """(U, C) category limits of the month's budgets, NaN for users without one."""
+    limits = np.full((len(user_ids), len(FIELDS)), np.nan)
+    rows = BudgetDetails.objects.filter(month=month, year=year).values_list("user_id", *LIMIT_FIELDS)
+    rows = np.array(list(rows.iterator(chunk_size=LOAD_CHUNK_SIZE)), dtype=np.float64).reshape(-1, 1 + len(FIELDS))
+    limits[np.searchsorted(user_ids, rows[:, 0].astype(np.int64))] = rows[:, 1:]
+    return limits
+
+
+def _save(user_ids, forecast, month, year):
+    computed_at = timezone.now()
+    for start in range(0, len(user_ids), SAVE_BATCH_SIZE):
+        batch = [
+            SpendForecast(user_id=int(user_id), month=month, year=year, computed_at=computed_at,
+                          **dict(zip(FIELDS, (round(float(value), 2) for value in values))))
+            for user_id, values in zip(user_ids[start:start + SAVE_BATCH_SIZE], forecast[start:start + SAVE_BATCH_SIZE])
+        ]
+        with sharding.atomic():
+            SpendForecast.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=["user", "year", "month"],
+                update_fields=[*FIELDS, "computed_at"],
+            )
+
+
+class ForecastReport:
+    def __init__(self, user_ids, month, year, over_budget, timings):
+        self.user_ids = user_ids
+        self.month = month
+        self.year = year
+        self.over_budget = over_budget
+        self.timings = timings
+
+    def __str__(self):
+        steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in self.timings.items())
+        return f"Forecast {len(self.user_ids)} users, {self.over_budget} heading over a limit ({steps})"
+
+
+def run(month=None, year=None, day=None):
+    """
+    Forecast every user with expenses or a budget for the month (default: the
+    current one, as of today) and store the results. Returns a ForecastReport.
+    """
+    today = timezone.localdate()
+    month, year = month or today.month, year or today.year
+    days_in_month = calendar.monthrange(year, month)[1]
+    if day is None:
+        if (year, month) == (today.year, today.month):
+            day = today.day
+        elif (year, month) < (today.year, today.month):
+            day = days_in_month
+        else:
+            day = 1
+
+    timings = {}
+    started = time.monotonic()
+    budget_users = BudgetDetails.objects.filter(month=month, year=year).values_list("user_id", flat=True)
+    data = load(month, year, extra_user_ids=budget_users)
+    timings["load"] = time.monotonic() - started
+
+    started = time.monotonic()
+    forecast = project(data, day, days_in_month)
+    limits = _limits(data.user_ids, month, year)
+    over_budget = int(np.any(forecast > np.nan_to_num(limits, nan=np.inf), axis=1).sum())
+    timings["project"] = time.monotonic() - started
+
+    started = time.monotonic()
+    _save(data.user_ids, forecast, month, year)
+    timings["save"] = time.monotonic() - started
+
+    return ForecastReport(data.user_ids, month, year, over_budget, timings)
@@ -0,0 +1,161 @@
+"""
+Households: several accounts with a shared monthly budget and one dashboard.
+
+An account creates a household and the others join it with its code. Each
+member keeps their own budget, summary and expenses; the household adds
+shared limits (HouseholdBudget) and a HouseholdRollup per month that the
+members' expense writes keep up to date (see app.rollups). Joining adds the
+member's existing MonthlySpendRollup rows to it and leaving takes them out,
+so the rollup always covers exactly the current members. The dashboard then
+reads one rollup row for the combined spend, plus one row per member.
+
+With sharding a household lives on one shard with all of its members:
+joining moves the account there first (sharding.move_user()), and
+rebalance_shards leaves household members where they are.
+"""
+import secrets
+
+from django.db.models import F, Sum
+
+from . import money, rollups, sharding
+from .models import (
+    BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES, Household, HouseholdBudget, HouseholdRollup, MonthlySpendRollup,
+    UserAccount,
+)
+
+CODE_BYTES = 6
+LIMITS = {field: f"{field}_limit" for field in rollups.CATEGORY_FIELDS}
+LABELS = {field: category for category, (_, field) in EXPENSE_CATEGORIES.items()}
+
+
+class HouseholdError(Exception):
+    """The change could not be made; the message is shown to the user."""
+
+
+def find(code):
+    """The household with join code ``code`` on whichever shard holds it (``_state.db``), or None."""
+    for alias in sharding.aliases():
+        household = Household.objects.using(alias).filter(code=code.strip()).first()
+        if household is not None:
+            return household
+    return None
+
+
+def _add_member_rollups(user, household_id, sign):
+    """Add (sign=1) or take out (sign=-1) the user's monthly spend in the household rollup."""
+    for rollup in MonthlySpendRollup.objects.filter(user=user):
+        HouseholdRollup.objects.get_or_create(household_id=household_id, month=rollup.month, year=rollup.year)
+        HouseholdRollup.objects.filter(household_id=household_id, month=rollup.month, year=rollup.year).update(**{
+            field: F(field) + money.literal(sign * getattr(rollup, field)) for field in rollups.CATEGORY_FIELDS
+        })
+
+
+def remove_spend(user):
+    """Take the user's spend out of their household's rollup (if any), e.g. before the account is deleted."""
+    household_id = UserAccount.objects.filter(pk=user.pk).values_list("household_id", flat=True).first()
+    if household_id is not None:
+        _add_member_rollups(user, household_id, -1)
+
+
+@sharding.atomic
+def _join(user_id, household):
+    user = UserAccount.objects.select_for_update().get(pk=user_id)
+    if user.household_id is not None:
+        raise HouseholdError("You are already in a household; leave it first.")
+    rollups.get_totals(user)  # the member's monthly rollups must exist before they are added up
+    user.household = household
+    user.save(update_fields=["household"])
+    _add_member_rollups(user, household.pk, 1)
+    return household
+
+
+def create(user, name):
+    """Start a household named ``name`` with ``user`` as its first member."""
+    name = name.strip()
+    if not name:
+        raise HouseholdError("Give the household a name.")
+    with sharding.atomic():
+        household = Household.objects.create(name=name[:100], code=secrets.token_urlsafe(CODE_BYTES))
+        return _join(user.user_id, household)
+
+
+def join(user, code):
+    """
+    Add ``user`` to the household with join code ``code``, moving the account
+    to the household's shard first. Returns the household.
+    """
+    household = find(code) if code else None
+    if household is None:
+        raise HouseholdError("No household has that code.")
+    if user.household_id is not None:
+        raise HouseholdError("You are already in a household; leave it first.")
+    alias = household._state.db
+    if sharding.enabled() and sharding.shard_of(user.user_id) != alias:
+        sharding.move_user(user.user_id, alias)
+    with sharding.using(alias):
+        return _join(user.user_id, household)
+
+
+@sharding.atomic
+def leave(user):
+    """Take ``user`` out of their household; the last member to leave deletes it."""
+    user = UserAccount.objects.select_for_update().get(pk=user.pk)
+    household = user.household
+    if household is None:
+        return
+    remove_spend(user)
+    user.household = None
+    user.save(update_fields=["household"])
+    if not household.members.exists():
+        household.delete()
+
+
+def set_budget(household, month, year, limits):
+    """Save the household's shared limits for the month; ``limits`` maps category field -> amount."""
+    HouseholdBudget.objects.update_or_create(
+        household=household, month=month, year=year,
+        defaults={LIMITS[field]: money.rupees(limits[field]) for field in rollups.CATEGORY_FIELDS},
+    )
+
+
+def dashboard(household, month, year):
+    """Everything the household page shows for one month, read from rollup and summary rows only."""
+    members = list(household.members.order_by("username"))
+    combined = HouseholdRollup.objects.filter(household=household, month=month, year=year).first()
+    combined = {field: getattr(combined, field) if combined else money.ZERO for field in rollups.CATEGORY_FIELDS}
+    budget = HouseholdBudget.objects.filter(household=household, month=month, year=year).first()
+    spend = {
+        rollup.user_id: rollup
+        for rollup in MonthlySpendRollup.objects.filter(user__household=household, month=month, year=year)
+    }
+    salaries = BudgetDetails.objects.filter(user__household=household, month=month, year=year).aggregate(
+        salary=Sum("actual_salary")
+    )
+    savings = BudgetSummary.objects.filter(user__household=household, month=month, year=year).aggregate(
+        savings=Sum("savings")
+    )
+
+    categories = []
+    for field in rollups.CATEGORY_FIELDS:
+        limit = getattr(budget, LIMITS[field]) if budget else None
+        categories.append({
+            "field": field,
+            "label": LABELS[field],
+            "spent": combined[field],
+            "limit": limit,
+            "remaining": None if limit is None else limit - combined[field],
+        })
+    rows = []
+    for member in members:
+        rollup = spend.get(member.user_id)
+        values = [getattr(rollup, field) if rollup else money.ZERO for field in rollups.CATEGORY_FIELDS]
+        rows.append({"member": member, "spend": values, "total": sum(values, money.ZERO)})
+    return {
+        "household": household,
+        "members": rows,
+        "categories": categories,
+        "total": sum(combined.values(), money.ZERO),
+        "salary": salaries["salary"] or money.ZERO,
+        "savings": savings["savings"] or money.ZERO,
+        "budget": budget,
+    }
@@ -0,0 +1,217 @@
+"""
+Streaming import of bank / UPI statement CSVs into the expense tables.
+
+Rows are read one at a time and inserted with bulk_create in chunks, each
+chunk in its own transaction together with its rollup deltas, so memory use
+is bounded by the chunk size rather than the file size. Each affected month's
+BudgetSummary is recomputed once at the end instead of once per row.
+
+Expected columns (header names are case-insensitive):
+    date, description (or expense), amount, category (optional)
+
+Rows without a category get ``default_category``; with AUTO_CATEGORY they are
+classified from their description by app.classifier, a chunk at a time.
+Rows dated in a month that has been archived (see app.archive) are skipped.
+A file that is not UTF-8 text stops the import (ImportReport.failed); the
+chunks saved before that stay, with their months' summaries recomputed.
+"""
+import csv
+import time
+from datetime import datetime
+
+from django.utils import timezone
+
+from . import allocation, anomalies, archive, classifier, money, rollups, sharding
+from .caching import invalidate_dashboard
+from .models import EXPENSE_CATEGORIES
+
+DEFAULT_BATCH_SIZE = 5000
+AUTO_CATEGORY = "auto"
+MAX_REPORTED_ERRORS = 20
+
+DATE_FORMATS = (
+    "%d-%m-%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M",
+    "%d-%m-%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+)
+
+CATEGORY_ALIASES = {
+    "mandatory": "Mandatory",
+    "basic needs": "Basic Needs",
+    "basic_needs": "Basic Needs",
+    "sudden expense": "Sudden Expense",
+    "sudden expenses": "Sudden Expense",
+    "sudden_expense": "Sudden Expense",
+    "sudden": "Sudden Expense",
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.months = set()
+        self.seconds = 0.0
+        self.failed = None  # why the import stopped early, if it did
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def skip(self, line_number, reason):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_number}: {reason}")
+
+    def __str__(self):
+        return (
+            f"{self.imported} imported, {self.skipped} skipped of {self.rows} rows "
+            f"in {self.seconds:.1f}s ({self.rows_per_second:,.0f} rows/sec)"
+        )
+
+
+def parse_date(value, tz=None):
+    value = value.strip()
+    tz = tz or timezone.get_current_timezone()
+    try:
+        # Fast path for ISO dates, which most exports use
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"unrecognised date {value!r}")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=tz)
+
+
+def parse_amount(value):
+    cleaned = value.replace(",", "").replace("₹", "").replace("INR", "").strip()
+    return money.rupees(cleaned)
+
+
+def parse_category(value, default):
+    if not value or not value.strip():
+        if default is None:
+            raise ValueError("missing category")
+        return default
+    category = CATEGORY_ALIASES.get(value.strip().lower())
+    if category is None:
+        raise ValueError(f"unknown category {value!r}")
+    return category
+
+
+def _classify(unlabelled, pending):
+    """File rows that had no category under the classifier's suggestion."""
+    if not unlabelled:
+        return
+    suggestions = classifier.suggest_many([fields["expense"] for fields in unlabelled])
+    for fields, (category, _) in zip(unlabelled, suggestions):
+        category = category or "Sudden Expense"  # untrained model: the catch-all category
+        model, _ = EXPENSE_CATEGORIES[category]
+        pending[category].append(model(**fields))
+    unlabelled.clear()
+
+
+def _flush(user, pending, report):
+    """Insert one chunk and its rollup deltas in a single transaction."""
+    deltas = {}
+    with sharding.atomic():
+        for category, objs in pending.items():
+            if not objs:
+                continue
+            model, field = EXPENSE_CATEGORIES[category]
+            model.objects.bulk_create(objs)
+            for obj in objs:
+                month = deltas.setdefault((obj.timestamp.year, obj.timestamp.month), {})
+                month[field] = month.get(field, 0) + obj.amount
+            anomalies.record_bulk(user, category, [obj.amount for obj in objs])
+            report.imported += len(objs)
+            objs.clear()
+        rollups.record_bulk(user, deltas)
+    report.months.update(deltas)
+
+
+def import_csv(user, lines, batch_size=DEFAULT_BATCH_SIZE, default_category=None, progress=None):
+    """
+    Import the CSV text in ``lines`` (any iterable of lines, e.g. an open file)
+    as expenses of ``user``. ``progress`` is called with the report after
+    every chunk. Returns an ImportReport.
+    """
+    report = ImportReport()
+    started = time.monotonic()
+
+    reader = csv.DictReader(lines)
+    try:
+        _read(user, reader, batch_size, default_category, progress, report, started)
+    except UnicodeDecodeError:
+        report.failed = f"the file is not UTF-8 text (after line {reader.line_num})"
+    finally:
+        # Summaries are replayed once per touched month, not once per row,
+        # including the chunks already saved when the import stops early
+        for year, month in sorted(report.months):
+            allocation.recompute_summary(user, month, year)
+            invalidate_dashboard(user.user_id, month, year)
+
+    report.seconds = time.monotonic() - started
+    return report
+
+
+def _read(user, reader, batch_size, default_category, progress, report, started):
+    """Insert the rows of ``reader`` chunk by chunk, counting them in ``report``."""
+    pending = {category: [] for category in EXPENSE_CATEGORIES}
+    unlabelled = []
+    queued = 0
+    auto = default_category == AUTO_CATEGORY
+    archived = archive.archived_months(user)
+
+    tz = timezone.get_current_timezone()
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    description_column = "description" if "description" in reader.fieldnames else "expense"
+
+    for row in reader:
+        report.rows += 1
+        line_number = reader.line_num
+        try:
+            amount = parse_amount(row.get("amount") or "")
+            if amount <= 0:
+                raise ValueError("not a debit")
+            timestamp = parse_date(row.get("date") or "", tz)
+            local = timezone.localtime(timestamp)
+            if (local.year, local.month) in archived:
+                raise ValueError(f"{local:%B %Y} is archived")
+            fields = {
+                "user": user,
+                "timestamp": timestamp,
+                "expense": (row.get(description_column) or "").strip()[:255],
+                "amount": amount,
+            }
+            if auto and not (row.get("category") or "").strip():
+                unlabelled.append(fields)
+            else:
+                category = parse_category(row.get("category"), None if auto else default_category)
+                model, _ = EXPENSE_CATEGORIES[category]
+                pending[category].append(model(**fields))
+        except ValueError as exc:
+            report.skip(line_number, exc)
+            continue
+
+        queued += 1
+        if queued >= batch_size:
+            _classify(unlabelled, pending)
+            _flush(user, pending, report)
+            queued = 0
+            report.seconds = time.monotonic() - started
+            if progress:
+                progress(report)
+
+    _classify(unlabelled, pending)
+    _flush(user, pending, report)
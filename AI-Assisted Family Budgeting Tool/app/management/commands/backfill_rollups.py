@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import rollups, sharding
+from app.models import Household, UserAccount
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the per-user spend rollups from the expense tables, and the household rollups from those, "
+        "or check them with --check."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only process this username.")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Compare the rollups with the raw tables instead of rebuilding them.",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"] and not sharding.account_exists(username=options["user"]):
+            raise CommandError(f"No user named {options['user']!r}")
+
+        inconsistent = 0
+        for _ in sharding.each():
+            users = UserAccount.objects.order_by("user_id")
+            if options["user"]:
+                users = users.filter(username=options["user"])
+            for user in users.iterator():
+                if options["check"]:
+                    problems = rollups.check_consistency(user)
+                    if problems:
+                        inconsistent += 1
+                        for problem in problems:
+                            self.stdout.write(f"{user.username}: {problem}")
+                else:
+                    rollups.rebuild_user(user)
+                    self.stdout.write(f"Rebuilt rollups for {user.username}")
+            if options["user"]:
+                continue
+            for household in Household.objects.order_by("id").iterator():
+                if options["check"]:
+                    problems = rollups.check_household(household)
+                    if problems:
+                        inconsistent += 1
+                        for problem in problems:
+                            self.stdout.write(f"household {household.name}: {problem}")
+                else:
+                    rollups.rebuild_household(household)
+                    self.stdout.write(f"Rebuilt rollups for household {household.name}")
+
+        if options["check"]:
+            if inconsistent:
+                raise CommandError(f"{inconsistent} user(s) or household(s) have rollups out of step with the raw tables")
+            self.stdout.write(self.style.SUCCESS("Rollups are consistent"))
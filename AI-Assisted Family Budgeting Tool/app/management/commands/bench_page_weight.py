@@ -0,0 +1,53 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from app import sharding
+from app.models import EXPENSE_CATEGORIES
+
+
+def _size(name):
+    try:
+        return default_storage.size(name) if name else 0
+    except OSError:
+        return 0
+
+
+class Command(BaseCommand):
+    help = "Compare the image bytes a history page downloads with original receipts vs thumbnails."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only count this username's receipts.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = sharding.find_account(username=options["user"])
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        rows = []
+        for alias in sharding.each():
+            if user is not None and user._state.db != alias:
+                continue
+            for model, _ in EXPENSE_CATEGORIES.values():
+                expenses = model.objects.exclude(Q(image="") | Q(image__isnull=True))
+                if user is not None:
+                    expenses = expenses.filter(user=user)
+                rows.extend(expenses.values_list("image", "thumbnail", "display_image"))
+
+        if not rows:
+            self.stdout.write("No receipts found")
+            return
+
+        original = sum(_size(image) for image, _, _ in rows)
+        # Unprocessed receipts still fall back to the original, as in the template
+        thumbs = sum(_size(thumb) if thumb else _size(image) for image, thumb, _ in rows)
+        display = sum(_size(shown) if shown else _size(image) for image, _, shown in rows)
+        processed = sum(1 for _, thumb, _ in rows if thumb)
+
+        self.stdout.write(f"Receipts: {len(rows)} ({processed} processed)")
+        self.stdout.write(f"History table images, before: {original / 1024:,.0f} KiB")
+        self.stdout.write(f"History table images, after:  {thumbs / 1024:,.0f} KiB ({thumbs / original:.1%})")
+        self.stdout.write(f"Average click-through image, before: {original / len(rows) / 1024:,.0f} KiB")
+        self.stdout.write(f"Average click-through image, after:  {display / len(rows) / 1024:,.0f} KiB")
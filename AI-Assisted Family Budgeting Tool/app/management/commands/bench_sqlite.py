@@ -0,0 +1,154 @@
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from app import synthetic
+
+# Profile -> environment; "sharded" spreads the families over FAMILY_SHARDS databases
+PROFILES = {
+    "default": {"FAMILY_SQLITE_PRODUCTION": "0"},
+    "production": {"FAMILY_SQLITE_PRODUCTION": "1"},
+    "sharded": {"FAMILY_SQLITE_PRODUCTION": "1", "FAMILY_SHARDS": "4"},
+}
+READ_PAGES = ("first", "home", "month_history")
+BUDGET_SHARE = 0.25  # writes that save the month's budget instead of adding an expense
+
+
+def _summary(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    attempts = len(latencies) + errors
+    return {
+        "ok": len(latencies),
+        "errors": errors,
+        "per_second": len(latencies) / seconds,
+        "error_rate": errors / attempts if attempts else 0.0,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+    }
+
+
+def _worker(kind, seed, sessions, stop, results):
+    """Load the site as one reader or writer until ``stop`` (epoch seconds), then report."""
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    client = Client()
+    overrides = {
+        # The test client sends Host: testserver; every read goes to the database
+        "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"],
+        "CACHES": {**settings.CACHES, "bench": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+        "DASHBOARD_CACHE": "bench",
+    }
+    with override_settings(**overrides):
+        while time.time() < stop:
+            client.cookies[settings.SESSION_COOKIE_NAME] = rng.choice(sessions)
+            client.cookies.pop("messages", None)
+            started = time.perf_counter()
+            try:
+                if kind == "reads":
+                    ok = client.get(reverse(rng.choice(READ_PAGES))).status_code == 200
+                elif rng.random() < BUDGET_SHARE:
+                    ok = client.post(reverse("first"), {
+                        "salary": 60000,
+                        "mandatory_limit": rng.randint(20000, 25000),
+                        "basic_needs_limit": 15000,
+                        "sudden_expenses_limit": 8000,
+                    }).status_code == 302
+                else:
+                    ok = client.post(reverse("home"), {
+                        "category": rng.choice(("Mandatory", "Basic Needs", "Sudden Expense")),
+                        "expense": "load test",
+                        "amount": rng.randint(1, 50),
+                    }).status_code == 302
+            except Exception:  # "database is locked" and friends surface as exceptions
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+    connections.close_all()
+    results.put((kind, latencies, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed readers and writers against a fresh SQLite file, with the default settings, with the "
+        "production profile (FAMILY_SQLITE_PRODUCTION=1) and with the families sharded over four files: "
+        "throughput, p99 latency and error rate of each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=10.0)
+        parser.add_argument("--users", type=int, default=50, help="Families generated for the run.")
+        parser.add_argument("--profile", choices=PROFILES, help="Run one profile only and print JSON (used internally).")
+
+    def handle(self, *args, **options):
+        if options["profile"]:
+            self.stdout.write(json.dumps(self.run_profile(options)))
+            return
+
+        results = {}
+        for profile, overrides in PROFILES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                env = {**os.environ, "FAMILY_SHARDS": "0", **overrides, "FAMILY_DB_PATH": os.path.join(directory, "db.sqlite3")}
+                for database in ["default", *(f"shard{i}" for i in range(int(env["FAMILY_SHARDS"])))]:
+                    subprocess.run([sys.executable, "-m", "django", "migrate", "-v0", "--database", database],
+                                   env=env, cwd=settings.BASE_DIR, check=True)
+                command = [sys.executable, "-m", "django", "bench_sqlite", "--profile", profile]
+                for option in ("readers", "writers", "seconds", "users"):
+                    command += [f"--{option}", str(options[option])]
+                done = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if done.returncode:
+                raise CommandError(f"{profile} run failed:\n{done.stderr[-2000:]}")
+            results[profile] = json.loads(done.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, {options['seconds']:.0f}s")
+        self.stdout.write(f"{'':12}{'':8}{'ops/s':>10}{'p99 ms':>10}{'errors':>10}{'error %':>10}")
+        for profile, result in results.items():
+            for kind in ("reads", "writes"):
+                row = result[kind]
+                self.stdout.write(
+                    f"{profile:12}{kind:8}{row['per_second']:>10,.1f}{row['p99_ms']:>10.1f}"
+                    f"{row['errors']:>10}{row['error_rate']:>10.1%}"
+                )
+
+    def run_profile(self, options):
+        data = synthetic.generate(options["users"], 2, prefix="load", stats=False)
+        sessions = []
+        for user in data.users:
+            session = SessionStore()
+            session["user_id"] = user.user_id
+            session.create()
+            sessions.append(session.session_key)
+        connections.close_all()  # the forked workers open their own
+
+        # One process per reader/writer, like separate server workers (threads would share the GIL)
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        stop = time.time() + options["seconds"] + 1  # after every worker has started
+        workers = [
+            context.Process(target=_worker, args=(kind, seed, sessions, stop, results))
+            for kind, count, first_seed in (("reads", options["readers"], 0), ("writes", options["writers"], 1000))
+            for seed in range(first_seed, first_seed + count)
+        ]
+        for worker in workers:
+            worker.start()
+        stats = {"reads": ([], 0), "writes": ([], 0)}
+        for _ in workers:
+            kind, latencies, errors = results.get()
+            stats[kind] = (stats[kind][0] + latencies, stats[kind][1] + errors)
+        for worker in workers:
+            worker.join()
+        return {kind: _summary(latencies, errors, options["seconds"]) for kind, (latencies, errors) in stats.items()}
@@ -0,0 +1,164 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from app import allocation, caching, synthetic
+
+SIZES = "20x3,200x12"
+
+
+def _parse_sizes(value):
+    """'20x3,200x12' -> [(20, 3), (200, 12)] (users x months)."""
+    try:
+        sizes = [tuple(int(part) for part in size.split("x")) for size in value.split(",")]
+    except ValueError:
+        sizes = []
+    if not sizes or any(len(size) != 2 or min(size) < 1 for size in sizes):
+        raise CommandError("--sizes must look like 20x3,200x12 (users x months)")
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "Time login, first, home GET/POST, month_history, delete_expense and allocation at several "
+        "data sizes in a throwaway test database, with query counts, and fail when a scenario is "
+        "slower or runs more queries than the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default=SIZES, help="Comma-separated <users>x<months> data sizes.")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per scenario (the median is kept).")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline", default=str(settings.BASE_DIR / "bench_baseline.json"))
+        parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+        parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown over the baseline median.")
+        parser.add_argument("--slack-ms", type=float, default=2.0, help="Absolute slowdown always allowed, for noise.")
+
+    def handle(self, *args, **options):
+        sizes = _parse_sizes(options["sizes"])
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # The test clients send Host: testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                results = {f"{users}x{months}": self.run_size(users, months, options) for users, months in sizes}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options["save_baseline"]:
+            with open(options["baseline"], "w") as baseline:
+                json.dump({"sizes": results}, baseline, indent=2, sort_keys=True)
+                baseline.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+            return
+
+        try:
+            with open(options["baseline"]) as baseline:
+                stored = json.load(baseline)["sizes"]
+        except FileNotFoundError:
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to create one")
+            return
+
+        regressions = []
+        for size, scenarios in results.items():
+            for name, result in scenarios.items():
+                before = stored.get(size, {}).get(name)
+                if before is None:
+                    continue
+                if result["queries"] > before["queries"]:
+                    regressions.append(f"{size} {name}: {result['queries']} queries, baseline {before['queries']}")
+                limit = before["median_ms"] * options["tolerance"] + options["slack_ms"]
+                if result["median_ms"] > limit:
+                    regressions.append(
+                        f"{size} {name}: {result['median_ms']:.1f}ms, baseline {before['median_ms']:.1f}ms"
+                    )
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def run_size(self, users, months, options):
+        call_command("flush", interactive=False, verbosity=0)
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        started = time.monotonic()
+        data = synthetic.generate(users, months, seed=options["seed"], prefix="bench")
+        self.stdout.write(f"\n{data} in {time.monotonic() - started:.1f}s")
+
+        user = data.users[0]
+        session = SessionStore()
+        session["user_id"] = user.user_id
+        session["username"] = user.username
+        session.create()
+        client = Client()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        results = {}
+        self.stdout.write(f"{'scenario':16}{'median ms':>12}{'p95 ms':>10}{'queries':>10}")
+        for name, (prepare, run, expected) in self.scenarios(client, user).items():
+            timings, queries = [], 0
+            for i in range(options["repeat"] + 1):  # the first run only warms caches
+                client.cookies.pop("messages", None)  # flash messages would pile up across runs
+                prepared = prepare()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    status = run(prepared)
+                    elapsed = time.perf_counter() - started
+                if status != expected:
+                    raise CommandError(f"{name} returned {status}, expected {expected}")
+                if i:
+                    timings.append(elapsed * 1000)
+                    queries = max(queries, len(captured))
+            timings.sort()
+            results[name] = {
+                "median_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+                "queries": queries,
+            }
+            self.stdout.write(
+                f"{name:16}{results[name]['median_ms']:>12.1f}{results[name]['p95_ms']:>10.1f}{queries:>10}"
+            )
+        return results
+
+    def scenarios(self, client, user):
+        """Name -> (untimed prepare(), timed run(prepared) returning a status, expected status)."""
+        def nothing():
+            return None
+
+        def invalidate_dashboard():
+            caching.invalidate_dashboard(user.user_id, now().month, now().year)
+
+        def new_expense():
+            return allocation.add_expense(user, "Basic Needs", "bench", 1).id
+
+        def allocate(_):
+            allocation.add_expense(user, "Sudden Expense", "bench", 1)
+            return 200
+
+        return {
+            "login": (
+                nothing,
+                lambda _: Client().post(reverse("login"), {"username": user.username, "password": synthetic.PASSWORD}).status_code,
+                302,
+            ),
+            "first": (nothing, lambda _: client.get(reverse("first")).status_code, 200),
+            "home_get": (nothing, lambda _: client.get(reverse("home")).status_code, 200),
+            "home_get_cold": (invalidate_dashboard, lambda _: client.get(reverse("home")).status_code, 200),
+            "home_post": (
+                nothing,
+                lambda _: client.post(reverse("home"), {"category": "Basic Needs", "expense": "bench", "amount": 1}).status_code,
+                302,
+            ),
+            "month_history": (nothing, lambda _: client.get(reverse("month_history")).status_code, 200),
+            "delete_expense": (new_expense, lambda expense_id: client.post(reverse("delete", args=[expense_id])).status_code, 302),
+            "allocation": (nothing, allocate, 200),
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from app import sharding
+
+MODES = ("wsgi", "asgi")
+PAGES = ("home", "first", "month_history")
+
+
+def _summary(latencies, seconds):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests/sec and p99 latency of first, home and month_history under concurrent load: "
+        "sync views on the WSGI handler vs app.async_views on the ASGI handler. "
+        "Each side runs in its own process, in-process clients, no network."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", required=True, help="Username to load the pages as.")
+        parser.add_argument("--requests", type=int, default=600, help="Requests per mode, spread over the pages.")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--pages", default=",".join(PAGES), help="Comma-separated URL names.")
+        parser.add_argument("--cold", action="store_true", help="Bypass the dashboard cache.")
+        parser.add_argument("--mode", choices=MODES, help="Run one side only and print JSON (used internally).")
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            result = self.run_mode(options)
+            self.stdout.write(json.dumps(result))
+            return
+
+        results = {}
+        for mode in MODES:
+            command = [sys.executable, "-m", "django", "bench_views", "--mode", mode]
+            for option in ("user", "requests", "concurrency", "pages"):
+                command += [f"--{option}", str(options[option])]
+            if options["cold"]:
+                command.append("--cold")
+            env = {**os.environ, "FAMILY_ASYNC_VIEWS": "1" if mode == "asgi" else "0"}
+            done = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if done.returncode:
+                raise CommandError(f"{mode} run failed:\n{done.stderr[-2000:]}")
+            results[mode] = json.loads(done.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f"{'':6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for mode, result in results.items():
+            self.stdout.write(f"{mode:6}{result['rps']:>10,.0f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+
+    def run_mode(self, options):
+        user = sharding.find_account(username=options["user"])
+        if user is None:
+            raise CommandError(f"No user named {options['user']!r}")
+        session = SessionStore()
+        session["user_id"] = user.user_id
+        session.create()
+
+        paths = [reverse(name.strip()) for name in options["pages"].split(",")]
+        plan = [paths[i % len(paths)] for i in range(options["requests"])]
+
+        # The test clients send Host: testserver
+        overrides = {"ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"]}
+        if options["cold"]:
+            overrides |= {
+                "CACHES": {**settings.CACHES, "bench": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+                "DASHBOARD_CACHE": "bench",
+            }
+        try:
+            with override_settings(**overrides):
+                run = self.run_asgi if options["mode"] == "asgi" else self.run_wsgi
+                started = time.perf_counter()
+                latencies = run(plan, options["concurrency"], session.session_key)
+                return _summary(latencies, time.perf_counter() - started)
+        finally:
+            session.delete()
+
+    def _check(self, path, response):
+        if response.status_code != 200:
+            raise CommandError(f"GET {path} returned {response.status_code}")
+
+    def run_wsgi(self, plan, concurrency, session_key):
+        local = threading.local()
+
+        def fetch(path):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client()
+                client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+            self._check(path, response)
+            return elapsed
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(fetch, plan))
+
+    def run_asgi(self, plan, concurrency, session_key):
+        async def main():
+            client = AsyncClient()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            slots = asyncio.Semaphore(concurrency)
+
+            async def fetch(path):
+                async with slots:
+                    started = time.perf_counter()
+                    response = await client.get(path)
+                    elapsed = time.perf_counter() - started
+                self._check(path, response)
+                return elapsed
+
+            return await asyncio.gather(*(fetch(path) for path in plan))
+
+        return asyncio.run(main())
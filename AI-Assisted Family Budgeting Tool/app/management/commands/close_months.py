@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import archive, sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Month close: move expenses older than the archive horizon out of the expense tables into "
+        "compressed per-user, per-year archives (rollups, budgets and summaries stay). Meant to run monthly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=None,
+            help=f"Months kept in the expense tables, counting the current one (default: {settings.ARCHIVE_AFTER_MONTHS}).",
+        )
+        parser.add_argument("--user", help="Only archive this username.")
+
+    def handle(self, *args, **options):
+        if options["months"] is not None and options["months"] < 1:
+            raise CommandError("--months must be at least 1")
+        user = None
+        if options["user"]:
+            user = sharding.find_account(username=options["user"])
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        started = time.monotonic()
+        families = expenses = 0
+        for alias in sharding.each():
+            if user is not None and user._state.db != alias:
+                continue
+            archived = archive.close_months(options["months"], users=[user] if user else None)
+            families += archived[0]
+            expenses += archived[1]
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {expenses} expenses of {families} families from before "
+            f"{archive.cutoff(months=options['months']):%B %Y} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,34 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import exporter, sharding
+
+
+class Command(BaseCommand):
+    help = "Stream expenses from all three expense tables as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only export this username (default: every user).")
+        parser.add_argument("--format", choices=exporter.FORMATS, default="csv")
+        parser.add_argument("--since", type=date.fromisoformat, help="First day to include (YYYY-MM-DD).")
+        parser.add_argument("--until", type=date.fromisoformat, help="Last day to include (YYYY-MM-DD).")
+        parser.add_argument("--chunk-size", type=int, default=exporter.DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--output", help="File to write to (default: stdout).")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = sharding.find_account(username=options["user"])
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        rows = exporter.export_rows(user, options["since"], options["until"], options["chunk_size"])
+        out = open(options["output"], "w", newline="", encoding="utf-8") if options["output"] else sys.stdout
+        try:
+            for chunk in exporter.render(rows, options["format"]):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
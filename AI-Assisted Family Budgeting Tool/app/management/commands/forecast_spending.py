@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from app import caching, forecast, sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Project every user's month-end spend per category and store it for the home page. "
+        "Meant to run daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", type=int, help="Month to forecast (default: current).")
+        parser.add_argument("--year", type=int, help="Year to forecast (default: current).")
+        parser.add_argument("--day", type=int, help="Forecast as of this day of the month (default: today).")
+
+    def handle(self, *args, **options):
+        for alias in sharding.each():
+            report = forecast.run(options["month"], options["year"], options["day"])
+            # Only reaches the web processes when they share the cache (e.g. Redis)
+            caching.invalidate_dashboards(report.user_ids, report.month, report.year)
+            self.stdout.write(self.style.SUCCESS(f"{alias}: {report}" if sharding.enabled() else str(report)))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import sharding, synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Create synthetic families with budgets, summaries and expenses for benchmarks "
+        f"(every account's password is {synthetic.PASSWORD!r})."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--months", type=int, default=12, help="Months of history, ending with this month.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--receipts", type=float, default=0.0, help="Share of expenses with a receipt image (0-1).")
+        parser.add_argument("--prefix", default="family", help="Usernames are <prefix>0, <prefix>1, ...")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["months"] < 1:
+            raise CommandError("--users and --months must be at least 1")
+        if not 0 <= options["receipts"] <= 1:
+            raise CommandError("--receipts must be between 0 and 1")
+        if sharding.account_exists(username__startswith=options["prefix"]):
+            raise CommandError(f"Users named {options['prefix']}* already exist; pick another --prefix")
+
+        started = time.monotonic()
+        data = synthetic.generate(
+            options["users"], options["months"], seed=options["seed"], receipts=options["receipts"], prefix=options["prefix"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Generated {data} in {time.monotonic() - started:.1f}s"))
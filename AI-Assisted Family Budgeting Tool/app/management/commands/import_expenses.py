@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import sharding
+from app.importer import AUTO_CATEGORY, DEFAULT_BATCH_SIZE, import_csv
+
+
+class Command(BaseCommand):
+    help = "Stream a bank/UPI statement CSV (date, description, amount[, category]) into a user's expenses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import.")
+        parser.add_argument("--user", required=True, help="Username the expenses belong to.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--default-category",
+            choices=["Mandatory", "Basic Needs", "Sudden Expense", AUTO_CATEGORY],
+            help=f"Category for rows that do not have one ({AUTO_CATEGORY!r}: suggest from the description).",
+        )
+
+    def handle(self, *args, **options):
+        user = sharding.find_account(username=options["user"])
+        if user is None:
+            raise CommandError(f"No user named {options['user']!r}")
+
+        def progress(report):
+            self.stdout.write(f"  {report.rows:,} rows ({report.rows_per_second:,.0f} rows/sec)")
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as handle, sharding.using(user._state.db):
+            report = import_csv(
+                user,
+                handle,
+                batch_size=options["batch_size"],
+                default_category=options["default_category"],
+                progress=progress,
+            )
+
+        for error in report.errors:
+            self.stderr.write(error)
+        if report.failed:
+            raise CommandError(f"Import stopped, {report.failed}: {report}")
+        self.stdout.write(self.style.SUCCESS(str(report)))
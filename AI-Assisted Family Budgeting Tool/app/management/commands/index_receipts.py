@@ -0,0 +1,48 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from app import fingerprints, sharding
+from app.models import EXPENSE_CATEGORIES, ReceiptFingerprint
+from app.storage import receipt_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Fingerprint receipts attached before content-addressed storage, so duplicate "
+        "warnings cover them. With --relocate, also copy each file to its content-hash "
+        "name and point the expense at it (the old files are left in place)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--relocate", action="store_true", help="Move expenses onto content-addressed file names.")
+
+    def handle(self, *args, **options):
+        indexed = relocated = failed = 0
+        for _ in sharding.each():
+            for category, (model, _) in EXPENSE_CATEGORIES.items():
+                done = set(ReceiptFingerprint.objects.filter(category=category).values_list("expense_id", flat=True))
+                rows = model.objects.exclude(Q(image="") | Q(image__isnull=True)).select_related("user")
+                for expense in rows.iterator():
+                    name = expense.image.name
+                    if expense.pk in done and not options["relocate"]:
+                        continue
+                    try:
+                        with default_storage.open(name, "rb") as handle:
+                            fp = fingerprints.fingerprint(handle)
+                            if fp is None:
+                                raise ValueError("not an image")
+                            if options["relocate"]:
+                                stored = receipt_storage.save(name, handle)
+                                if stored != name:
+                                    model.objects.filter(pk=expense.pk).update(image=stored)
+                                    relocated += 1
+                    except (OSError, ValueError) as exc:
+                        failed += 1
+                        self.stderr.write(f"{category} expense {expense.pk} ({name}): {exc}")
+                        continue
+                    if expense.pk not in done:
+                        fingerprints.record(expense.user, category, expense, fp)
+                        indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} receipts, relocated {relocated}, {failed} failed"))
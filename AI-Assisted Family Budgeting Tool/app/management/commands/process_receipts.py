@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from app import receipts, sharding
+from app.models import EXPENSE_CATEGORIES
+
+
+class Command(BaseCommand):
+    help = "Render thumbnails and display copies for receipts already stored under MEDIA_ROOT/expenses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Re-render receipts that already have variants.")
+
+    def handle(self, *args, **options):
+        rendered = {}  # the same file can be attached to several expenses
+        processed = failed = 0
+        for _ in sharding.each():
+            for category, (model, _) in EXPENSE_CATEGORIES.items():
+                rows = model.objects.exclude(Q(image="") | Q(image__isnull=True))
+                if not options["force"]:
+                    rows = rows.filter(Q(thumbnail="") | Q(thumbnail__isnull=True))
+                for expense_id, name in rows.values_list("id", "image").iterator():
+                    try:
+                        if name not in rendered:
+                            rendered[name] = receipts.render_variants(name)
+                        model.objects.filter(pk=expense_id).update(**rendered[name])
+                        processed += 1
+                    except (OSError, ValueError) as exc:
+                        failed += 1
+                        self.stderr.write(f"{category} expense {expense_id} ({name}): {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} receipts ({len(rendered)} distinct files), {failed} failed"
+        ))
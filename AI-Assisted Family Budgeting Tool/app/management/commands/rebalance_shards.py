@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import sharding
+from app.models import ShardMap
+
+
+class Command(BaseCommand):
+    help = (
+        "Move families onto their home shard, e.g. after changing FAMILY_SHARDS or turning sharding on "
+        "(families still in the default database are picked up too), or move one family with --user/--to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only move this username.")
+        parser.add_argument("--to", help="Shard to move --user to (default: its home shard), e.g. shard2.")
+        parser.add_argument("--dry-run", action="store_true", help="List the moves without making them.")
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError("Sharding is off; set FAMILY_SHARDS first")
+        if options["to"] and not options["user"]:
+            raise CommandError("--to needs --user")
+        if options["to"] and options["to"] not in sharding.aliases():
+            raise CommandError(f"--to must be one of {', '.join(sharding.aliases())}")
+
+        adopted = 0 if options["dry_run"] else sharding.adopt_legacy_accounts()
+        if adopted:
+            self.stdout.write(f"Found {adopted} families in the default database")
+
+        if options["user"]:
+            entry = ShardMap.objects.filter(username=options["user"]).first()
+            if entry is None:
+                raise CommandError(f"No user named {options['user']!r}")
+            moves = [(entry, options["to"] or sharding.home_shard(entry.user_id))]
+        else:
+            moves = [(entry, sharding.home_shard(entry.user_id)) for entry in sharding.misplaced()]
+
+        started = time.monotonic()
+        moved = expenses = 0
+        for entry, target in moves:
+            if entry.shard == target:
+                continue
+            self.stdout.write(f"{entry.username}: {entry.shard} -> {target}")
+            if not options["dry_run"]:
+                try:
+                    expenses += sharding.move_user(entry.user_id, target)
+                except ValueError as exc:
+                    raise CommandError(str(exc))
+            moved += 1
+
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} families ({expenses} expenses) in {time.monotonic() - started:.1f}s"
+        ))
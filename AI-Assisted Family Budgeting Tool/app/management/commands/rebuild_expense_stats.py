@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import anomalies, sharding
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user, per-category expense statistics used for anomaly warnings from the expense tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this username's statistics.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = sharding.find_account(username=options["user"])
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+        written = 0
+        for alias in sharding.each():
+            if user is not None and user._state.db != alias:
+                continue
+            with sharding.atomic():
+                written += anomalies.rebuild(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} statistics rows"))
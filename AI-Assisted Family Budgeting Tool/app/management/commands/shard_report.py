@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from app import sharding
+from app.models import ShardMap
+
+
+class Command(BaseCommand):
+    help = "Families, expenses and lifetime spend on each shard, counted on all shards in parallel."
+
+    def handle(self, *args, **options):
+        report = sharding.report()
+        misplaced = len(sharding.misplaced()) if sharding.enabled() else 0
+
+        self.stdout.write(f"{'shard':10}{'families':>10}{'mapped':>10}{'expenses':>12}{'spend':>16}")
+        mapped = dict(ShardMap.objects.values_list("shard").annotate(count=Count("user_id"))) if sharding.enabled() else {}
+        for alias, row in report.items():
+            self.stdout.write(
+                f"{alias:10}{row['users']:>10,}{mapped.get(alias, row['users']):>10,}"
+                f"{row['expenses']:>12,}{row['spend']:>16,.2f}"
+            )
+        self.stdout.write(
+            f"{'total':10}{sum(row['users'] for row in report.values()):>10,}{'':>10}"
+            f"{sum(row['expenses'] for row in report.values()):>12,}{sum(row['spend'] for row in report.values()):>16,.2f}"
+        )
+        if misplaced:
+            self.stdout.write(self.style.WARNING(f"{misplaced} families are not on their home shard; run rebalance_shards"))
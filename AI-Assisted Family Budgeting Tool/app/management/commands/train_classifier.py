@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import classifier
+
+
+class Command(BaseCommand):
+    help = "Train the expense category classifier on the labelled expenses and save it to settings.CLASSIFIER_PATH."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental", action="store_true",
+            help="Continue from the saved model with only the expenses added since it was trained.",
+        )
+        parser.add_argument("--epochs", type=int, default=classifier.EPOCHS)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            model, used = classifier.train(incremental=options["incremental"], epochs=options["epochs"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained on {used} expenses ({model.samples} updates in total) in {time.monotonic() - started:.1f}s"
+        ))
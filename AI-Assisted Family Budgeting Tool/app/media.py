@@ -0,0 +1,164 @@
+"""
+Receipt and static asset serving.
+
+Receipts (originals, thumbnails and display copies) are served by
+views.receipt() under MEDIA_URL, only to the family whose expense refers to
+them (or to a superuser), instead of by django.conf.urls.static, which only
+works with DEBUG on. Every response carries a strong ETag and Last-Modified
+from the file's mtime and size and a long private Cache-Control, so the
+history page's thumbnails are fetched once per browser: conditional requests
+get a 304 and single byte ranges a 206.
+
+With settings.RECEIPT_SENDFILE the bytes are not read in Python at all: the
+response only names the file, for the front web server to send:
+
+* "X-Sendfile" (Apache mod_xsendfile, lighttpd): the absolute path;
+* "X-Accel-Redirect" (nginx): settings.RECEIPT_ACCEL_PREFIX + the name, an
+  ``internal`` location aliased to MEDIA_ROOT.
+
+The front server then also answers Range requests itself.
+
+Outside DEBUG, serve_static() answers for STATIC_URL the same way (when no
+front server does): the content-hashed names collectstatic writes with
+ManifestStaticFilesStorage (home.3f9a1c0b2d4e.css) are public and immutable,
+anything else must be revalidated.
+"""
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import archive
+from .models import EXPENSE_CATEGORIES
+
+CACHE_SECONDS = 365 * 24 * 60 * 60
+CHUNK_SIZE = 64 * 1024
+RECEIPT_FIELDS = ("image", "thumbnail", "display_image")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def owns(user, name):
+    """Whether one of ``user``'s expenses, live or archived, has ``name`` as a receipt or receipt copy."""
+    matches = Q()
+    for field in RECEIPT_FIELDS:
+        matches |= Q(**{field: name})
+    branches = [model.objects.filter(matches, user=user).values_list("id") for model, _ in EXPENSE_CATEGORIES.values()]
+    if branches[0].union(*branches[1:], all=True)[:1]:
+        return True
+    return name in archive.receipt_names(user)
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range of a ``size`` byte
+    file, or None to send the whole file (no, malformed or multiple ranges).
+    Raises RangeNotSatisfiable when the range lies past the end.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:  # the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """RFC 9110 If-Range: ranges are only honoured while the file is unchanged (strong comparison)."""
+    value = request.headers.get("If-Range")
+    if value is None:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _read(path, start, length):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, name):
+    """The response for the stored receipt file ``name`` (ownership already checked)."""
+    # The receipt storage and the copies' storage are both rooted at MEDIA_ROOT
+    cache_control = f"private, max-age={getattr(settings, 'RECEIPT_CACHE_SECONDS', CACHE_SECONDS)}"
+    return _serve_file(request, default_storage.path(name), name, cache_control, sendfile=True)
+
+
+def serve_static(request, name):
+    """The response for the collected static file ``name``."""
+    if name in getattr(staticfiles_storage, "hashed_files", {}).values():
+        cache_control = f"public, max-age={CACHE_SECONDS}, immutable"
+    else:
+        cache_control = "public, no-cache"
+    return _serve_file(request, staticfiles_storage.path(name), name, cache_control)
+
+
+def _serve_file(request, path, name, cache_control, sendfile=False):
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("No such file")
+
+    size, last_modified = stat.st_size, int(stat.st_mtime)
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    headers = {"ETag": etag, "Last-Modified": http_date(last_modified), "Cache-Control": cache_control}
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:  # 304, or 412 for a failed If-Match/If-Unmodified-Since
+        for header, value in headers.items():
+            conditional.headers.setdefault(header, value)
+        return conditional
+
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    sendfile = sendfile and getattr(settings, "RECEIPT_SENDFILE", "")
+    if sendfile:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if sendfile.lower() == "x-accel-redirect":
+            response["X-Accel-Redirect"] = getattr(settings, "RECEIPT_ACCEL_PREFIX", "/protected-media/") + name
+        else:
+            response["X-Sendfile"] = path
+        return response
+
+    headers["Accept-Ranges"] = "bytes"
+    try:
+        byte_range = parse_range(request.headers.get("Range", ""), size)
+    except RangeNotSatisfiable:
+        return HttpResponse(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None or request.method != "GET" or not _if_range_matches(request, etag, last_modified):
+        return FileResponse(open(path, "rb"), content_type=content_type, headers=headers)
+
+    start, end = byte_range
+    response = StreamingHttpResponse(_read(path, start, end - start + 1), status=206, content_type=content_type, headers=headers)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(end - start + 1)
+    return response
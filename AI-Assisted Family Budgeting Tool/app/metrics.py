@@ -0,0 +1,235 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+RequestMetricsMiddleware times every request and files it under its URL name
+(or "unmatched"), together with:
+
+* the SQL it ran: a wrapper added to every database connection as it is
+  opened counts the queries and their time for the request in progress (found
+  through a context variable, so it also works under ASGI);
+* template render time, from the TimedDjangoTemplates backend in settings;
+* the response size and status.
+
+The numbers are kept in memory per process, behind one lock taken once per
+request, and served at /metrics to scrapers that send settings.METRICS_TOKEN
+as a bearer token (and to superusers). Requests slower than
+settings.SLOW_REQUEST_SECONDS are logged with their slowest queries.
+"""
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+WORST_QUERIES = 3
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestStats:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.worst = []  # min-heap of (seconds, sql), at most WORST_QUERIES long
+
+    def add_query(self, seconds, sql):
+        self.queries += 1
+        self.sql_seconds += seconds
+        if len(self.worst) < WORST_QUERIES:
+            heapq.heappush(self.worst, (seconds, sql))
+        elif seconds > self.worst[0][0]:
+            heapq.heapreplace(self.worst, (seconds, sql))
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - started, sql)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, adding render times to the request's metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+
+
+_views = {}
+_lock = threading.Lock()
+
+
+def record(view, status, seconds, stats, response_bytes):
+    with _lock:
+        metrics = _views.get(view)
+        if metrics is None:
+            metrics = _views[view] = ViewMetrics()
+        metrics.duration.observe(seconds)
+        metrics.queries.observe(stats.queries)
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.sql_seconds += stats.sql_seconds
+        metrics.template_seconds += stats.template_seconds
+        metrics.response_bytes += response_bytes
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def render():
+    """Everything recorded so far in the Prometheus text exposition format."""
+    with _lock:
+        views = sorted(_views.items())
+        lines = [
+            "# HELP family_request_duration_seconds Request latency by URL name.",
+            "# TYPE family_request_duration_seconds histogram",
+        ]
+        for view, metrics in views:
+            lines.extend(metrics.duration.lines("family_request_duration_seconds", f'view="{view}"'))
+        lines += [
+            "# HELP family_request_sql_queries SQL queries per request by URL name.",
+            "# TYPE family_request_sql_queries histogram",
+        ]
+        for view, metrics in views:
+            lines.extend(metrics.queries.lines("family_request_sql_queries", f'view="{view}"'))
+        lines += ["# HELP family_requests_total Responses by URL name and status.", "# TYPE family_requests_total counter"]
+        for view, metrics in views:
+            lines.extend(
+                f'family_requests_total{{view="{view}",status="{status}"}} {count}'
+                for status, count in sorted(metrics.statuses.items())
+            )
+        for name, attribute, description in (
+            ("family_sql_seconds_total", "sql_seconds", "Time spent in SQL by URL name."),
+            ("family_template_render_seconds_total", "template_seconds", "Time spent rendering templates by URL name."),
+            ("family_response_bytes_total", "response_bytes", "Response body bytes by URL name (not streamed ones)."),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            lines.extend(f'{name}{{view="{view}"}} {getattr(metrics, attribute)}' for view, metrics in views)
+    return "\n".join(lines) + "\n"
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.view_name
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _finish(self, request, response, stats, seconds):
+        view = _view_name(request)
+        size = 0 if response.streaming else len(response.content)
+        record(view, response.status_code, seconds, stats, size)
+        if seconds >= settings.SLOW_REQUEST_SECONDS:
+            worst = "; ".join(f"{query_seconds * 1000:.1f}ms {sql[:200]}" for query_seconds, sql in sorted(stats.worst, reverse=True))
+            logger.warning(
+                "Slow request %s %s (%s): %.0fms, %d queries in %.0fms, templates %.0fms. Slowest queries: %s",
+                request.method, request.path, view, seconds * 1000, stats.queries, stats.sql_seconds * 1000,
+                stats.template_seconds * 1000, worst or "none",
+            )
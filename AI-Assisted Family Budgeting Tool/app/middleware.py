@@ -0,0 +1,38 @@
+"""
+Resolves the signed-in UserAccount once per request.
+
+login_view() keeps the account id in the session; CurrentAccountMiddleware
+loads the account through the account cache and sets ``request.account``
+(None when nobody is signed in). Views marked with @account_required are
+redirected to the login page before they run when there is no account.
+
+With a sharded database it first makes the account's shard the active one
+(see app.sharding), so every query the view runs goes to that database.
+"""
+from django.shortcuts import redirect
+from django.utils.deprecation import MiddlewareMixin
+
+from . import sharding
+from .caching import get_account
+
+
+def account_required(view):
+    """Only run ``view`` for a signed-in account; works for sync and async views."""
+    view.account_required = True
+    return view
+
+
+class CurrentAccountMiddleware(MiddlewareMixin):
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        user_id = request.session.get("user_id")
+        # Always set, so a worker thread never carries the previous request's shard over
+        shard = sharding.shard_of(user_id) if user_id else None
+        sharding.activate(shard)
+        request.account = get_account(user_id) if shard else None
+        if request.account is None and getattr(view_func, "account_required", False):
+            return redirect("login")
+        return None
+
+    def process_response(self, request, response):
+        sharding.activate(None)
+        return response
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_alter_useraccount_username'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSpendTotals',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='app.useraccount')),
+                ('mandatory', models.FloatField(default=0)),
+                ('basic_needs', models.FloatField(default=0)),
+                ('sudden_expenses', models.FloatField(default=0)),
+                ('savings', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MonthlySpendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('mandatory', models.FloatField(default=0)),
+                ('basic_needs', models.FloatField(default=0)),
+                ('sudden_expenses', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.useraccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month'), name='unique_rollup_per_user_month')],
+            },
+        ),
+    ]
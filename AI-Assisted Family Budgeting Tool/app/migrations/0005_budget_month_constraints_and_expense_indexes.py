@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def keep_latest_per_user_month(apps, schema_editor):
+    """
+    Re-saving the budget in first() used to insert a fresh BudgetDetails and
+    BudgetSummary row every time. The views always worked on the latest one
+    (``.last()``), so keep that and drop the older duplicates. Lifetime
+    savings are re-summed for every user that lost a summary row.
+    """
+    db = schema_editor.connection.alias  # also run on each shard database (see app.sharding)
+    affected_users = set()
+    for model_name in ("BudgetDetails", "BudgetSummary"):
+        model = apps.get_model("app", model_name)
+        duplicates = (
+            model.objects.using(db).values("user_id", "year", "month")
+            .annotate(rows=Count("id"), keep=Max("id"))
+            .filter(rows__gt=1)
+        )
+        for row in duplicates:
+            model.objects.using(db).filter(user_id=row["user_id"], year=row["year"], month=row["month"]).exclude(
+                id=row["keep"]
+            ).delete()
+            if model_name == "BudgetSummary":
+                affected_users.add(row["user_id"])
+
+    BudgetSummary = apps.get_model("app", "BudgetSummary")
+    UserSpendTotals = apps.get_model("app", "UserSpendTotals")
+    for user_id in affected_users:
+        savings = BudgetSummary.objects.using(db).filter(user_id=user_id).aggregate(total=Sum("savings"))["total"] or 0
+        UserSpendTotals.objects.using(db).filter(user_id=user_id).update(savings=savings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_spend_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_per_user_month, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='basicneedsexpense',
+            index=models.Index(fields=['user', 'timestamp'], name='basicneedsexpense_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mandatoryexpense',
+            index=models.Index(fields=['user', 'timestamp'], name='mandatoryexpense_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suddenexpense',
+            index=models.Index(fields=['user', 'timestamp'], name='suddenexpense_user_ts_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='budgetdetails',
+            constraint=models.UniqueConstraint(fields=('user', 'year', 'month'), name='unique_budget_per_user_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='budgetsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'year', 'month'), name='unique_summary_per_user_month'),
+        ),
+    ]
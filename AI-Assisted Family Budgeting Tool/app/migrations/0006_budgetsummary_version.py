@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_budget_month_constraints_and_expense_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetsummary',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_expense_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basicneedsexpense',
+            name='display_image',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='expenses/display/'),
+        ),
+        migrations.AddField(
+            model_name='basicneedsexpense',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='expenses/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='mandatoryexpense',
+            name='display_image',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='expenses/display/'),
+        ),
+        migrations.AddField(
+            model_name='mandatoryexpense',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='expenses/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='suddenexpense',
+            name='display_image',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='expenses/display/'),
+        ),
+        migrations.AddField(
+            model_name='suddenexpense',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='expenses/thumbs/'),
+        ),
+    ]
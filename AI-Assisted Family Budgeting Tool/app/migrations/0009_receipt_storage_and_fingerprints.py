@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:21
+
+import app.storage
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_expense_receipt_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='basicneedsexpense',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_receipt_storage, upload_to='expenses/'),
+        ),
+        migrations.AlterField(
+            model_name='mandatoryexpense',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_receipt_storage, upload_to='expenses/'),
+        ),
+        migrations.AlterField(
+            model_name='suddenexpense',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=app.storage.get_receipt_storage, upload_to='expenses/'),
+        ),
+        migrations.CreateModel(
+            name='ReceiptFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=20)),
+                ('expense_id', models.IntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('phash', models.BigIntegerField()),
+                ('band0', models.IntegerField()),
+                ('band1', models.IntegerField()),
+                ('band2', models.IntegerField()),
+                ('band3', models.IntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.useraccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'sha256'], name='receipt_user_sha_idx'), models.Index(fields=['user', 'band0'], name='receipt_user_band0_idx'), models.Index(fields=['user', 'band1'], name='receipt_user_band1_idx'), models.Index(fields=['user', 'band2'], name='receipt_user_band2_idx'), models.Index(fields=['user', 'band3'], name='receipt_user_band3_idx'), models.Index(fields=['category', 'expense_id'], name='receipt_expense_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_receipt_storage_and_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('mandatory', models.FloatField(default=0)),
+                ('basic_needs', models.FloatField(default=0)),
+                ('sudden_expenses', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.useraccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month'), name='unique_forecast_per_user_month')],
+            },
+        ),
+    ]
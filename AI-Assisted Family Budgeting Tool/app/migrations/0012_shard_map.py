@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_expense_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardMap',
+            fields=[
+                ('user_id', models.AutoField(primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=150, unique=True)),
+                ('phone_number', models.CharField(max_length=15, unique=True)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('shard', models.CharField(db_index=True, max_length=20)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_shard_map'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('months', models.JSONField(default=dict)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.useraccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year'), name='unique_archive_per_user_year')],
+            },
+        ),
+    ]
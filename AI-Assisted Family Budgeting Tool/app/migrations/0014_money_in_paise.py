@@ -0,0 +1,169 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:22
+
+import json
+import zlib
+
+import app.money
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Round
+
+# Model -> its amount columns, all FloatFields (rupees) before this migration
+MONEY_FIELDS = {
+    "BudgetDetails": ("actual_salary", "active_salary", "mandatory_limit", "basic_needs_limit", "sudden_expenses_limit"),
+    "MandatoryExpense": ("amount",),
+    "BasicNeedsExpense": ("amount",),
+    "SuddenExpense": ("amount",),
+    "BudgetSummary": ("mandatory", "basic_needs", "sudden_expenses", "savings"),
+    "MonthlySpendRollup": ("mandatory", "basic_needs", "sudden_expenses"),
+    "UserSpendTotals": ("mandatory", "basic_needs", "sudden_expenses", "savings"),
+    "SpendForecast": ("mandatory", "basic_needs", "sudden_expenses"),
+}
+ARCHIVE_TOTALS = ("mandatory", "basic_needs", "sudden_expenses")
+
+
+def _rescale(apps, schema_editor, column, amount):
+    """Apply column(F) to every money column and amount(value) to the amounts inside ExpenseArchive rows."""
+    db = schema_editor.connection.alias  # also run on each shard database (see app.sharding)
+    for model_name, fields in MONEY_FIELDS.items():
+        apps.get_model("app", model_name).objects.using(db).update(**{field: column(F(field)) for field in fields})
+
+    ExpenseArchive = apps.get_model("app", "ExpenseArchive")
+    for archive in ExpenseArchive.objects.using(db).iterator(chunk_size=100):
+        columns = json.loads(zlib.decompress(bytes(archive.data)))
+        columns["amount"] = [amount(value) for value in columns["amount"]]
+        archive.data = zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 9)
+        for totals in archive.months.values():
+            for field in ARCHIVE_TOTALS:
+                totals[field] = amount(totals[field])
+        archive.save(update_fields=["data", "months"])
+
+
+def rupees_to_paise(apps, schema_editor):
+    """Store every amount as whole paise; the AlterFields below then make the columns integers."""
+    _rescale(apps, schema_editor, lambda column: Round(column * 100), lambda value: round(value * 100))
+
+
+def paise_to_rupees(apps, schema_editor):
+    _rescale(apps, schema_editor, lambda column: column / 100.0, lambda value: value / 100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_expense_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(rupees_to_paise, paise_to_rupees),
+        migrations.AlterField(
+            model_name='basicneedsexpense',
+            name='amount',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetdetails',
+            name='active_salary',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetdetails',
+            name='actual_salary',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetdetails',
+            name='basic_needs_limit',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetdetails',
+            name='mandatory_limit',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetdetails',
+            name='sudden_expenses_limit',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetsummary',
+            name='basic_needs',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetsummary',
+            name='mandatory',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetsummary',
+            name='savings',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='budgetsummary',
+            name='sudden_expenses',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='mandatoryexpense',
+            name='amount',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='monthlyspendrollup',
+            name='basic_needs',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='monthlyspendrollup',
+            name='mandatory',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='monthlyspendrollup',
+            name='sudden_expenses',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='spendforecast',
+            name='basic_needs',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='spendforecast',
+            name='mandatory',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='spendforecast',
+            name='sudden_expenses',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='suddenexpense',
+            name='amount',
+            field=app.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='userspendtotals',
+            name='basic_needs',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userspendtotals',
+            name='mandatory',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userspendtotals',
+            name='savings',
+            field=app.money.MoneyField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userspendtotals',
+            name='sudden_expenses',
+            field=app.money.MoneyField(default=0),
+        ),
+    ]
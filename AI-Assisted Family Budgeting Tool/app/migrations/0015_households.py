@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:37
+
+import app.money
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_money_in_paise'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Household',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('code', models.CharField(max_length=16, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='useraccount',
+            name='household',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='members', to='app.household'),
+        ),
+        migrations.CreateModel(
+            name='HouseholdBudget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('mandatory_limit', app.money.MoneyField()),
+                ('basic_needs_limit', app.money.MoneyField()),
+                ('sudden_expenses_limit', app.money.MoneyField()),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.household')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('household', 'year', 'month'), name='unique_budget_per_household_month')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HouseholdRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('mandatory', app.money.MoneyField(default=0)),
+                ('basic_needs', app.money.MoneyField(default=0)),
+                ('sudden_expenses', app.money.MoneyField(default=0)),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.household')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('household', 'year', 'month'), name='unique_rollup_per_household_month')],
+            },
+        ),
+    ]
@@ -1,4 +1,19 @@
 from django.db import models
+from django.utils import timezone
+
+from .money import MoneyField
+from .storage import get_receipt_storage
+
+
+class Household(models.Model):
+    """Several accounts sharing a budget; members join with ``code`` (see app.households)."""
+    name = models.CharField(max_length=100)
+    code = models.CharField(max_length=16, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
 
 class UserAccount(models.Model):
     user_id = models.AutoField(primary_key=True)  # Explicit primary key
@@ -6,6 +21,7 @@ class UserAccount(models.Model):
     phone_number = models.CharField(max_length=15, unique=True)
     email = models.EmailField(unique=True)
     password = models.CharField(max_length=255)  # Store hashed passwords in production
+    household = models.ForeignKey(Household, on_delete=models.SET_NULL, null=True, blank=True, related_name="members")
 
     def __str__(self):
         return self.username
@@ -15,60 +31,262 @@ class BudgetDetails(models.Model):
     user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")  # Use user_id as FK
     month = models.IntegerField()
     year = models.IntegerField()
-    actual_salary = models.FloatField() 
-    active_salary = models.FloatField()
-    mandatory_limit = models.FloatField()
-    basic_needs_limit = models.FloatField()             
-    sudden_expenses_limit = models.FloatField()
+    actual_salary = MoneyField()
+    active_salary = MoneyField()
+    mandatory_limit = MoneyField()
+    basic_needs_limit = MoneyField()
+    sudden_expenses_limit = MoneyField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year", "month"], name="unique_budget_per_user_month"),
+        ]
 
     def __str__(self):
         return f"Budget for {self.month}/{self.year} - {self.user.username}"
 
 
-class MandatoryExpense(models.Model):
+class ExpenseBase(models.Model):
+    """Columns shared by the three expense tables."""
     id = models.AutoField(primary_key=True)
     user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")  # Use user_id as FK
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)  # Settable so imports keep the statement date
     expense = models.CharField(max_length=255)
-    amount = models.FloatField()
-    image = models.ImageField(upload_to='expenses/', null=True, blank=True) 
+    amount = MoneyField()
+    image = models.ImageField(upload_to='expenses/', storage=get_receipt_storage, null=True, blank=True) 
+    # Compressed copies of the receipt, filled in by app.receipts after upload
+    thumbnail = models.ImageField(upload_to='expenses/thumbs/', null=True, blank=True, editable=False)
+    display_image = models.ImageField(upload_to='expenses/display/', null=True, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+        # Every hot query is "this user's expenses in this month"
+        indexes = [
+            models.Index(fields=["user", "timestamp"], name="%(class)s_user_ts_idx"),
+        ]
 
     def __str__(self):  
         return f"{self.expense} - {self.amount} ({self.user.username})"
 
 
-class BasicNeedsExpense(models.Model):
-    id = models.AutoField(primary_key=True)
-    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")  # Use user_id as FK
-    timestamp = models.DateTimeField(auto_now_add=True)
-    expense = models.CharField(max_length=255)
-    amount = models.FloatField()
-    image = models.ImageField(upload_to='expenses/', null=True, blank=True) 
+class MandatoryExpense(ExpenseBase):
+    pass
 
-    def __str__(self):
-        return f"{self.expense} - {self.amount} ({self.user.username})"
 
+class BasicNeedsExpense(ExpenseBase):
+    pass
 
-class SuddenExpense(models.Model):
-    id = models.AutoField(primary_key=True)
-    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")  # Use user_id as FK
-    timestamp = models.DateTimeField(auto_now_add=True)
-    expense = models.CharField(max_length=255)
-    amount = models.FloatField()
-    image = models.ImageField(upload_to='expenses/', null=True, blank=True) 
 
-    def __str__(self):
-        return f"{self.expense} - {self.amount} ({self.user.username})"
+class SuddenExpense(ExpenseBase):
+    pass
 
 
 class BudgetSummary(models.Model):
     user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")  # Use user_id as FK
     month = models.IntegerField()
     year = models.IntegerField()
-    mandatory = models.FloatField()
-    basic_needs = models.FloatField()
-    sudden_expenses = models.FloatField()
-    savings = models.FloatField()   
+    mandatory = MoneyField()
+    basic_needs = MoneyField()
+    sudden_expenses = MoneyField()
+    savings = MoneyField()
+    version = models.PositiveIntegerField(default=0)  # Bumped on every update, used for compare-and-swap
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year", "month"], name="unique_summary_per_user_month"),
+        ]
 
     def __str__(self):
         return f"Summary for {self.month}/{self.year} - {self.user.username}"
+
+
+class MonthlySpendRollup(models.Model):
+    """Running per-category spend for one user-month, kept in step with the expense tables."""
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")
+    month = models.IntegerField()
+    year = models.IntegerField()
+    mandatory = MoneyField(default=0)
+    basic_needs = MoneyField(default=0)
+    sudden_expenses = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year", "month"], name="unique_rollup_per_user_month"),
+        ]
+
+    def __str__(self):
+        return f"Rollup for {self.month}/{self.year} - {self.user.username}"
+
+
+class HouseholdBudget(models.Model):
+    """The limits a household shares for one month."""
+    household = models.ForeignKey(Household, on_delete=models.CASCADE)
+    month = models.IntegerField()
+    year = models.IntegerField()
+    mandatory_limit = MoneyField()
+    basic_needs_limit = MoneyField()
+    sudden_expenses_limit = MoneyField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["household", "year", "month"], name="unique_budget_per_household_month"),
+        ]
+
+    def __str__(self):
+        return f"Budget for {self.month}/{self.year} - {self.household.name}"
+
+
+class HouseholdRollup(models.Model):
+    """
+    Running per-category spend of all of a household's members for one month,
+    bumped with every member's MonthlySpendRollup (see app.rollups).
+    """
+    household = models.ForeignKey(Household, on_delete=models.CASCADE)
+    month = models.IntegerField()
+    year = models.IntegerField()
+    mandatory = MoneyField(default=0)
+    basic_needs = MoneyField(default=0)
+    sudden_expenses = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["household", "year", "month"], name="unique_rollup_per_household_month"),
+        ]
+
+    def __str__(self):
+        return f"Rollup for {self.month}/{self.year} - {self.household.name}"
+
+
+class UserSpendTotals(models.Model):
+    """Lifetime spend per category and total savings for one user."""
+    user = models.OneToOneField(UserAccount, on_delete=models.CASCADE, to_field="user_id", primary_key=True)
+    mandatory = MoneyField(default=0)
+    basic_needs = MoneyField(default=0)
+    sudden_expenses = MoneyField(default=0)
+    savings = MoneyField(default=0)
+
+    def __str__(self):
+        return f"Totals - {self.user.username}"
+
+
+class ExpenseStats(models.Model):
+    """
+    Running statistics of one user's expense amounts in one category, kept up
+    to date on every insert and delete by app.anomalies: count, mean and sum
+    of squared deviations (Welford), plus a log-bucketed histogram of the
+    amounts ({bucket: count}) for approximate quantiles.
+    """
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")
+    category = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    sketch = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category"], name="unique_stats_per_user_category"),
+        ]
+
+    def __str__(self):
+        return f"{self.category} stats - {self.user.username}"
+
+
+class SpendForecast(models.Model):
+    """
+    Projected month-end spend per category, written in bulk by the
+    forecast_spending command (see app.forecast) and shown on home().
+    """
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")
+    month = models.IntegerField()
+    year = models.IntegerField()
+    mandatory = MoneyField(default=0)
+    basic_needs = MoneyField(default=0)
+    sudden_expenses = MoneyField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year", "month"], name="unique_forecast_per_user_month"),
+        ]
+
+    def __str__(self):
+        return f"Forecast - {self.user.username} ({self.month}/{self.year})"
+
+
+class ReceiptFingerprint(models.Model):
+    """
+    Exact (SHA-256) and perceptual (64-bit dHash) fingerprint of the receipt
+    attached to one expense. The dHash is also split into four 16-bit bands,
+    each indexed together with the user, so near-duplicates can be found with
+    index lookups: two hashes within 3 bits of each other must agree on at
+    least one band.
+    """
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")
+    category = models.CharField(max_length=20)
+    expense_id = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+    phash = models.BigIntegerField()
+    band0 = models.IntegerField()
+    band1 = models.IntegerField()
+    band2 = models.IntegerField()
+    band3 = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "sha256"], name="receipt_user_sha_idx"),
+            models.Index(fields=["user", "band0"], name="receipt_user_band0_idx"),
+            models.Index(fields=["user", "band1"], name="receipt_user_band1_idx"),
+            models.Index(fields=["user", "band2"], name="receipt_user_band2_idx"),
+            models.Index(fields=["user", "band3"], name="receipt_user_band3_idx"),
+            models.Index(fields=["category", "expense_id"], name="receipt_expense_idx"),
+        ]
+
+    def __str__(self):
+        return f"Receipt of {self.category} expense {self.expense_id} - {self.user.username}"
+
+
+class ExpenseArchive(models.Model):
+    """
+    One user's archived expenses for one year, moved out of the expense tables
+    by the close_months command (see app.archive): every row, as compressed
+    JSON columns in ``data``, and {"<month>": {field: paise, "count": n}} in
+    ``months`` so totals can be read without unpacking.
+    """
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, to_field="user_id")
+    year = models.IntegerField()
+    months = models.JSONField(default=dict)
+    rows = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year"], name="unique_archive_per_user_year"),
+        ]
+
+    def __str__(self):
+        return f"Archive {self.year} - {self.user.username}"
+
+
+class ShardMap(models.Model):
+    """
+    Which shard database holds each family when settings.FAMILY_SHARDS is set
+    (see app.sharding). Lives on the default database, where it also hands
+    out user ids and keeps usernames, emails and phone numbers unique across
+    shards, so logins and registrations are checked without visiting them.
+    """
+    user_id = models.AutoField(primary_key=True)
+    username = models.CharField(max_length=150, unique=True)
+    phone_number = models.CharField(max_length=15, unique=True)
+    email = models.EmailField(unique=True)
+    shard = models.CharField(max_length=20, db_index=True)
+
+    def __str__(self):
+        return f"{self.username} on {self.shard}"
+
+# Expense category (as posted by the home.html form) -> (expense model, rollup/summary field)
+EXPENSE_CATEGORIES = {
+    "Mandatory": (MandatoryExpense, "mandatory"),
+    "Basic Needs": (BasicNeedsExpense, "basic_needs"),
+    "Sudden Expense": (SuddenExpense, "sudden_expenses"),
+}
@@ -0,0 +1,86 @@
+"""
+Money amounts: whole paise in the database, Decimal rupees in Python.
+
+Every amount column is a MoneyField, an integer column holding paise, so the
+database adds and sums them exactly (and SQLite stores them as 1-4 byte
+integers instead of 8 byte floats). Model instances, values() rows and
+aggregates hand back Decimals with two places, whose arithmetic is exact too;
+floats only appear at the edges (JSON, NumPy), through float().
+
+Values are converted on the way in from str, int, float or Decimal, rounded
+half-up to the paisa. Database-side arithmetic needs the other operand typed
+as money as well, so F(field) + amount is written F(field) + literal(amount):
+a bare Decimal would be sent as rupees and added to paise.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+from django.db.models import BigIntegerField, ExpressionWrapper, F, Value
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+PAISA = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def rupees(value):
+    """``value`` (str, int, float or Decimal) as Decimal rupees rounded to the paisa; raises ValueError."""
+    if isinstance(value, Decimal):
+        amount = value
+    else:
+        try:
+            # str() of a float is its shortest repr, so 0.1 is 0.10 and not 0.1000000000000000055...
+            amount = Decimal(value if isinstance(value, int) else str(value).strip())
+        except InvalidOperation:
+            raise ValueError(f"{value!r} is not an amount") from None
+    if not amount.is_finite():
+        raise ValueError(f"{value!r} is not an amount")
+    return amount.quantize(PAISA, rounding=ROUND_HALF_UP)
+
+
+def to_paise(value):
+    return int(rupees(value).scaleb(2))
+
+
+def from_paise(paise):
+    return Decimal(paise).scaleb(-2)
+
+
+def literal(amount):
+    """``amount`` as a money-typed SQL value, for F() arithmetic on MoneyFields."""
+    return Value(rupees(amount), output_field=MoneyField())
+
+
+def paise(field):
+    """The raw paise of a MoneyField as a plain integer expression, for bulk numeric loads (NumPy)."""
+    return ExpressionWrapper(F(field), output_field=BigIntegerField())
+
+
+class MoneyField(models.BigIntegerField):
+    description = "Amount of money (stored in paise)"
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_paise(value)
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        try:
+            return rupees(value)
+        except ValueError:
+            raise exceptions.ValidationError(
+                self.error_messages["invalid"], code="invalid", params={"value": value}
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return None if value is None else to_paise(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{"form_class": forms.DecimalField, "decimal_places": 2, **kwargs})
+
+
+# IntegerField rounds float bounds of these two up to a whole number first, which would be whole rupees here
+MoneyField.register_lookup(GreaterThanOrEqual)
+MoneyField.register_lookup(LessThan)
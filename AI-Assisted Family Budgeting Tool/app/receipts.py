@@ -0,0 +1,117 @@
+"""
+Display versions and thumbnails of receipt images.
+
+Uploads are stored untouched; once the expense has been committed the image
+is handed to a small background worker pool that writes a size-capped JPEG
+for the click-through view and a small thumbnail for the history table, and
+records both on the expense row.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections
+from PIL import Image, ImageOps
+
+from . import sharding
+from .models import EXPENSE_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+# Variant -> (expense field, directory, longest side in px, JPEG quality)
+VARIANTS = {
+    "thumbnail": ("thumbnail", "expenses/thumbs", 160, 70),
+    "display": ("display_image", "expenses/display", 1600, 80),
+}
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "RECEIPT_WORKERS", 2), thread_name_prefix="receipts"
+        )
+    return _executor
+
+
+def variant_name(name, variant):
+    """expenses/pan_card.jpg -> expenses/thumbs/pan_card.jpg.jpg"""
+    _, directory, _, _ = VARIANTS[variant]
+    return f"{directory}/{os.path.basename(name)}.jpg"
+
+
+def _encode(image, longest_side, quality):
+    copy = image.copy()
+    copy.thumbnail((longest_side, longest_side), Image.LANCZOS)
+    out = io.BytesIO()
+    copy.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def render_variants(name):
+    """
+    Write every variant of the stored image ``name`` and return
+    {expense field: stored variant name}.
+    """
+    with default_storage.open(name, "rb") as handle:
+        image = Image.open(handle)
+        image.draft("RGB", (VARIANTS["display"][2],) * 2)  # let JPEG decode at reduced size
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white, which is what receipts are printed on
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    stored = {}
+    for variant, (field, _, longest_side, quality) in VARIANTS.items():
+        target = variant_name(name, variant)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        stored[field] = default_storage.save(target, ContentFile(_encode(image, longest_side, quality)))
+    return stored
+
+
+def process_expense(category, expense_id):
+    """Render the variants for one expense and record them on its row."""
+    model, _ = EXPENSE_CATEGORIES[category]
+    name = model.objects.filter(pk=expense_id).values_list("image", flat=True).first()
+    if not name:
+        return None
+    stored = render_variants(name)
+    model.objects.filter(pk=expense_id).update(**stored)
+    return stored
+
+
+def _run_in_background(alias, category, expense_id):
+    close_old_connections()
+    try:
+        with sharding.using(alias):
+            process_expense(category, expense_id)
+    except Exception:
+        logger.exception("Could not process receipt for %s expense %s", category, expense_id)
+    finally:
+        connections[alias].close()
+
+
+def schedule(category, expense):
+    """
+    Queue an expense's receipt for processing once the current transaction
+    commits. With settings.RECEIPT_PROCESS_INLINE it runs synchronously instead.
+    """
+    if not expense.image:
+        return
+    if getattr(settings, "RECEIPT_PROCESS_INLINE", False):
+        sharding.on_commit(lambda: process_expense(category, expense.pk))
+    else:
+        alias = sharding.db()  # the worker thread does not inherit the active shard
+        sharding.on_commit(lambda: _pool().submit(_run_in_background, alias, category, expense.pk))
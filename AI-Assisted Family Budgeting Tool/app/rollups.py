@@ -0,0 +1,242 @@
+"""
+Incrementally maintained spend rollups.
+
+Every expense insert/delete and every savings change goes through the helpers
+below, inside the same transaction as the write itself and *after* the raw row
+has been written, so the dashboard can read one MonthlySpendRollup /
+UserSpendTotals row instead of re-summing the whole expense history.
+Amounts are integer paise in the database (see app.money), so the running
+totals stay exactly equal to the raw sums.
+
+A member of a household also bumps the household's HouseholdRollup for the
+same month with every change, in the same transaction, so the household
+dashboard reads one row however many members there are. Those rows always
+equal the sum of the members' MonthlySpendRollup rows (check_household()).
+"""
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from . import archive, money, sharding
+from .models import BudgetSummary, EXPENSE_CATEGORIES, HouseholdRollup, MonthlySpendRollup, UserAccount, UserSpendTotals
+
+CATEGORY_FIELDS = ("mandatory", "basic_needs", "sudden_expenses")
+
+
+def _totals_and_household(user):
+    """
+    (whether the user's totals row exists, the user's household id). Both come
+    from one query, in the write's transaction rather than from the (possibly
+    cached) account, so a write racing a join or leave lands on the side the
+    membership ends up on.
+    """
+    row = UserSpendTotals.objects.filter(user=user).values_list("user__household_id").first()
+    if row is not None:
+        return True, row[0]
+    # First write for this account: the raw tables already contain the change,
+    # so building the rollups from them is enough.
+    rebuild_user(user)
+    return False, UserAccount.objects.filter(pk=user.pk).values_list("household_id", flat=True).first()
+
+
+def _has_totals(user):
+    return _totals_and_household(user)[0]
+
+
+def _bump_household(household_id, deltas):
+    """Add ``deltas``, (year, month) -> {field: amount}, to the household's rollup (None: not in one)."""
+    if household_id is None:
+        return
+    for (year, month), values in deltas.items():
+        HouseholdRollup.objects.get_or_create(household_id=household_id, month=month, year=year)
+        HouseholdRollup.objects.filter(household_id=household_id, month=month, year=year).update(
+            **{field: F(field) + money.literal(amount) for field, amount in values.items()}
+        )
+
+
+def _bump(user, field, amount, month, year):
+    has_totals, household_id = _totals_and_household(user)
+    _bump_household(household_id, {(year, month): {field: amount}})
+    if not has_totals:
+        return
+    MonthlySpendRollup.objects.get_or_create(user=user, month=month, year=year)
+    amount = money.literal(amount)
+    MonthlySpendRollup.objects.filter(user=user, month=month, year=year).update(**{field: F(field) + amount})
+    UserSpendTotals.objects.filter(user=user).update(**{field: F(field) + amount})
+
+
+def record_expense(user, category, amount, timestamp):
+    """Add a newly saved expense to the user's monthly and lifetime rollups."""
+    _, field = EXPENSE_CATEGORIES[category]
+    _bump(user, field, amount, timestamp.month, timestamp.year)
+
+
+def remove_expense(user, category, amount, timestamp):
+    """Take a deleted expense back out of the user's rollups."""
+    _, field = EXPENSE_CATEGORIES[category]
+    _bump(user, field, -amount, timestamp.month, timestamp.year)
+
+
+def record_bulk(user, deltas):
+    """
+    Add a batch of saved expenses to the rollups in one go.
+    ``deltas`` maps (year, month) -> {field: amount}.
+    """
+    has_totals, household_id = _totals_and_household(user)
+    _bump_household(household_id, deltas)
+    if not has_totals:
+        return
+    lifetime = dict.fromkeys(CATEGORY_FIELDS, 0)
+    for (year, month), values in deltas.items():
+        MonthlySpendRollup.objects.get_or_create(user=user, month=month, year=year)
+        MonthlySpendRollup.objects.filter(user=user, month=month, year=year).update(
+            **{field: F(field) + money.literal(amount) for field, amount in values.items()}
+        )
+        for field, amount in values.items():
+            lifetime[field] += amount
+    UserSpendTotals.objects.filter(user=user).update(
+        **{field: F(field) + money.literal(amount) for field, amount in lifetime.items()}
+    )
+
+
+def adjust_savings(user, delta):
+    """Apply a change made to some BudgetSummary.savings to the lifetime savings total."""
+    if not delta or not _has_totals(user):
+        return
+    UserSpendTotals.objects.filter(user=user).update(savings=F("savings") + money.literal(delta))
+
+
+def draw_savings(user, amount):
+    """
+    Take ``amount`` out of the lifetime savings total if there is enough.
+    The check and the update are one statement, so concurrent draws cannot
+    overspend. Returns whether the draw happened.
+    """
+    return bool(
+        UserSpendTotals.objects.filter(user=user, savings__gte=amount).update(savings=F("savings") - money.literal(amount))
+    )
+
+
+def get_totals(user):
+    """
+    Return the user's UserSpendTotals row, building it from the raw tables the
+    first time it is needed (new users, or accounts that predate the rollups).
+    """
+    totals = UserSpendTotals.objects.filter(user=user).first()
+    if totals is None:
+        totals = rebuild_user(user)
+    return totals
+
+
+def get_month(user, month, year):
+    """Return the user's rollup for one month (unsaved and zeroed if nothing was spent)."""
+    rollup = MonthlySpendRollup.objects.filter(user=user, month=month, year=year).first()
+    return rollup or MonthlySpendRollup(user=user, month=month, year=year)
+
+
+def _raw_monthly(user):
+    """{(year, month): {field: total}} summed straight from the expense tables and the user's archives."""
+    months = {key: dict(values) for key, values in archive.raw_monthly(user).items()}
+    for model, field in EXPENSE_CATEGORIES.values():
+        rows = (
+            model.objects.filter(user=user)
+            .annotate(y=ExtractYear("timestamp"), m=ExtractMonth("timestamp"))
+            .values("y", "m")
+            .annotate(total=Sum("amount"))
+        )
+        for row in rows:
+            months.setdefault((row["y"], row["m"]), dict.fromkeys(CATEGORY_FIELDS, 0))[field] += row["total"] or 0
+    return months
+
+
+def _raw_savings(user):
+    return BudgetSummary.objects.filter(user=user).aggregate(total=Sum("savings"))["total"] or 0
+
+
+@sharding.atomic
+def rebuild_user(user):
+    """Recompute all of a user's rollup rows from the raw tables."""
+    months = _raw_monthly(user)
+    MonthlySpendRollup.objects.filter(user=user).delete()
+    MonthlySpendRollup.objects.bulk_create(
+        MonthlySpendRollup(user=user, year=year, month=month, **values)
+        for (year, month), values in months.items()
+    )
+
+    lifetime = dict.fromkeys(CATEGORY_FIELDS, 0)
+    for values in months.values():
+        for field in CATEGORY_FIELDS:
+            lifetime[field] += values[field]
+
+    totals, _ = UserSpendTotals.objects.update_or_create(
+        user=user, defaults={**lifetime, "savings": _raw_savings(user)}
+    )
+    return totals
+
+
+def check_consistency(user):
+    """
+    Compare the user's rollups against the raw tables.
+    Returns a list of human readable mismatches (empty when consistent).
+    """
+    problems = []
+    raw = _raw_monthly(user)
+    stored = {
+        (r.year, r.month): r for r in MonthlySpendRollup.objects.filter(user=user)
+    }
+
+    for key in sorted(set(raw) | set(stored)):
+        for field in CATEGORY_FIELDS:
+            expected = raw.get(key, {}).get(field, 0)
+            actual = getattr(stored[key], field) if key in stored else 0
+            if expected != actual:
+                problems.append(f"{key[1]}/{key[0]} {field}: rollup={actual} raw={expected}")
+
+    totals = UserSpendTotals.objects.filter(user=user).first()
+    if totals is None:
+        if raw or _raw_savings(user):
+            problems.append("missing lifetime totals row")
+        return problems
+
+    for field in CATEGORY_FIELDS:
+        expected = sum(values[field] for values in raw.values())
+        if expected != getattr(totals, field):
+            problems.append(f"lifetime {field}: rollup={getattr(totals, field)} raw={expected}")
+
+    expected_savings = _raw_savings(user)
+    if expected_savings != totals.savings:
+        problems.append(f"lifetime savings: rollup={totals.savings} raw={expected_savings}")
+    return problems
+
+
+def _member_monthly(household):
+    """{(year, month): {field: total}} summed over the members' MonthlySpendRollup rows."""
+    rows = (
+        MonthlySpendRollup.objects.filter(user__household=household)
+        .values("year", "month")
+        .annotate(**{field: Sum(field) for field in CATEGORY_FIELDS})
+    )
+    return {(row["year"], row["month"]): {field: row[field] for field in CATEGORY_FIELDS} for row in rows}
+
+
+@sharding.atomic
+def rebuild_household(household):
+    """Recompute a household's rollup rows from its members' rollups."""
+    HouseholdRollup.objects.filter(household=household).delete()
+    HouseholdRollup.objects.bulk_create(
+        HouseholdRollup(household=household, year=year, month=month, **values)
+        for (year, month), values in _member_monthly(household).items()
+    )
+
+
+def check_household(household):
+    """Compare a household's rollups against its members' rollups; mismatches as in check_consistency()."""
+    problems = []
+    expected = _member_monthly(household)
+    stored = {(r.year, r.month): r for r in HouseholdRollup.objects.filter(household=household)}
+    for key in sorted(set(expected) | set(stored)):
+        for field in CATEGORY_FIELDS:
+            want = expected.get(key, {}).get(field, 0)
+            actual = getattr(stored[key], field) if key in stored else 0
+            if want != actual:
+                problems.append(f"{key[1]}/{key[0]} {field}: household rollup={actual} members={want}")
+    return problems
@@ -0,0 +1,347 @@
+"""
+Opt-in per-family database sharding.
+
+With settings.FAMILY_SHARDS = N (> 0) every UserAccount and all of its rows
+(budgets, summaries, expenses, rollups, statistics, forecasts, fingerprints)
+live on one of the databases shard0..shard{N-1}, so writes for different
+families no longer queue behind one SQLite lock. The default database keeps
+Django's own tables and the ShardMap: user id -> shard, plus the unique
+username, email and phone number, so logins and registrations are looked up
+there once and the ids stay globally unique.
+
+A new family's shard is a jump consistent hash of its user id: stable, evenly
+spread, and when N grows only about 1/N of the families have a new home
+shard. rebalance_shards moves them (or any one family) with move_user().
+
+ShardRouter sends queries for the app's models to the *active* shard, a
+context variable that CurrentAccountMiddleware sets from the signed-in user
+(and management commands set with using() or each()). Code that runs without
+an active shard and touches family data fails loudly instead of silently
+reading the default database. Without sharding none of this is installed,
+db() is "default" and everything behaves exactly as before.
+
+A household (app.households) and all of its members share one shard: members
+are moved there when they join, and are left out of misplaced() and refused
+by move_user() afterwards.
+"""
+import contextlib
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import Sum
+
+from .models import (
+    BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES, ExpenseArchive, ExpenseStats, MonthlySpendRollup,
+    ReceiptFingerprint, ShardMap, SpendForecast, UserAccount, UserSpendTotals,
+)
+
+SHARD_TIMEOUT = 60 * 60
+LEGACY_SHARD = "default"  # families created before sharding was turned on
+
+# Everything a family owns, in an order that satisfies the foreign keys (the account goes first)
+FAMILY_MODELS = (
+    BudgetDetails, BudgetSummary, *(model for model, _ in EXPENSE_CATEGORIES.values()),
+    MonthlySpendRollup, UserSpendTotals, ExpenseStats, SpendForecast, ReceiptFingerprint, ExpenseArchive,
+)
+
+_active = contextvars.ContextVar("active_shard", default=None)
+
+
+class ShardNotSelected(RuntimeError):
+    pass
+
+
+def enabled():
+    return getattr(settings, "FAMILY_SHARDS", 0) > 0
+
+
+def aliases():
+    """The shard database aliases, or just "default" without sharding."""
+    if not enabled():
+        return ["default"]
+    return [f"shard{index}" for index in range(settings.FAMILY_SHARDS)]
+
+
+def _jump_hash(key, buckets):
+    """Lamping & Veach's jump consistent hash: key -> bucket in [0, buckets)."""
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (1 << 31) / ((key >> 33) + 1))
+    return bucket
+
+
+def home_shard(user_id):
+    """The shard a family belongs on with the current number of shards."""
+    if not enabled():
+        return "default"
+    return f"shard{_jump_hash(int(user_id), settings.FAMILY_SHARDS)}"
+
+
+def db():
+    """The database alias family data is read from and written to right now."""
+    return _active.get() or "default"
+
+
+def activate(alias):
+    """Make ``alias`` the active shard for the rest of this context (None clears it)."""
+    _active.set(alias)
+
+
+@contextlib.contextmanager
+def using(alias):
+    token = _active.set(alias)
+    try:
+        yield alias
+    finally:
+        _active.reset(token)
+
+
+def each():
+    """Iterate over the shards with each one active in turn, e.g. for commands covering every family."""
+    for alias in aliases():
+        with using(alias):
+            yield alias
+
+
+def atomic(func=None):
+    """
+    transaction.atomic() on the active shard. Works as a context manager,
+    atomic(), or as a decorator, @atomic, resolving the shard on every call.
+    """
+    if func is None:
+        return transaction.atomic(using=db())
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        with transaction.atomic(using=db()):
+            return func(*args, **kwargs)
+    return inner
+
+
+def on_commit(func):
+    """transaction.on_commit() for the active shard's transaction."""
+    transaction.on_commit(func, using=db())
+
+
+def fan_out(func, *args):
+    """
+    Run ``func(*args)`` once per shard, in parallel threads, each with its
+    shard active. Returns {alias: result}.
+    """
+    names = aliases()
+    if len(names) == 1:
+        with using(names[0]):
+            return {names[0]: func(*args)}
+
+    def run(alias):
+        try:
+            with using(alias):
+                return func(*args)
+        finally:
+            connections[alias].close()  # the worker thread's own connection
+
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        return dict(zip(names, pool.map(run, names)))
+
+
+def _cache():
+    return caches[getattr(settings, "DASHBOARD_CACHE", "default")]
+
+
+def shard_key(user_id):
+    return f"shard:{user_id}"
+
+
+def shard_of(user_id):
+    """The shard holding this family (None if it is not in the shard map), cached for SHARD_TIMEOUT."""
+    if not enabled():
+        return "default"
+    key = shard_key(user_id)
+    alias = _cache().get(key)
+    if alias is None:
+        alias = ShardMap.objects.filter(user_id=user_id).values_list("shard", flat=True).first()
+        if alias is not None:
+            _cache().set(key, alias, SHARD_TIMEOUT)
+    return alias
+
+
+def account_exists(**lookup):
+    """Whether a family with e.g. username=... exists on any shard."""
+    if not enabled():
+        return UserAccount.objects.filter(**lookup).exists()
+    return ShardMap.objects.filter(**lookup).exists()
+
+
+def find_account(**lookup):
+    """
+    The UserAccount matching e.g. username=..., wherever it lives, or None.
+    The instance remembers its database (``account._state.db``), so
+    ``using(account._state.db)`` makes its shard active.
+    """
+    if not enabled():
+        return UserAccount.objects.filter(**lookup).first()
+    entry = ShardMap.objects.filter(**lookup).first()
+    if entry is None:
+        return None
+    return UserAccount.objects.using(entry.shard).filter(user_id=entry.user_id).first()
+
+
+def create_account(username, phone_number, email, password):
+    """
+    Save a new UserAccount (``password`` already hashed). When sharded its id
+    and unique fields are claimed in the shard map first, in a transaction
+    that rolls back if the account cannot be saved on its shard.
+    """
+    if not enabled():
+        return UserAccount.objects.create(username=username, phone_number=phone_number, email=email, password=password)
+    with transaction.atomic(using="default"):
+        entry = ShardMap.objects.create(username=username, phone_number=phone_number, email=email)
+        entry.shard = home_shard(entry.user_id)
+        entry.save(update_fields=["shard"])
+        return UserAccount.objects.using(entry.shard).create(
+            user_id=entry.user_id, username=username, phone_number=phone_number, email=email, password=password,
+        )
+
+
+def adopt_legacy_accounts():
+    """
+    Add the families still in the default database (created before sharding
+    was turned on) to the shard map, on LEGACY_SHARD, so move_user() can
+    move them. Returns how many were added.
+    """
+    if "app_useraccount" not in connections["default"].introspection.table_names():
+        return 0
+    mapped = set(ShardMap.objects.values_list("user_id", flat=True))
+    entries = [
+        ShardMap(user_id=user_id, username=username, phone_number=phone_number, email=email, shard=LEGACY_SHARD)
+        for user_id, username, phone_number, email in UserAccount.objects.using(LEGACY_SHARD).values_list(
+            "user_id", "username", "phone_number", "email"
+        )
+        if user_id not in mapped
+    ]
+    ShardMap.objects.bulk_create(entries)
+    return len(entries)
+
+
+def _copy_family(account, source, target):
+    """Copy an account and its rows from source to target; expenses get new ids there."""
+    rows = {model: list(model.objects.using(source).filter(user_id=account.user_id)) for model in FAMILY_MODELS}
+    # Leftovers of an interrupted move; deleted with the target active so the signal handlers look there
+    with using(target):
+        UserAccount.objects.using(target).filter(user_id=account.user_id).delete()
+    account.save(using=target, force_insert=True)
+
+    new_ids = {}
+    for category, (model, _) in EXPENSE_CATEGORIES.items():
+        old = [expense.pk for expense in rows[model]]
+        for expense in rows[model]:
+            expense.pk = None
+            expense._state.adding = True
+        created = model.objects.using(target).bulk_create(rows.pop(model), batch_size=2000)
+        new_ids[category] = dict(zip(old, (expense.pk for expense in created)))
+
+    for fingerprint in rows[ReceiptFingerprint]:
+        fingerprint.expense_id = new_ids[fingerprint.category].get(fingerprint.expense_id, fingerprint.expense_id)
+    for model, objects in rows.items():
+        if model is not UserSpendTotals:  # keyed by the user, which keeps its id
+            for instance in objects:
+                instance.pk = None
+                instance._state.adding = True
+        model.objects.using(target).bulk_create(objects, batch_size=2000)
+    return sum(len(ids) for ids in new_ids.values())
+
+
+def move_user(user_id, target):
+    """
+    Move a family to the ``target`` shard: copy its rows there, point the
+    shard map at it, then delete the originals. A crash part-way leaves the
+    family readable where the map points. Returns the number of expenses moved.
+    """
+    entry = ShardMap.objects.get(user_id=user_id)
+    source = entry.shard
+    if source == target:
+        return 0
+    account = UserAccount.objects.using(source).get(user_id=user_id)
+    if account.household_id is not None:
+        raise ValueError(f"{account.username} is in a household, which stays on {source} with all of its members")
+
+    with transaction.atomic(using=target):
+        moved = _copy_family(account, source, target)
+    entry.shard = target
+    entry.save(update_fields=["shard"])
+    with using(source), transaction.atomic(using=source):
+        UserAccount.objects.using(source).filter(user_id=user_id).delete()
+
+    from . import caching  # caching imports this module
+    _cache().delete_many([shard_key(user_id), caching.account_key(user_id)])
+    caching.invalidate_dashboard(user_id)
+    return moved
+
+
+def misplaced():
+    """ShardMap entries whose family is not on its home shard, e.g. after N changed (household members excepted)."""
+    entries = [entry for entry in ShardMap.objects.order_by("user_id") if entry.shard != home_shard(entry.user_id)]
+    pinned = set()
+    for alias in {entry.shard for entry in entries}:
+        pinned.update(UserAccount.objects.using(alias).filter(household__isnull=False).values_list("user_id", flat=True))
+    return [entry for entry in entries if entry.user_id not in pinned]
+
+
+def _shard_summary():
+    totals = UserSpendTotals.objects.aggregate(
+        mandatory=Sum("mandatory"), basic_needs=Sum("basic_needs"), sudden_expenses=Sum("sudden_expenses"),
+    )
+    return {
+        "users": UserAccount.objects.count(),
+        "expenses": sum(model.objects.count() for model, _ in EXPENSE_CATEGORIES.values()),
+        "spend": sum(value or 0 for value in totals.values()),
+    }
+
+
+def report():
+    """Families, expenses and lifetime spend per shard, counted on every shard in parallel."""
+    return fan_out(_shard_summary)
+
+
+class ShardRouter:
+    """
+    Routes the app's models (except ShardMap) to the active shard, or to the
+    database an instance was loaded from; everything else stays on default.
+    """
+
+    def _family_model(self, model):
+        return model._meta.app_label == "app" and model is not ShardMap
+
+    def _route(self, model, **hints):
+        if not self._family_model(model):
+            return "default"
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        alias = _active.get()
+        if alias is None:
+            raise ShardNotSelected(
+                f"No shard is active for a {model.__name__} query; wrap it in sharding.using() or sharding.each()"
+            )
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, **hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label != "app":
+            return db == "default"
+        if model_name == "shardmap":
+            return db == "default"
+        # Every shard gets the family tables, default (LEGACY_SHARD) included:
+        # families from before sharding live there until move_user() moves them
+        return True
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import households
+from .caching import invalidate_account, invalidate_dashboard
+from .models import (
+    BasicNeedsExpense, BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES, MandatoryExpense, ReceiptFingerprint,
+    SuddenExpense, UserAccount,
+)
+
+
+@receiver([post_save, post_delete], sender=UserAccount)
+def account_changed(sender, instance, **kwargs):
+    invalidate_account(instance.user_id)
+    invalidate_dashboard(instance.user_id)
+
+
+@receiver(pre_delete, sender=UserAccount)
+def account_deleted(sender, instance, **kwargs):
+    # The member's monthly rollups go with the account, so they leave the household's too
+    households.remove_spend(instance)
+
+
+@receiver([post_save, post_delete], sender=BudgetDetails)
+@receiver([post_save, post_delete], sender=BudgetSummary)
+def budget_changed(sender, instance, **kwargs):
+    invalidate_dashboard(instance.user_id, instance.month, instance.year)
+
+
+@receiver([post_save, post_delete], sender=MandatoryExpense)
+@receiver([post_save, post_delete], sender=BasicNeedsExpense)
+@receiver([post_save, post_delete], sender=SuddenExpense)
+def expense_changed(sender, instance, **kwargs):
+    invalidate_dashboard(instance.user_id, instance.timestamp.month, instance.timestamp.year)
+
+
+@receiver(post_delete, sender=MandatoryExpense)
+@receiver(post_delete, sender=BasicNeedsExpense)
+@receiver(post_delete, sender=SuddenExpense)
+def expense_deleted(sender, instance, **kwargs):
+    # The stored blob may be shared with other expenses, so only the index entry goes
+    category = next(name for name, (model, _) in EXPENSE_CATEGORIES.items() if model is sender)
+    ReceiptFingerprint.objects.filter(category=category, expense_id=instance.pk).delete()
@@ -0,0 +1,46 @@
+document.getElementById('date').textContent = new Date().toLocaleDateString();
+
+document.addEventListener("DOMContentLoaded", function () {
+    const form = document.querySelector("form:not(#import-form)");
+    const categorySelect = document.getElementById("category");
+    const amountInput = document.getElementById("amount");
+
+    // This month's limits and spend, rendered by home.html as JSON (absent without a budget)
+    const budgetData = document.getElementById("budget-data");
+    const budget = budgetData ? JSON.parse(budgetData.textContent) : null;
+
+    form.addEventListener("submit", function (event) {
+        if (!budget) return;
+        const selectedCategory = categorySelect.value.toLowerCase().replace(" ", "_");
+        const enteredAmount = parseFloat(amountInput.value);
+        const remainingAmount = budget.limits[selectedCategory] - budget.spent[selectedCategory];
+
+        if (enteredAmount > remainingAmount) {
+            const confirmation = confirm(`The amount in ${categorySelect.value} has exceeded the limit! Do you want to proceed?`);
+            if (!confirmation) {
+                event.preventDefault(); // Prevent form submission
+            }
+        }
+    });
+
+    categorySelect.addEventListener("change", function () {
+        amountInput.value = ""; // Reset amount input
+    });
+
+    // Pre-select the category the classifier suggests, until the user picks one
+    const descriptionInput = document.getElementById("expense");
+    let categoryChosen = false;
+    let suggestTimer = null;
+    categorySelect.addEventListener("change", function () { categoryChosen = true; });
+    descriptionInput.addEventListener("input", function () {
+        clearTimeout(suggestTimer);
+        suggestTimer = setTimeout(function () {
+            if (categoryChosen || !descriptionInput.value.trim()) return;
+            fetch(descriptionInput.dataset.suggestUrl + "?description=" + encodeURIComponent(descriptionInput.value))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (data.category && !categoryChosen) categorySelect.value = data.category;
+                });
+        }, 250);
+    });
+});
@@ -0,0 +1,58 @@
+document.addEventListener("DOMContentLoaded", function() {
+    setDefaultMonthAndYear();
+});
+
+// Function to set default month and year based on current date
+function setDefaultMonthAndYear() {
+    const urlParams = new URLSearchParams(window.location.search);
+    let selectedMonth = urlParams.get('month');
+    let selectedYear = urlParams.get('year');
+
+    let today = new Date();
+    let currentMonth = today.getMonth() + 1; // JavaScript months are 0-based
+    let currentYear = today.getFullYear();
+
+    if (!selectedMonth) {
+        selectedMonth = currentMonth;
+    }
+    if (!selectedYear) {
+        selectedYear = currentYear;
+    }
+
+    let monthElement = document.getElementById("month");
+    let yearElement = document.getElementById("year");
+
+    if (monthElement) {
+        monthElement.value = selectedMonth;
+    } else {
+        console.error("Month dropdown not found!");
+    }
+
+    if (yearElement) {
+        yearElement.value = selectedYear;
+    } else {
+        console.error("Year input field not found!");
+    }
+}
+
+// Image modal functions
+function showImage(src) {
+    let modal = document.getElementById("imageModal");
+    let fullImage = document.getElementById("fullImage");
+
+    if (modal && fullImage) {
+        fullImage.src = src;
+        modal.style.display = "flex";
+    } else {
+        console.error("Image modal elements not found!");
+    }
+}
+
+function hideImage() {
+    let modal = document.getElementById("imageModal");
+    if (modal) {
+        modal.style.display = "none";
+    } else {
+        console.error("Image modal element not found!");
+    }
+}
@@ -0,0 +1,56 @@
+document.addEventListener("DOMContentLoaded", function () {
+    const form = document.querySelector("form");
+    const phoneInput = document.querySelector("input[name='phone_number']");
+    const emailInput = document.querySelector("input[name='email']");
+    const passwordInput = document.querySelector("input[name='password']");
+    const confirmPasswordInput = document.querySelector("input[name='confirm_password']");
+
+    form.addEventListener("submit", function (event) {
+        let isValid = true;
+        let errorMessage = "";
+
+        // Phone number validation (must be exactly 10 digits)
+        const phonePattern = /^\d{10}$/;
+        if (!phonePattern.test(phoneInput.value)) {
+            isValid = false;
+            errorMessage += "Phone number must be exactly 10 digits.\n";
+        }
+
+        // Email validation (must be in proper email format)
+        const emailPattern = /^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$/;
+        if (!emailPattern.test(emailInput.value)) {
+            isValid = false;
+            errorMessage += "Enter a valid email address.\n";
+        }
+        // Password validation function
+    function isStrongPassword(password) {
+        const minLength = 8;
+        const hasUpperCase = /[A-Z]/.test(password);
+        const hasLowerCase = /[a-z]/.test(password);
+        const hasNumber = /\d/.test(password);
+        const hasSpecialChar = /[!@#$%^&*(),.?":{}|<>]/.test(password);
+
+        return password.length >= minLength && hasUpperCase && hasLowerCase && hasNumber && hasSpecialChar;
+    }
+
+
+    // Strong password validation
+    if (!isStrongPassword(passwordInput.value)) {
+        isValid = false;
+        errorMessage += "Password must be at least 8 characters long, include an uppercase letter, a lowercase letter, a number, and a special character.\n";
+    }
+
+
+        // Password confirmation validation
+        if (passwordInput.value !== confirmPasswordInput.value) {
+            isValid = false;
+            errorMessage += "Passwords do not match.\n";
+        }
+
+        // If any validation fails, prevent form submission and show alert
+        if (!isValid) {
+            event.preventDefault();
+            alert(errorMessage);
+        }
+    });
+});
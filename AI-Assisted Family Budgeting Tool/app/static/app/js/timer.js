@@ -0,0 +1,16 @@
+// Clock in the #timer corner of the signed-in pages
+function startTimer() {
+    const timerElement = document.getElementById('timer');
+
+    setInterval(() => {
+        let currentTime = new Date();
+        let hours = currentTime.getHours().toString().padStart(2, '0');
+        let minutes = currentTime.getMinutes().toString().padStart(2, '0');
+        let seconds = currentTime.getSeconds().toString().padStart(2, '0');
+
+        timerElement.innerHTML = `${hours}:${minutes}:${seconds}`; // Format: hh:mm:ss
+    }, 1000);
+}
+
+// Directly start the timer when the page loads
+startTimer();
@@ -0,0 +1,48 @@
+"""
+Content-addressed storage for receipt uploads.
+
+A file is stored under the SHA-256 of its bytes
+(expenses/3f/3fa9...c1.png), so uploading the same receipt again reuses the
+existing blob instead of writing Screenshot_2_qET234b.png next to
+Screenshot_2.png.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """SHA-256 hex digest of a Django File, leaving it rewound."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        directory = os.path.dirname(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension).replace("\\", "/")
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        target = self.hashed_name(name or content.name, content)
+        if self.exists(target):
+            return target  # identical bytes are already stored
+        return self._save(target, content)
+
+
+receipt_storage = ContentAddressedStorage()
+
+
+def get_receipt_storage():
+    return receipt_storage
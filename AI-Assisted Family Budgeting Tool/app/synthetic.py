@@ -0,0 +1,214 @@
+"""
+Synthetic families for benchmarks and load tests.
+
+generate() creates ``users`` accounts with ``months`` months of budgets
+(ending with the current month, which only has expenses up to now) and
+expenses shaped like a household's:
+
+* Mandatory: rent on the 1st plus a few bills in the first week of the month;
+* Basic Needs: ~20 small purchases spread over the month (log-normal);
+* Sudden Expense: an occasional heavy-tailed cost (Pareto).
+
+Every expense is allocated with allocation.plan() against the running
+BudgetSummary, as add_expense() would, and skipped if it would overdraw the
+user's savings, so summaries, rollups and anomaly statistics are all
+consistent with the expense rows. Everything is written with bulk_create and
+the same seed gives the same data. When the database is sharded, the
+families are entered in the shard map and written to their home shards.
+"""
+import io
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image
+
+from . import allocation, anomalies, money, sharding
+from .models import (
+    BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES, MonthlySpendRollup, ShardMap, UserAccount, UserSpendTotals,
+)
+from .storage import get_receipt_storage
+from .utils import month_bounds, shift_month
+
+PASSWORD = "family-secret"
+BATCH_USERS = 200
+RECEIPT_POOL = 32  # distinct receipt images, shared between expenses like real re-uploads
+
+DESCRIPTIONS = {
+    "Mandatory": ("electricity bill", "home loan emi", "school fees", "health insurance", "mobile recharge", "water bill"),
+    "Basic Needs": ("groceries", "milk and bread", "vegetables", "petrol", "medicines", "household supplies", "auto fare"),
+    "Sudden Expense": ("doctor visit", "car repair", "wedding gift", "laptop repair", "hospital bill", "plumber"),
+}
+
+
+class GeneratedData:
+    def __init__(self, users, months, expenses, skipped):
+        self.users = users
+        self.months = months
+        self.expenses = expenses
+        self.skipped = skipped
+
+    def __str__(self):
+        return (
+            f"{len(self.users)} users x {self.months} months, {self.expenses} expenses "
+            f"({self.skipped} skipped for lack of savings)"
+        )
+
+
+def _receipt_names(rng, count):
+    storage = get_receipt_storage()
+    names = []
+    for i in range(count):
+        image = Image.fromarray(rng.integers(0, 256, (48, 64, 3), dtype=np.uint8))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=70)
+        names.append(storage.save(f"expenses/receipt_{i}.jpg", ContentFile(buffer.getvalue())))
+    return names
+
+
+def _month_expenses(rng, budget, start, end):
+    """Time-ordered (timestamp, category, description, amount) for one user-month."""
+    span = (end - start).total_seconds()
+    mandatory, basic_needs, sudden = (
+        float(limit) for limit in (budget.mandatory_limit, budget.basic_needs_limit, budget.sudden_expenses_limit)
+    )
+    expenses = [(start + timedelta(hours=float(rng.uniform(8, 12))), "Mandatory", "house rent",
+                 money.rupees(mandatory * rng.uniform(0.5, 0.65)))]
+    for description in rng.choice(DESCRIPTIONS["Mandatory"], size=rng.integers(1, 4), replace=False):
+        amount = mandatory * 0.1 * rng.lognormal(0, 0.4)
+        expenses.append((start + timedelta(days=float(rng.uniform(0, 7))), "Mandatory", str(description), money.rupees(amount)))
+    count = rng.poisson(20)
+    for _ in range(count):
+        amount = basic_needs * 0.85 / 20 * rng.lognormal(-0.3, 0.8)
+        expenses.append((start + timedelta(seconds=float(rng.uniform(0, span))), "Basic Needs",
+                         str(rng.choice(DESCRIPTIONS["Basic Needs"])), money.rupees(max(amount, 10))))
+    for _ in range(rng.poisson(1.5)):
+        amount = sudden * 0.3 * (1 + rng.pareto(2.5))
+        expenses.append((start + timedelta(seconds=float(rng.uniform(0, span))), "Sudden Expense",
+                         str(rng.choice(DESCRIPTIONS["Sudden Expense"])), money.rupees(amount)))
+    return sorted(expenses, key=lambda expense: expense[0])
+
+
+def _family(rng, user, months, today, now, receipts, receipt_names):
+    """All rows for one user, as (budgets, summaries, rollups, totals, expenses by model, skipped)."""
+    salary = money.rupees(round(float(rng.lognormal(math.log(60000), 0.4)), -3))
+    budgets, summaries, rollups, expenses = [], [], [], {model: [] for model, _ in EXPENSE_CATEGORIES.values()}
+    lifetime = {field: money.ZERO for _, field in EXPENSE_CATEGORIES.values()}
+    savings_total = money.ZERO
+    skipped = 0
+
+    for back in range(months - 1, -1, -1):
+        year, month = shift_month(today.year, today.month, -back)
+        start, end = month_bounds(year, month)
+        shares = rng.uniform((0.35, 0.2, 0.08), (0.45, 0.3, 0.12))
+        limits = [money.rupees(round(float(salary) * share, -2)) for share in shares]
+        budget = BudgetDetails(
+            user=user, month=month, year=year, actual_salary=salary, active_salary=sum(limits),
+            mandatory_limit=limits[0], basic_needs_limit=limits[1], sudden_expenses_limit=limits[2],
+        )
+        summary = BudgetSummary(user=user, month=month, year=year, mandatory=0, basic_needs=0, sudden_expenses=0,
+                                savings=salary - sum(limits))
+        savings_total += summary.savings
+        monthly = {field: money.ZERO for field in lifetime}
+
+        for timestamp, category, description, amount in _month_expenses(rng, budget, start, min(end, now)):
+            if timestamp >= now:
+                continue
+            spent = {field: getattr(summary, field) for field in allocation.LIMITS}
+            increments, from_savings = allocation.plan(budget, spent, category, amount)
+            if from_savings > savings_total:
+                skipped += 1
+                continue
+            for field, value in increments.items():
+                setattr(summary, field, getattr(summary, field) + value)
+            summary.savings -= from_savings
+            savings_total -= from_savings
+            summary.version += 1
+
+            model, field = EXPENSE_CATEGORIES[category]
+            image = receipt_names[int(rng.integers(len(receipt_names)))] if receipt_names and rng.random() < receipts else None
+            expenses[model].append(model(user=user, timestamp=timestamp, expense=description, amount=amount, image=image))
+            monthly[field] += amount
+            lifetime[field] += amount
+
+        budgets.append(budget)
+        summaries.append(summary)
+        if any(monthly.values()):
+            rollups.append(MonthlySpendRollup(user=user, month=month, year=year, **monthly))
+
+    totals = UserSpendTotals(user=user, savings=savings_total, **lifetime)
+    return budgets, summaries, rollups, totals, expenses, skipped
+
+
+def _by_shard(accounts):
+    """Give new accounts their ids from the shard map and group them by home shard (one group unsharded)."""
+    if not sharding.enabled():
+        return {"default": accounts}
+    entries = ShardMap.objects.bulk_create(
+        ShardMap(username=account.username, phone_number=account.phone_number, email=account.email)
+        for account in accounts
+    )
+    if entries[0].pk is None:
+        entries = list(ShardMap.objects.filter(username__in=[account.username for account in accounts]).order_by("user_id"))
+    groups = {}
+    for account, entry in zip(accounts, entries):
+        entry.shard = sharding.home_shard(entry.user_id)
+        account.user_id = entry.user_id
+        groups.setdefault(entry.shard, []).append(account)
+    ShardMap.objects.bulk_update(entries, ["shard"])
+    return groups
+
+
+def generate(users, months, seed=0, receipts=0.0, prefix="family", password=PASSWORD, stats=True):
+    """
+    Create the families and return a GeneratedData. ``receipts`` is the
+    share of expenses given a receipt image; ``stats`` rebuilds the anomaly
+    statistics afterwards (for every user).
+    """
+    rng = np.random.default_rng(seed)
+    today, now = timezone.localdate(), timezone.now()
+    hashed = make_password(password)  # hashing is slow, so every account shares one
+    receipt_names = _receipt_names(rng, RECEIPT_POOL) if receipts else []
+
+    created = []
+    expense_count = skipped = 0
+    for first in range(0, users, BATCH_USERS):
+        accounts = [
+            UserAccount(username=f"{prefix}{i}", phone_number=f"{prefix[:4]}{i:09d}", email=f"{prefix}{i}@example.com",
+                        password=hashed)
+            for i in range(first, min(first + BATCH_USERS, users))
+        ]
+        for alias, accounts in _by_shard(accounts).items():
+            with sharding.using(alias), sharding.atomic():
+                accounts = UserAccount.objects.bulk_create(accounts)
+                if accounts[0].pk is None:  # backends that cannot return ids
+                    accounts = list(UserAccount.objects.filter(username__in=[account.username for account in accounts]))
+                rows = {"budgets": [], "summaries": [], "rollups": [], "totals": [], "expenses": {}}
+                for account in accounts:
+                    budgets, summaries, rollups, totals, expenses, lacking = _family(
+                        rng, account, months, today, now, receipts, receipt_names
+                    )
+                    rows["budgets"] += budgets
+                    rows["summaries"] += summaries
+                    rows["rollups"] += rollups
+                    rows["totals"].append(totals)
+                    for model, objects in expenses.items():
+                        rows["expenses"].setdefault(model, []).extend(objects)
+                        expense_count += len(objects)
+                    skipped += lacking
+
+                BudgetDetails.objects.bulk_create(rows["budgets"])
+                BudgetSummary.objects.bulk_create(rows["summaries"])
+                MonthlySpendRollup.objects.bulk_create(rows["rollups"])
+                UserSpendTotals.objects.bulk_create(rows["totals"])
+                for model, objects in rows["expenses"].items():
+                    model.objects.bulk_create(objects, batch_size=2000)
+            created += accounts
+
+    if stats:
+        for _ in sharding.each():
+            anomalies.rebuild()
+    return GeneratedData(created, months, expense_count, skipped)
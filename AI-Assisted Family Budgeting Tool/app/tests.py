@@ -1,3 +1,1365 @@
-from django.test import TestCase
+import io
+import itertools
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.signals import template_rendered
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+import numpy as np
+from PIL import Image
+
+from . import (
+    allocation, analytics, anomalies, archive, async_views, caching, classifier, exporter, fingerprints, forecast,
+    households, metrics, money, rollups, sharding, synthetic, views,
+)
+from .importer import import_csv
+from .models import (
+    BasicNeedsExpense, BudgetDetails, BudgetSummary, EXPENSE_CATEGORIES, ExpenseArchive, ExpenseStats, Household, HouseholdRollup,
+    MandatoryExpense, MonthlySpendRollup, ReceiptFingerprint, ShardMap, SpendForecast, SuddenExpense, UserAccount, UserSpendTotals,
+)
+from .utils import month_bounds, shift_month
+
+
+# Unique per run and the same every run (str hashes are salted per process)
+_phone_numbers = (f"97{n:08d}" for n in itertools.count(1))
+
+
+def make_user(username="asha"):
+    return UserAccount.objects.create(
+        username=username,
+        phone_number=next(_phone_numbers),
+        email=f"{username}@example.com",
+        password=make_password("secret"),
+    )
+
+
+class BudgetTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        session = self.client.session
+        session["user_id"] = self.user.user_id
+        session["username"] = self.user.username
+        session.save()
+
+    def set_budget(self, salary=1000, mandatory=300, basic_needs=200, sudden=100):
+        return self.client.post(reverse("first"), {
+            "salary": salary,
+            "mandatory_limit": mandatory,
+            "basic_needs_limit": basic_needs,
+            "sudden_expenses_limit": sudden,
+        })
+
+    def add_expense(self, category, amount, expense="test"):
+        return self.client.post(reverse("home"), {"category": category, "expense": expense, "amount": amount})
+
+
+class BudgetTestCase(BudgetTestMixin, TestCase):
+    pass
+
+
+class RollupTests(BudgetTestCase):
+    def test_expenses_update_rollups(self):
+        self.set_budget()
+        self.add_expense("Mandatory", 250)
+        self.add_expense("Basic Needs", 50)
+        self.add_expense("Sudden Expense", 20)
+
+        totals = UserSpendTotals.objects.get(user=self.user)
+        self.assertEqual((totals.mandatory, totals.basic_needs, totals.sudden_expenses), (250, 50, 20))
+        self.assertEqual(totals.savings, 400)
+        self.assertEqual(MonthlySpendRollup.objects.get(user=self.user).mandatory, 250)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_savings_draw_and_delete_stay_consistent(self):
+        self.set_budget()
+        self.add_expense("Mandatory", 700)  # 100 more than all limits -> drawn from savings
+        self.assertEqual(rollups.get_totals(self.user).savings, 300)
+
+        expense = MandatoryExpense.objects.get(user=self.user)
+        self.client.post(reverse("delete", args=[expense.id]))
+        self.assertEqual(rollups.get_totals(self.user).mandatory, 0)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_amounts_are_exact_paise(self):
+        self.set_budget(salary="1000.05", mandatory="300.10")
+        for _ in range(3):
+            self.add_expense("Mandatory", "0.10")
+        self.add_expense("Mandatory", "0.20")
+        self.add_expense("Basic Needs", "0.1")
+
+        summary = BudgetSummary.objects.get(user=self.user)
+        self.assertEqual((summary.mandatory, summary.basic_needs), (Decimal("0.50"), Decimal("0.10")))
+        self.assertEqual(summary.savings, Decimal("399.95"))
+        totals = rollups.get_totals(self.user)
+        self.assertEqual(totals.mandatory, MandatoryExpense.objects.aggregate(total=Sum("amount"))["total"])
+        self.assertEqual(rollups.check_consistency(self.user), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT SUM(amount), typeof(SUM(amount)) FROM app_mandatoryexpense")
+            self.assertEqual(cursor.fetchone(), (50, "integer"))
+
+        expense = MandatoryExpense.objects.filter(user=self.user).first()
+        self.client.post(reverse("delete", args=[expense.id]))
+        self.assertEqual(BudgetSummary.objects.get(user=self.user).mandatory, Decimal("0.40"))
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_check_reports_drift_and_rebuild_fixes_it(self):
+        self.set_budget()
+        self.add_expense("Mandatory", 100)
+        BudgetSummary.objects.filter(user=self.user).update(savings=1)
+
+        self.assertTrue(rollups.check_consistency(self.user))
+        rollups.rebuild_user(self.user)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_first_reads_rollups(self):
+        self.set_budget()
+        self.add_expense("Mandatory", 100)
+        response = self.client.get(reverse("first"))
+        self.assertEqual(response.context["remaining_salary"], 500)
+        self.assertEqual(response.context["total_savings"], 400)
+
+
+class QueryPlanTests(BudgetTestCase):
+    """The hot paths must seek an index on our tables, never scan them."""
+
+    def setUp(self):
+        super().setUp()
+        self.set_budget()
+        for category in ("Mandatory", "Basic Needs", "Sudden Expense"):
+            self.add_expense(category, 10)
+
+    def assertNoTableScans(self, queries):
+        checked = 0
+        for query in queries:
+            sql = query["sql"]
+            if not sql.startswith(("SELECT", "UPDATE", "DELETE")) or "app_" not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            checked += 1
+            for step in plan:
+                if "app_" in step:
+                    self.assertTrue(step.startswith("SEARCH"), f"{step!r} in plan for {sql}")
+                    # Seeking on the user FK alone still walks all of the user's history
+                    self.assertNotRegex(step, r"\(user_id=\?\)$", f"plan for {sql}")
+        self.assertGreater(checked, 0)
+
+    def test_home_get(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("home"))
+        self.assertNoTableScans(ctx.captured_queries)
+
+    def test_home_post(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.add_expense("Mandatory", 5)
+        self.assertNoTableScans(ctx.captured_queries)
+
+    def test_first(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("first"))
+        self.assertNoTableScans(ctx.captured_queries)
+
+    def test_month_history(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("month_history"), {"month": now().month, "year": now().year})
+        self.assertNoTableScans(ctx.captured_queries)
+
+    def test_allocation(self):
+        with CaptureQueriesContext(connection) as ctx:
+            allocation.add_expense(self.user, "Basic Needs", "milk", 5)
+        self.assertNoTableScans(ctx.captured_queries)
+
+
+class BudgetUniquenessTests(BudgetTestCase):
+    def test_resaving_budget_updates_the_month_in_place(self):
+        self.set_budget()
+        self.add_expense("Mandatory", 700)  # draws 100 from savings
+        self.set_budget(salary=2000)
+
+        summary = BudgetSummary.objects.get(user=self.user)
+        self.assertEqual(summary.mandatory, 300)
+        self.assertEqual(summary.savings, 1300)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+
+class MonthHistoryTests(BudgetTestCase):
+    def test_pages_cover_every_expense_once_in_order(self):
+        for i in range(20):
+            for model in (MandatoryExpense, BasicNeedsExpense, SuddenExpense):
+                model.objects.create(user=self.user, expense=f"e{i}", amount=i)
+        # Identical timestamps force the (timestamp, id, kind) tie-breaks
+        stamp = now().replace(day=1, hour=12)
+        for model in (MandatoryExpense, BasicNeedsExpense):
+            model.objects.filter(user=self.user).update(timestamp=stamp)
+
+        seen = []
+        params = {"month": now().month, "year": now().year, "page_size": 25}
+        self.client.get(reverse("home"))  # warm the session and account caches
+        with self.assertNumQueries(1):  # one UNION ALL
+            response = self.client.get(reverse("month_history"), params)
+        while True:
+            rows = response.context["expenses"]
+            self.assertLessEqual(len(rows), 25)
+            seen.extend((row["timestamp"], row["id"], row["kind"]) for row in rows)
+            if not response.context["next_cursor"]:
+                break
+            response = self.client.get(reverse("month_history"), {
+                **params, "after": response.context["next_cursor"], "start": response.context["next_start_number"],
+            })
+
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(len(set(seen)), 60)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_malformed_start_falls_back_to_one(self):
+        for i in range(30):
+            MandatoryExpense.objects.create(user=self.user, expense=f"e{i}", amount=i)
+        params = {"month": now().month, "year": now().year, "page_size": 25}
+        cursor = self.client.get(reverse("month_history"), params).context["next_cursor"]
+        for start in ("x", "-5", ""):
+            response = self.client.get(reverse("month_history"), {**params, "after": cursor, "start": start})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["start_number"], 1)
+
+
+class AnalyticsTests(BudgetTestCase):
+    def test_months_categories_budget_and_savings(self):
+        self.set_budget()  # limits 300 / 200 / 100, savings 400
+        self.add_expense("Mandatory", 350)
+        self.add_expense("Basic Needs", 50)
+        today = now()
+        last_year = shift_month(today.year, today.month, -12)
+        old = SuddenExpense.objects.create(user=self.user, expense="old", amount=70)
+        SuddenExpense.objects.filter(id=old.id).update(timestamp=month_bounds(*last_year)[0])
+        BudgetSummary.objects.create(
+            user=self.user, year=last_year[0], month=last_year[1], mandatory=0, basic_needs=0, sudden_expenses=0, savings=25,
+        )
+        start = "%04d-%02d" % last_year
+        end = "%04d-%02d" % (today.year, today.month)
+
+        self.client.get(reverse("home"))  # warm the session and account caches
+        with self.assertNumQueries(4):  # one grouped UNION ALL, archived totals, budgets, summaries
+            response = self.client.get(reverse("analytics_api"), {"start": start, "end": end})
+        report = response.json()
+
+        months = report["months"]
+        self.assertEqual(len(months), 13)
+        self.assertEqual((months[0]["month"], months[-1]["month"]), (start, end))
+        self.assertEqual(months[0]["spend"], {"mandatory": 0, "basic_needs": 0, "sudden_expenses": 70})
+        self.assertEqual(months[0]["savings"], 25)
+        self.assertIsNone(months[0]["budget"])
+        self.assertEqual(months[-1]["spend"], {"mandatory": 350, "basic_needs": 50, "sudden_expenses": 0})
+        self.assertEqual((months[-1]["count"], months[-1]["total"]), (2, 400))
+        self.assertEqual(months[-1]["budget"]["remaining"], {"mandatory": -50, "basic_needs": 150, "sudden_expenses": 100})
+        self.assertEqual(months[-1]["cumulative_savings"], 425)
+        self.assertEqual(report["totals"], {"mandatory": 350, "basic_needs": 50, "sudden_expenses": 70})
+
+        page = self.client.get(reverse("analytics"), {"start": start, "end": end})
+        self.assertEqual(page.context["report"], report)
+
+    def test_months_follow_the_current_time_zone(self):
+        expense = MandatoryExpense.objects.create(user=self.user, expense="late", amount=10)
+        MandatoryExpense.objects.filter(id=expense.id).update(timestamp=month_bounds(2025, 2)[0] - timedelta(hours=2))
+        self.assertEqual(analytics.report(self.user.user_id, (2025, 1), (2025, 2))["months"][0]["spend"]["mandatory"], 10)
+        with override_settings(TIME_ZONE="Asia/Kolkata"):  # 05:30 ahead, so already February
+            report = analytics.report(self.user.user_id, (2025, 1), (2025, 2))
+        self.assertEqual(report["months"][1]["spend"]["mandatory"], 10)
+
+    def test_rejects_bad_ranges(self):
+        for params in ({"start": "2024-13"}, {"start": "2025-02", "end": "2025-01"}, {"start": "2000-01", "end": "2025-01"}):
+            self.assertEqual(self.client.get(reverse("analytics_api"), params).status_code, 400)
+        self.assertEqual(analytics.month_range(end="2025-03"), ((2024, 4), (2025, 3)))
+
+
+class ArchiveTests(BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.set_budget()
+        self.add_expense("Basic Needs", 20, "milk")
+        today = now()
+        self.today = (today.year, today.month)
+        self.old = shift_month(today.year, today.month, -14)
+        start = month_bounds(*self.old)[0]
+        for i in range(30):
+            model = (MandatoryExpense, BasicNeedsExpense, SuddenExpense)[i % 3]
+            expense = model.objects.create(user=self.user, expense=f"old {i}", amount=i + 1)
+            # Days repeat after 20, so some rows share a timestamp
+            model.objects.filter(id=expense.id).update(timestamp=start + timedelta(days=i % 20, hours=1))
+        rollups.rebuild_user(self.user)
+
+    def history(self, page_size=7):
+        params = {"month": self.old[1], "year": self.old[0], "page_size": page_size}
+        rows = []
+        while True:
+            response = self.client.get(reverse("month_history"), params)
+            rows += response.context["expenses"]
+            if not response.context["next_cursor"]:
+                return rows
+            params.update(after=response.context["next_cursor"], start=response.context["next_start_number"])
+
+    def test_closed_months_leave_the_expense_tables(self):
+        out = io.StringIO()
+        call_command("close_months", stdout=out)
+        self.assertIn("Archived 30 expenses of 1 families", out.getvalue())
+        self.assertEqual(sum(model.objects.count() for model, _ in EXPENSE_CATEGORIES.values()), 1)
+        stored = ExpenseArchive.objects.get(user=self.user)
+        self.assertEqual((stored.year, stored.rows, stored.months[str(self.old[1])]["count"]), (self.old[0], 30, 30))
+        self.assertEqual(rollups.check_consistency(self.user), [])
+        self.assertEqual(rollups.get_month(self.user, self.old[1], self.old[0]).mandatory, sum(range(1, 31, 3)))
+
+        call_command("close_months", stdout=io.StringIO())  # nothing left to move
+        self.assertEqual(ExpenseArchive.objects.get().rows, 30)
+
+    def test_history_and_analytics_read_archived_months(self):
+        history = self.history()
+        report = analytics.report(self.user.user_id, self.old, self.today)
+        archive.close_months()
+
+        self.assertEqual(len(history), 30)
+        archived = self.history()
+        self.assertTrue(all(row.pop("archived") for row in archived))
+        self.assertEqual(archived, history)
+        self.assertEqual(analytics.report(self.user.user_id, self.old, self.today), report)
+
+    def test_archived_rows_offer_no_delete(self):
+        archive.close_months()
+        response = self.client.get(reverse("month_history"), {"month": self.old[1], "year": self.old[0]})
+        self.assertContains(response, "<span>Archived</span>")
+        self.assertNotContains(response, "delete-btn")
+
+    def test_export_includes_and_import_skips_archived_months(self):
+        archive.close_months()
+        rows = list(exporter.export_rows(self.user))
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(sorted(row[4] for row in rows)[:2], ["milk", "old 0"])
+
+        day = month_bounds(*self.old)[0].date()
+        report = import_csv(self.user, io.StringIO(f"date,description,amount,category\n{day},late bill,5,Mandatory\n"))
+        self.assertEqual(report.skipped, 1)
+        self.assertIn("is archived", report.errors[0])
+
+
+class AsyncViewTests(BudgetTestCase):
+    """app.async_views must render exactly what the synchronous views do."""
+
+    def render_context(self, view, factory, path, params=None):
+        request = factory.get(path, params or {})
+        request.session = self.client.session
+        request.account = self.user
+        contexts = []
+        listener = lambda sender, context, **kwargs: contexts.append(context)
+        template_rendered.connect(listener)
+        try:
+            response = view(request) if factory is self.sync else async_to_sync(view)(request)
+        finally:
+            template_rendered.disconnect(listener)
+        self.assertEqual(response.status_code, 200)
+        return contexts[0]
+
+    def compare(self, name, keys, params=None):
+        path = reverse(name)
+        expected = self.render_context(getattr(views, name), self.sync, path, params)
+        actual = self.render_context(getattr(async_views, name), AsyncRequestFactory(), path, params)
+        for key in keys:
+            self.assertEqual(actual[key], expected[key], key)
+
+    def setUp(self):
+        super().setUp()
+        self.sync = RequestFactory()
+        self.set_budget()
+        for i, category in enumerate(["Mandatory", "Basic Needs", "Sudden Expense"] * 3):
+            self.add_expense(category, 50 + i, expense=f"e{i}")
+
+    def test_home(self):
+        cache.clear()
+        self.compare("home", ["user", "total_savings", "remaining_salary", "budget_details", "budget_summary"])
+
+    def test_first(self):
+        self.compare("first", ["user", "total_savings", "remaining_salary", "latest_budget"])
+
+    def test_month_history(self):
+        params = {"month": now().month, "year": now().year, "page_size": 25}
+        self.compare("month_history", ["expenses", "next_cursor", "selected_month_name", "page_size"], params)
+
+    def test_invalid_month(self):
+        self.compare("month_history", ["expenses", "error_message"], {"month": 0, "year": 2025})
+
+
+class CurrentAccountTests(BudgetTestCase):
+    def test_signed_out_requests_go_to_login(self):
+        self.client.cookies.clear()
+        for name in ("first", "home", "month_history"):
+            self.assertRedirects(self.client.get(reverse(name)), reverse("login"), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse("login")).status_code, 200)
+
+    def test_account_is_loaded_once_and_cached(self):
+        self.set_budget()
+        with self.assertNumQueries(1):  # the account; the session comes from the cache
+            self.client.get(reverse("month_history"))
+        with self.assertNumQueries(1):  # only the history page itself
+            response = self.client.get(reverse("month_history"))
+        self.assertEqual(response.context["user"], self.user)
+
+    def test_account_changes_invalidate_the_cache(self):
+        self.client.get(reverse("first"))
+        with self.captureOnCommitCallbacks(execute=True):
+            UserAccount.objects.filter(pk=self.user.pk).update(username="changed")
+            UserAccount.objects.get(pk=self.user.pk).save()
+        self.assertEqual(self.client.get(reverse("first")).context["user"].username, "changed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertRedirects(self.client.get(reverse("first")), reverse("login"), fetch_redirect_response=False)
+
+
+class SQLiteProductionProfileTests(TestCase):
+    def test_new_connections_get_wal_pragmas_and_immediate_writes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        wrapper = connections["default"].__class__({
+            **connection.settings_dict, "NAME": f"{directory}/db.sqlite3", "OPTIONS": settings.SQLITE_PRODUCTION_OPTIONS,
+        }, alias="production_profile")
+        connections["production_profile"] = wrapper
+        self.addCleanup(connections.__delitem__, "production_profile")
+        self.addCleanup(wrapper.close)
+
+        with wrapper.cursor() as cursor:
+            for pragma, expected in (("journal_mode", "wal"), ("busy_timeout", 20000), ("synchronous", 1), ("temp_store", 2)):
+                cursor.execute(f"PRAGMA {pragma}")
+                self.assertEqual(cursor.fetchone()[0], expected, pragma)
+        self.assertEqual(wrapper.transaction_mode, "IMMEDIATE")
+        with CaptureQueriesContext(wrapper) as captured, transaction.atomic(using="production_profile"):
+            pass
+        self.assertEqual(captured[0]["sql"], "BEGIN IMMEDIATE")
+
+
+class ShardingTests(TestCase):
+    """Two throwaway file-backed shards next to the test database, with the router installed."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(sharding.activate, None)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for alias in ("shard0", "shard1"):
+            connections.settings[alias] = {**connection.settings_dict, "NAME": f"{directory}/{alias}.sqlite3"}
+            self.addCleanup(self.drop_connection, alias)
+        # Let sharding.fan_out()'s threads connect to the shards for the length of the test
+        self.addCleanup(setattr, type(self), "databases", type(self).databases)
+        type(self).databases = {*type(self).databases, "shard0", "shard1"}
+        sharded = override_settings(FAMILY_SHARDS=2, DATABASE_ROUTERS=["app.sharding.ShardRouter"])
+        sharded.enable()
+        self.addCleanup(sharded.disable)
+        for alias in ("shard0", "shard1"):
+            call_command("migrate", database=alias, verbosity=0)
+
+    def drop_connection(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def register(self, username):
+        return sharding.create_account(username, next(_phone_numbers), f"{username}@example.com", make_password("secret"))
+
+    def login(self, username):
+        self.client.post(reverse("login"), {"username": username, "password": "secret"})
+
+    def test_family_tables_migrate_on_the_legacy_shard_too(self):
+        router = sharding.ShardRouter()
+        for alias in (sharding.LEGACY_SHARD, "shard0"):
+            self.assertTrue(router.allow_migrate(alias, "app", model_name="mandatoryexpense"))
+        self.assertTrue(router.allow_migrate("default", "app", model_name="shardmap"))
+        self.assertFalse(router.allow_migrate("shard0", "app", model_name="shardmap"))
+        self.assertFalse(router.allow_migrate("shard0", "sessions", model_name="session"))
+
+    def test_families_live_on_their_home_shard(self):
+        response = self.client.post(reverse("register"), {
+            "username": "asha", "phone_number": "9800000001", "email": "asha@example.com",
+            "password": "secret", "confirm_password": "secret",
+        })
+        self.assertEqual(response.status_code, 302)
+        for name in ("ben", "chitra", "dev", "esha", "farhan"):
+            self.register(name)
+
+        placed = set()
+        for entry in ShardMap.objects.all():
+            other = "shard1" if entry.shard == "shard0" else "shard0"
+            self.assertEqual(entry.shard, sharding.home_shard(entry.user_id))
+            self.assertTrue(UserAccount.objects.using(entry.shard).filter(username=entry.username).exists())
+            self.assertFalse(UserAccount.objects.using(other).filter(username=entry.username).exists())
+            placed.add(entry.shard)
+        self.assertEqual(placed, {"shard0", "shard1"})
+        with self.assertRaises(sharding.ShardNotSelected):
+            BudgetDetails.objects.count()
+
+        response = self.client.post(reverse("register"), {
+            "username": "asha", "phone_number": "9800000002", "email": "other@example.com",
+            "password": "secret", "confirm_password": "secret",
+        })
+        self.assertEqual(response.context["error_message"], "Username already registered!")
+
+        self.login("asha")
+        self.client.post(reverse("first"), {"salary": 1000, "mandatory_limit": 300, "basic_needs_limit": 200, "sudden_expenses_limit": 100})
+        self.client.post(reverse("home"), {"category": "Basic Needs", "expense": "groceries", "amount": 50})
+        shard = sharding.shard_of(ShardMap.objects.get(username="asha").user_id)
+        other = "shard1" if shard == "shard0" else "shard0"
+        self.assertEqual(BasicNeedsExpense.objects.using(shard).count(), 1)
+        self.assertEqual(BudgetDetails.objects.using(other).count(), 0)
+        self.assertContains(self.client.get(reverse("month_history")), "groceries")
+
+    def test_rebalance_moves_a_family_with_its_rows(self):
+        user = self.register("asha")
+        self.login("asha")
+        self.client.post(reverse("first"), {"salary": 1000, "mandatory_limit": 300, "basic_needs_limit": 200, "sudden_expenses_limit": 100})
+        self.client.post(reverse("home"), {"category": "Mandatory", "expense": "rent", "amount": 250})
+        self.client.post(reverse("home"), {"category": "Basic Needs", "expense": "groceries", "amount": 50})
+        home = user._state.db
+        other = "shard1" if home == "shard0" else "shard0"
+
+        call_command("rebalance_shards", user="asha", to=other, stdout=io.StringIO())
+        self.assertEqual(ShardMap.objects.get(username="asha").shard, other)
+        self.assertFalse(UserAccount.objects.using(home).exists())
+        self.assertEqual(BasicNeedsExpense.objects.using(other).get().expense, "groceries")
+        self.assertEqual(BudgetSummary.objects.using(other).get().mandatory, 250)
+        with sharding.using(other):
+            self.assertEqual(rollups.check_consistency(UserAccount.objects.get()), [])
+        self.assertContains(self.client.get(reverse("month_history")), "groceries")
+
+        out = io.StringIO()
+        call_command("rebalance_shards", stdout=out)  # back to its home shard
+        self.assertIn(f"asha: {other} -> {home}", out.getvalue())
+        self.assertEqual(MandatoryExpense.objects.using(home).count(), 1)
+        self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+
+    def test_joining_a_household_moves_the_member_to_its_shard(self):
+        asha = self.register("asha")
+        ben = next(
+            user for user in (self.register(f"ben{n}") for n in range(20)) if user._state.db != asha._state.db
+        )
+        self.login("asha")
+        self.client.post(reverse("household"), {"action": "create", "name": "Sharmas"})
+        household = Household.objects.using(asha._state.db).get()
+
+        self.login(ben.username)
+        self.client.post(reverse("first"), {"salary": 1000, "mandatory_limit": 300, "basic_needs_limit": 200, "sudden_expenses_limit": 100})
+        self.client.post(reverse("home"), {"category": "Mandatory", "expense": "rent", "amount": 250})
+        self.client.post(reverse("household"), {"action": "join", "code": household.code})
+        self.assertEqual(ShardMap.objects.get(user_id=ben.user_id).shard, asha._state.db)
+        self.client.post(reverse("home"), {"category": "Basic Needs", "expense": "groceries", "amount": 50})
+        rollup = HouseholdRollup.objects.using(asha._state.db).get()
+        self.assertEqual((rollup.mandatory, rollup.basic_needs), (250, 50))
+
+        call_command("rebalance_shards", stdout=io.StringIO())  # members stay with the household
+        self.assertEqual(ShardMap.objects.get(user_id=ben.user_id).shard, asha._state.db)
+        with self.assertRaisesMessage(CommandError, "is in a household"):
+            call_command("rebalance_shards", user=ben.username, to=ben._state.db, stdout=io.StringIO())
+
+    def test_report_fans_out_over_every_shard(self):
+        for name in ("asha", "ben", "chitra", "dev"):
+            self.register(name)
+        report = sharding.report()
+        self.assertEqual(sorted(report), ["shard0", "shard1"])
+        self.assertEqual(sum(row["users"] for row in report.values()), 4)
+        self.assertEqual(report["shard0"]["users"], ShardMap.objects.filter(shard="shard0").count())
+
+        out = io.StringIO()
+        call_command("shard_report", stdout=out)
+        self.assertIn("total", out.getvalue())
+
+
+class MetricsTests(BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_requests_are_timed_per_url_name(self):
+        self.set_budget()
+        self.client.get(reverse("home"))
+        self.client.get(reverse("home"))
+
+        response = self.client.get(reverse("metrics"), headers={"Authorization": "Bearer scrape-me"})
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        lines = response.content.decode().splitlines()
+        self.assertIn('family_request_duration_seconds_count{view="home"} 2', lines)
+        self.assertIn('family_requests_total{view="first",status="302"} 1', lines)
+        self.assertIn('family_request_sql_queries_bucket{view="first",le="+Inf"} 1', lines)
+        values = {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1]) for line in lines if not line.startswith("#")}
+        self.assertGreater(values['family_sql_seconds_total{view="first"}'], 0)
+        self.assertGreater(values['family_template_render_seconds_total{view="home"}'], 0)
+        self.assertGreater(values['family_response_bytes_total{view="home"}'], 1000)
+        self.assertEqual(values['family_request_sql_queries_bucket{view="home",le="0"}'], 1)  # the warm dashboard
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_their_worst_queries(self):
+        with self.assertLogs("app.metrics", "WARNING") as logs:
+            self.client.get(reverse("first"))
+        self.assertIn("(first)", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_metrics_are_not_public(self):
+        # Loopback is what every client looks like behind the front web server
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="127.0.0.1").status_code, 403)
+        self.assertEqual(self.client.get(reverse("metrics"), headers={"Authorization": "Bearer guess"}).status_code, 403)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(reverse("metrics"), headers={"Authorization": "Bearer "}).status_code, 403)
+
+
+class AllocationTests(BudgetTestCase):
+    def test_waterfall_spills_over_in_order(self):
+        self.set_budget()  # limits 300 / 200 / 100, savings 400
+        allocation.add_expense(self.user, "Mandatory", "rent", 450)
+        allocation.add_expense(self.user, "Sudden Expense", "repair", 150)
+
+        summary = BudgetSummary.objects.get(user=self.user)
+        self.assertEqual((summary.mandatory, summary.basic_needs, summary.sudden_expenses), (300, 200, 100))
+        self.assertEqual(summary.savings, 400)
+
+        allocation.add_expense(self.user, "Basic Needs", "food", 50)
+        summary.refresh_from_db()
+        self.assertEqual(summary.savings, 350)
+        self.assertEqual(summary.version, 3)
+
+    def test_insufficient_savings_rolls_everything_back(self):
+        self.set_budget()
+        with self.assertRaises(allocation.InsufficientFunds):
+            allocation.add_expense(self.user, "Mandatory", "car", 5000)
+
+        summary = BudgetSummary.objects.get(user=self.user)
+        self.assertEqual((summary.mandatory, summary.savings, summary.version), (0, 400, 0))
+        self.assertFalse(MandatoryExpense.objects.exists())
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_amounts_must_be_positive(self):
+        self.set_budget()
+        response = self.add_expense("Mandatory", -500)
+        self.assertEqual(response.context["error_message"], "Amount must be more than zero!")
+        with self.assertRaises(allocation.AllocationError):
+            allocation.add_expense(self.user, "Mandatory", "nothing", money.ZERO)
+        results = allocation.add_expenses(self.user, [("Mandatory", "refund", money.rupees(-5), None, None)])
+        self.assertIsInstance(results[0], allocation.AllocationError)
+
+        self.assertFalse(MandatoryExpense.objects.exists())
+        self.assertEqual(BudgetSummary.objects.get(user=self.user).version, 0)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_no_budget(self):
+        with self.assertRaises(allocation.NoBudget):
+            allocation.add_expense(self.user, "Mandatory", "rent", 10)
+
+
+class ConcurrentAllocationTests(BudgetTestMixin, TransactionTestCase):
+    """Hundreds of expenses submitted in parallel must all be accounted for exactly."""
+
+    def test_parallel_submissions_do_not_lose_updates(self):
+        self.set_budget(salary=10000, mandatory=300, basic_needs=200, sudden=100)  # 9400 savings
+        categories = list(allocation.WATERFALL)
+        barrier = threading.Barrier(8)
+
+        def submit(i):
+            if i < 8:
+                barrier.wait()
+            try:
+                allocation.add_expense(self.user, categories[i % 3], f"item {i}", 5)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(submit, range(300)))
+
+        summary = BudgetSummary.objects.get(user=self.user)
+        spent = summary.mandatory + summary.basic_needs + summary.sudden_expenses
+        self.assertEqual(spent, 600)  # every category limit is used up...
+        self.assertEqual(summary.savings, 9400 - 900)  # ...and the other 900 came out of savings
+        self.assertEqual(summary.version, 300)
+        self.assertEqual(sum(m.objects.count() for m in (MandatoryExpense, BasicNeedsExpense, SuddenExpense)), 300)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+
+class DashboardCacheTests(BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_budget()
+
+    def test_warm_dashboard_needs_no_queries(self):
+        self.assertEqual(self.client.get(reverse("home"))["X-Dashboard-Cache"], "miss")
+        with self.assertNumQueries(0):  # session, account and dashboard all cached
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response["X-Dashboard-Cache"], "hit")
+        self.assertEqual(response.context["remaining_salary"], 600)
+
+    def test_writes_invalidate_the_dashboard(self):
+        self.client.get(reverse("home"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_expense("Mandatory", 100)
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response["X-Dashboard-Cache"], "miss")
+        self.assertEqual(response.context["remaining_salary"], 500)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("delete", args=[MandatoryExpense.objects.get().id]))
+        self.assertEqual(self.client.get(reverse("home")).context["remaining_salary"], 600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_budget(salary=2000)
+        self.assertEqual(self.client.get(reverse("home")).context["total_savings"], 1400)
+
+    def test_counters(self):
+        before = caching.stats()
+        self.client.get(reverse("home"))
+        self.client.get(reverse("home"))
+        after = caching.stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+
+class HouseholdTests(BudgetTestCase):
+    def switch_to(self, user):
+        session = self.client.session
+        session["user_id"] = user.user_id
+        session.save()
+
+    def household(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):  # the cached account is dropped on commit
+            return self.client.post(reverse("household"), data)
+
+    def test_members_share_a_dashboard_served_from_the_rollup(self):
+        self.set_budget()
+        self.add_expense("Mandatory", 100)  # before joining: added to the household when asha joins
+        self.household(action="create", name="Sharmas")
+        household = Household.objects.get()
+
+        ravi = make_user("ravi")
+        self.switch_to(ravi)
+        self.set_budget(salary=2000)
+        self.household(action="join", code=household.code)
+        self.add_expense("Basic Needs", 40)
+        self.add_expense("Sudden Expense", 70)
+        self.household(action="budget", mandatory_limit=500, basic_needs_limit=30, sudden_expenses_limit=200)
+
+        with CaptureQueriesContext(connection) as queries:
+            context = self.client.get(reverse("household")).context
+        tables = [model._meta.db_table for model, _ in EXPENSE_CATEGORIES.values()]
+        self.assertFalse([query for query in queries for table in tables if table in query["sql"]])
+        self.assertEqual([row["member"].username for row in context["members"]], ["asha", "ravi"])
+        self.assertEqual(context["members"][0]["total"], 100)
+        self.assertEqual([category["spent"] for category in context["categories"]], [100, 40, 70])
+        self.assertEqual(context["categories"][1]["remaining"], -10)
+        self.assertEqual((context["total"], context["salary"]), (210, 3000))
+        self.assertEqual(rollups.check_household(household), [])
+
+        self.client.post(reverse("delete", args=[BasicNeedsExpense.objects.get().id]))
+        self.assertEqual(HouseholdRollup.objects.get().basic_needs, 0)
+        self.assertEqual(self.household(action="join", code=household.code).status_code, 302)
+        self.assertEqual(household.members.count(), 2)  # already a member: refused
+
+        self.household(action="leave")
+        self.assertEqual(HouseholdRollup.objects.get().sudden_expenses, 0)
+        self.assertEqual(rollups.check_household(household), [])
+        self.switch_to(self.user)
+        self.household(action="leave")
+        self.assertFalse(Household.objects.exists())
+
+    def test_deleting_a_member_takes_their_spend_out(self):
+        self.set_budget()
+        self.household(action="create", name="Sharmas")
+        self.add_expense("Mandatory", 100)
+        household = Household.objects.get()
+        ravi = make_user("ravi")
+        households.join(ravi, household.code)
+        ravi.refresh_from_db()
+        self.user.delete()
+        self.assertEqual(HouseholdRollup.objects.get().mandatory, 0)
+        self.assertEqual(rollups.check_household(household), [])
+        rollups.rebuild_household(household)
+        self.assertEqual(rollups.check_household(household), [])
+
+
+class ImportTests(BudgetTestCase):
+    def test_import_streams_rows_into_tables_rollups_and_summary(self):
+        self.set_budget()  # limits 300 / 200 / 100 for this month
+        this_month = now().strftime("%Y-%m")
+        csv_text = "\n".join([
+            "Date,Description,Amount,Category",
+            f"{this_month}-01,Rent,250,Mandatory",
+            f"{this_month}-02 09:30,Groceries,\"1,00.50\",basic needs",
+            f"{this_month}-03,Phone repair,150,Sudden",
+            "2023-01-15,Old bill,40,Mandatory",
+            "2023-01-16,Refund,-40,Mandatory",
+            "not a date,Broken,10,Mandatory",
+            f"{this_month}-04,Cinema,30,",
+        ])
+        report = import_csv(self.user, io.StringIO(csv_text), batch_size=2)
+
+        self.assertEqual((report.rows, report.imported, report.skipped), (7, 4, 3))
+        self.assertEqual(len(report.errors), 3)
+        self.assertEqual(MandatoryExpense.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(MandatoryExpense.objects.get(expense="Old bill").timestamp.year, 2023)
+
+        summary = BudgetSummary.objects.get(user=self.user, month=now().month)
+        # Replayed in date order: 250 mandatory, 100.5 basic needs, 150 sudden -> 100 + 50 spilled to basic needs
+        self.assertEqual((summary.mandatory, summary.basic_needs, summary.sudden_expenses), (250, 150.5, 100))
+        self.assertEqual(summary.savings, 400)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_upload_endpoint(self):
+        self.set_budget()
+        upload = io.BytesIO(f"date,description,amount\n{now():%Y-%m-%d},Milk,20\n".encode())
+        upload.name = "statement.csv"
+        response = self.client.post(reverse("import_expenses"), {"statement": upload, "default_category": "Basic Needs"})
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+        self.assertEqual(BasicNeedsExpense.objects.get(user=self.user).amount, 20)
+
+    def test_file_that_is_not_utf8_stops_with_saved_chunks_summarised(self):
+        self.set_budget(mandatory=100000)
+        # Past the text reader's first 8 KiB, so some chunks are saved before the bad byte
+        rows = "".join(f"{now():%Y-%m-%d},Rent {i},1,Mandatory\n" for i in range(1000))
+        data = f"date,description,amount,category\n{rows}".encode() + b"\xff,bad,1,Mandatory\n"
+        report = import_csv(self.user, io.TextIOWrapper(io.BytesIO(data), encoding="utf-8"), batch_size=100)
+
+        self.assertIn("not UTF-8", report.failed)
+        saved = MandatoryExpense.objects.filter(user=self.user).count()
+        self.assertGreater(saved, 0)
+        self.assertEqual(BudgetSummary.objects.get(user=self.user, month=now().month).mandatory, saved)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_upload_that_is_not_utf8_is_reported(self):
+        self.set_budget()
+        upload = io.BytesIO(b"date,description,amount\n\xff,Milk,20\n")
+        upload.name = "statement.csv"
+        response = self.client.post(reverse("import_expenses"), {"statement": upload}, follow=True)
+        self.assertContains(response, "the file is not UTF-8 text")
+
+    def test_upload_rejects_unknown_default_category(self):
+        self.set_budget()
+        upload = io.BytesIO(f"date,description,amount\n{now():%Y-%m-%d},Milk,20\n".encode())
+        upload.name = "statement.csv"
+        response = self.client.post(
+            reverse("import_expenses"), {"statement": upload, "default_category": "bogus"}, follow=True,
+        )
+        self.assertContains(response, "unknown category &#x27;bogus&#x27;")
+        self.assertFalse(BasicNeedsExpense.objects.exists())
+
+
+class ExportTests(BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = make_user("ravi")
+        MandatoryExpense.objects.create(user=self.user, expense="Rent", amount=250)
+        old = SuddenExpense.objects.create(user=self.user, expense="Old repair", amount=75)
+        SuddenExpense.objects.filter(pk=old.pk).update(timestamp=now().replace(year=2020))
+        BasicNeedsExpense.objects.create(user=self.other, expense="Milk", amount=20)
+
+    def test_csv_streams_only_the_users_rows(self):
+        response = self.client.get(reverse("export_expenses"))
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "category,id,username,timestamp,expense,amount,image")
+        self.assertEqual(len(lines), 3)
+        self.assertNotIn("Milk", "\n".join(lines))
+
+    def test_ndjson_with_date_range(self):
+        response = self.client.get(reverse("export_expenses"), {"format": "ndjson", "since": "2021-01-01"})
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r["expense"] for r in records], ["Rent"])
+        self.assertEqual(records[0]["username"], "asha")
+
+    def test_superuser_exports_everyone(self):
+        User.objects.create_superuser("admin", "admin@example.com", "secret")
+        self.client.login(username="admin", password="secret")
+        response = self.client.get(reverse("export_expenses"), {"format": "ndjson"})
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 3)
+
+
+def make_image(size=(1920, 1080), color="red", fmt="PNG", name="receipt.png"):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, fmt)
+    return SimpleUploadedFile(name, out.getvalue(), content_type=f"image/{fmt.lower()}")
+
+
+def make_receipt(seed=0, size=(800, 1200), fmt="PNG", quality=95, name="receipt.png"):
+    """A blocky random pattern, so different seeds hash differently (flat colours all hash to 0)."""
+    pattern = Image.frombytes("L", (12, 12), random.Random(seed).randbytes(144)).resize(size, Image.NEAREST)
+    out = io.BytesIO()
+    pattern.convert("RGB").save(out, fmt, **({"quality": quality} if fmt == "JPEG" else {}))
+    return SimpleUploadedFile(name, out.getvalue(), content_type=f"image/{fmt.lower()}")
+
+
+class ReceiptTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root, RECEIPT_PROCESS_INLINE=True)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+
+class ReceiptVariantTests(ReceiptTestMixin, BudgetTestCase):
+    def test_upload_gets_thumbnail_and_display_copy_after_commit(self):
+        self.set_budget()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("home"), {
+                "category": "Mandatory", "expense": "Rent", "amount": 100, "image": make_image(),
+            })
+
+        expense = MandatoryExpense.objects.get()
+        self.assertRegex(expense.image.name, r"^expenses/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+        with default_storage.open(expense.thumbnail.name) as handle:
+            self.assertEqual(max(Image.open(handle).size), 160)
+        with default_storage.open(expense.display_image.name) as handle:
+            self.assertEqual(max(Image.open(handle).size), 1600)
+
+        html = self.client.get(reverse("month_history")).content.decode()
+        self.assertIn(expense.thumbnail.url, html)
+        self.assertIn(expense.display_image.url, html)
+
+
+class ReceiptServingTests(ReceiptTestMixin, BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.set_budget()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("home"), {
+                "category": "Mandatory", "expense": "Rent", "amount": 100, "image": make_image(),
+            })
+        self.expense = MandatoryExpense.objects.get()
+        with default_storage.open(self.expense.image.name) as handle:
+            self.original = handle.read()
+
+    def get(self, name, **headers):
+        return self.client.get(settings.MEDIA_URL + name, headers=headers)
+
+    def test_owner_gets_cacheable_file_and_304_when_unchanged(self):
+        response = self.get(self.expense.image.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.original)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertTrue(response["ETag"].startswith('"'))
+
+        again = self.get(self.expense.image.name, if_none_match=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], response["ETag"])
+        self.assertEqual(self.get(self.expense.thumbnail.name).status_code, 200)
+
+    def test_byte_ranges(self):
+        size = len(self.original)
+        response = self.get(self.expense.image.name, range="bytes=0-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 0-9/{size}")
+        self.assertEqual(b"".join(response.streaming_content), self.original[:10])
+
+        response = self.get(self.expense.image.name, range="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), self.original[-5:])
+        self.assertEqual(self.get(self.expense.image.name, range=f"bytes={size}-").status_code, 416)
+        # A changed file (other validator) gets the whole body again
+        self.assertEqual(self.get(self.expense.image.name, range="bytes=0-9", if_range='"stale"').status_code, 200)
+
+    def test_other_families_and_strangers_are_refused(self):
+        self.client.logout()
+        self.assertEqual(self.get(self.expense.image.name).status_code, 302)
+
+        other = make_user("ravi")
+        session = self.client.session
+        session["user_id"] = other.user_id
+        session.save()
+        self.assertEqual(self.get(self.expense.image.name).status_code, 404)
+
+    def test_hands_off_to_front_server(self):
+        with override_settings(RECEIPT_SENDFILE="X-Accel-Redirect"):
+            response = self.get(self.expense.image.name)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + self.expense.image.name)
+        self.assertEqual(response.content, b"")
+        with override_settings(RECEIPT_SENDFILE="X-Sendfile"):
+            response = self.get(self.expense.image.name)
+        self.assertEqual(response["X-Sendfile"], default_storage.path(self.expense.image.name))
+
+
+class StaticAssetTests(BudgetTestCase):
+    def test_pages_link_their_assets_and_cache_the_budget_data(self):
+        self.set_budget()
+        html = self.client.get(reverse("home")).content.decode()
+        self.assertNotIn("<style>", html)
+        self.assertIn("/static/app/css/home.css", html)
+        self.assertIn('"spent": {"mandatory": 0.00,', html)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_expense("Mandatory", 100)  # bumps the summary's version, so a new fragment
+        self.assertIn('"spent": {"mandatory": 100.00,', self.client.get(reverse("home")).content.decode())
+
+    def test_hashed_names_are_immutable(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        manifest = {**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"}}
+        with override_settings(STATIC_ROOT=root, STORAGES=manifest):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            hashed = views.media.staticfiles_storage.stored_name("app/css/home.css")
+            self.assertNotEqual(hashed, "app/css/home.css")
+            request = RequestFactory().get("/static/" + hashed)
+            response = views.static_asset(request, hashed)
+            self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+            self.assertEqual(views.static_asset(request, "app/css/home.css")["Cache-Control"], "public, no-cache")
+
+
+class ReceiptDeduplicationTests(ReceiptTestMixin, BudgetTestCase):
+    def post(self, image, expense="Rent"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("home"), {
+                "category": "Mandatory", "expense": expense, "amount": 100, "image": image,
+            }, follow=True)
+
+    def test_identical_uploads_share_one_file(self):
+        self.set_budget()
+        self.post(make_receipt(name="Screenshot_2.png"))
+        self.post(make_receipt(name="Screenshot_2.png"))
+
+        first, second = MandatoryExpense.objects.order_by("id")
+        self.assertEqual(first.image.name, second.image.name)
+        _, stored = default_storage.listdir("expenses/" + first.image.name.split("/")[1])
+        self.assertEqual(len(stored), 1)
+
+    def test_duplicate_receipt_warns(self):
+        self.set_budget()
+        self.post(make_receipt(seed=1), expense="Electricity")
+        response = self.post(make_receipt(seed=1, fmt="JPEG", quality=60, size=(600, 900), name="scan.jpg"))
+
+        self.assertContains(response, "very similar to the one on &quot;Electricity&quot;")
+        self.assertEqual(ReceiptFingerprint.objects.count(), 2)
+
+    def test_different_receipt_does_not_warn(self):
+        self.set_budget()
+        self.post(make_receipt(seed=1))
+        response = self.post(make_receipt(seed=2))
+        self.assertNotContains(response, "This receipt is")
+
+    def test_lookup_uses_band_indexes(self):
+        fp = fingerprints.Fingerprint("0" * 64, 2**64 - 1)
+        with CaptureQueriesContext(connection) as ctx:
+            fingerprints.find_similar(self.user, fp)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plans.append(" ".join(str(row) for row in cursor.fetchall()))
+        self.assertEqual(len(plans), 2)  # exact file, then bands
+        self.assertIn("MULTI-INDEX OR", plans[1])
+        for plan in plans:
+            self.assertNotIn("SCAN", plan)
+
+    def test_identical_file_is_found_past_the_band_cap(self):
+        fp = fingerprints.Fingerprint("a" * 64, 0)
+        fields = {"user": self.user, "category": "Mandatory", "phash": 0, "band0": 0, "band1": 0, "band2": 0, "band3": 0}
+        ReceiptFingerprint.objects.create(expense_id=1, sha256=fp.sha256, **fields)
+        ReceiptFingerprint.objects.bulk_create(
+            ReceiptFingerprint(expense_id=i, sha256=f"{i:064x}", **fields)
+            for i in range(2, fingerprints.MAX_BAND_CANDIDATES + 10)
+        )
+        matches = fingerprints.find_similar(self.user, fp, limit=1)
+        self.assertEqual([(record.expense_id, distance) for record, distance in matches], [(1, 0)])
+
+    def test_deleting_expense_drops_fingerprint(self):
+        self.set_budget()
+        self.post(make_receipt())
+        expense = MandatoryExpense.objects.get()
+        self.client.post(reverse("delete", args=[expense.id]))
+        self.assertFalse(ReceiptFingerprint.objects.exists())
+
+
+class ExpenseApiTests(ReceiptTestMixin, BudgetTestCase):
+    def submit(self, *items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("api_expenses"), {"expenses": list(items)}, content_type="application/json")
+
+    def test_batch_is_allocated_with_one_summary_write(self):
+        self.set_budget()  # limits 300 / 200 / 100, savings 400
+        version = BudgetSummary.objects.get().version
+        response = self.submit(
+            {"category": "Mandatory", "description": "rent", "amount": 250},
+            {"category": "Mandatory", "description": "school fees", "amount": "100.50"},  # 50.50 spills into basic needs
+            {"category": "Groceries", "description": "milk", "amount": 10},
+            {"category": "Sudden Expense", "description": "car repair", "amount": 1000},  # needs 750.50 of 400 savings
+            {"category": "Sudden Expense", "description": "medicines", "amount": 120},  # 100 + 20 from basic needs
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["created"], 3)
+        self.assertEqual(
+            [(result["index"], result["status"]) for result in body["results"]],
+            [(0, "created"), (1, "created"), (2, "rejected"), (3, "rejected"), (4, "created")],
+        )
+        self.assertEqual(body["results"][3]["error"], "Insufficient funds!")
+        self.assertEqual(body["results"][1]["expense"]["amount"], 100.5)
+
+        summary = BudgetSummary.objects.get()
+        self.assertEqual(summary.version, version + 1)
+        self.assertEqual((summary.mandatory, summary.basic_needs, summary.sudden_expenses), (300, Decimal("70.50"), 100))
+        self.assertEqual(rollups.check_consistency(self.user), [])
+        self.assertEqual(ExpenseStats.objects.get(user=self.user, category="Mandatory").count, 2)
+        self.assertEqual(self.client.get(reverse("home")).context["remaining_salary"], Decimal("129.50"))
+
+    def test_receipts_come_as_file_parts(self):
+        self.set_budget()
+        batch = [
+            {"category": "Mandatory", "description": "rent", "amount": 100, "receipt": "photo"},
+            {"category": "Mandatory", "description": "water", "amount": 10, "receipt": "missing"},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("api_expenses"), {"expenses": json.dumps(batch), "photo": make_image()})
+        first, second = response.json()["results"]
+        self.assertEqual(second["error"], "no file part named 'missing'")
+        expense = MandatoryExpense.objects.get()
+        self.assertEqual(first["expense"]["receipt"], expense.image.url)
+        self.assertTrue(expense.thumbnail)  # processed after commit
+        self.assertEqual(ReceiptFingerprint.objects.get().expense_id, expense.id)
+
+    def test_list_pages_and_delete(self):
+        self.set_budget()
+        self.submit(*({"category": "Basic Needs", "description": f"item {n}", "amount": n} for n in range(1, 31)))
+
+        page = self.client.get(reverse("api_expenses"), {"page_size": 25}).json()
+        self.assertEqual(len(page["expenses"]), 25)
+        rest = self.client.get(reverse("api_expenses"), {"page_size": 25, "after": page["next"]}).json()
+        self.assertEqual(len(rest["expenses"]), 5)
+        self.assertIsNone(rest["next"])
+        self.assertEqual(len({row["id"] for row in page["expenses"] + rest["expenses"]}), 30)
+
+        url = page["expenses"][0]["url"]
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(BasicNeedsExpense.objects.count(), 29)
+        self.assertEqual(rollups.check_consistency(self.user), [])
+
+    def test_errors(self):
+        self.assertEqual(self.submit({"category": "Mandatory", "description": "rent", "amount": 1}).status_code, 409)
+        self.assertEqual(self.submit().status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api_expenses")).status_code, 401)
+
+
+class ForecastTests(BudgetTestCase):
+    def test_projection_blends_month_so_far_with_trend(self):
+        data = forecast.SpendData(
+            user_ids=np.array([1, 2]),
+            daily=np.zeros((2, 3, 31)),
+            history=np.zeros((2, 3, 6)),
+            profile=np.ones((3, 31)),  # spend spread evenly over the month
+        )
+        data.daily[0, 0, :10] = 10  # 100 in the first 10 days, no history
+        data.history[1, 0] = [100, 200, 300, 400, 500, 600]  # nothing yet this month, rising trend
+
+        projected = forecast.project(data, day=10, days_in_month=31)
+
+        self.assertAlmostEqual(projected[0, 0], 310)
+        self.assertAlmostEqual(projected[1, 0], 700 * 21 / 31)
+        self.assertEqual(projected[:, 1:].sum(), 0)
+
+    def test_projection_never_below_spent(self):
+        data = forecast.SpendData(np.array([1]), np.zeros((1, 3, 31)), np.zeros((1, 3, 6)), np.ones((3, 31)))
+        data.daily[0, 2, 0] = 500
+        data.history[0, 2] = 10
+        self.assertGreaterEqual(forecast.project(data, day=2, days_in_month=30)[0, 2], 500)
+
+    def test_run_stores_forecasts_shown_on_home(self):
+        self.set_budget()  # limits 300 / 200 / 100
+        self.add_expense("Mandatory", 250)
+        today = now()
+        MandatoryExpense.objects.update(timestamp=month_bounds(today.year, today.month)[0])  # spent on the 1st
+
+        report = forecast.run(today.month, today.year, day=1)
+
+        self.assertEqual(list(report.user_ids), [self.user.user_id])
+        stored = SpendForecast.objects.get(user=self.user, month=today.month, year=today.year)
+        self.assertGreater(stored.mandatory, 250)
+        self.assertEqual(report.over_budget, 1)
+
+        caching.invalidate_dashboards(report.user_ids, today.month, today.year)
+        rows = self.client.get(reverse("home")).context["forecast"]
+        self.assertEqual(rows[0][:2], ("Mandatory", 250))
+        self.assertEqual(rows[0][2], stored.mandatory)
+
+
+class AnomalyTests(BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.set_budget(salary=100000, mandatory=50000, basic_needs=30000, sudden=10000)
+        self.amounts = [120, 95, 140, 110, 80, 130, 105, 150, 90, 125, 115, 100]
+        for amount in self.amounts:
+            self.add_expense("Basic Needs", amount)
+
+    def assertStatsMatch(self, amounts):
+        stats = ExpenseStats.objects.get(user=self.user, category="Basic Needs")
+        self.assertEqual(stats.count, len(amounts))
+        self.assertAlmostEqual(stats.mean, np.mean(amounts))
+        self.assertAlmostEqual(anomalies.std(stats), np.std(amounts, ddof=1))
+        self.assertEqual(sum(stats.sketch.values()), len(amounts))
+        return stats
+
+    def test_statistics_follow_inserts_and_deletes(self):
+        self.assertStatsMatch(self.amounts)
+        expense = BasicNeedsExpense.objects.get(amount=150)
+        self.client.post(reverse("delete", args=[expense.id]))
+        incremental = self.assertStatsMatch([amount for amount in self.amounts if amount != 150])
+
+        anomalies.rebuild()
+        rebuilt = ExpenseStats.objects.get(user=self.user, category="Basic Needs")
+        self.assertAlmostEqual(rebuilt.m2, incremental.m2)
+        self.assertEqual(rebuilt.sketch, incremental.sketch)
+
+    def test_rebuild_streams_each_user_separately(self):
+        other = make_user("ravi")
+        for amount in (10, 20, 30):
+            BasicNeedsExpense.objects.create(user=other, expense="tea", amount=amount)
+        self.assertEqual(anomalies.rebuild(batch_size=1), 2)  # one row per user with basic needs expenses
+        self.assertStatsMatch(self.amounts)
+        stats = ExpenseStats.objects.get(user=other, category="Basic Needs")
+        self.assertEqual((stats.count, stats.mean), (3, 20.0))
+        self.assertAlmostEqual(anomalies.std(stats), 10.0)
+
+    def test_import_merges_statistics(self):
+        import_csv(self.user, io.StringIO(
+            "date,description,amount,category\n"
+            f"{now():%d-%m-%Y},milk,60,Basic Needs\n"
+            f"{now():%d-%m-%Y},rice,300,Basic Needs\n"
+        ))
+        self.assertStatsMatch(self.amounts + [60, 300])
+
+    def test_unusual_amount_is_flagged(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(anomalies.check(self.user, "Basic Needs", 160))
+        self.assertTrue(anomalies.check(self.user, "Basic Needs", 2000))
+        self.assertFalse(anomalies.check(self.user, "Mandatory", 2000))  # no history there yet
+
+        response = self.client.post(reverse("home"), {
+            "category": "Basic Needs", "expense": "new phone", "amount": 2000,
+        }, follow=True)
+        self.assertContains(response, "is unusually high for Basic Needs")
+        response = self.client.post(reverse("home"), {
+            "category": "Basic Needs", "expense": "groceries", "amount": 135,
+        }, follow=True)
+        self.assertNotContains(response, "unusually high")
+
+
+LABELLED = {
+    "Mandatory": ["house rent", "electricity bill", "school fees", "home loan emi", "water bill", "insurance premium"],
+    "Basic Needs": ["groceries", "vegetables and fruits", "milk", "rice and dal", "bus pass", "cooking gas"],
+    "Sudden Expense": ["hospital visit", "car repair", "broken phone screen", "plumber for leak", "medicines", "wedding gift"],
+}
+
+
+class ClassifierTests(BudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(CLASSIFIER_PATH=f"{self.directory}/classifier.npz")
+        self.override.enable()
+        classifier.reset()
+        for category, descriptions in LABELLED.items():
+            model, _ = EXPENSE_CATEGORIES[category]
+            model.objects.bulk_create([model(user=self.user, expense=text, amount=10) for text in descriptions * 3])
+
+    def tearDown(self):
+        classifier.reset()
+        self.override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().tearDown()
+
+    def test_trained_model_suggests_categories_quickly(self):
+        _, used = classifier.train()
+        self.assertEqual(used, 54)
+
+        self.assertEqual(classifier.suggest("Electricity bill for March")[0], "Mandatory")
+        self.assertEqual(classifier.suggest("vegetables")[0], "Basic Needs")
+        self.assertEqual(classifier.suggest("car repair at garage")[0], "Sudden Expense")
+        self.assertEqual(
+            [category for category, _ in classifier.suggest_many(["rent", "milk", "hospital"])],
+            ["Mandatory", "Basic Needs", "Sudden Expense"],
+        )
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            classifier.suggest("monthly grocery shopping at the store")
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+    def test_model_is_loaded_once_per_process(self):
+        classifier.train()
+        model = classifier.get_model()
+        self.assertIs(classifier.get_model(), model)
+        self.assertEqual(model.samples, 54 * classifier.EPOCHS)
+
+    def test_learns_new_expenses_incrementally(self):
+        classifier.train()
+        self.assertNotEqual(classifier.suggest("netflix subscription")[0], "Mandatory")
+
+        self.set_budget(salary=10000, mandatory=5000, basic_needs=3000, sudden=1000)
+        for _ in range(5):
+            self.client.post(reverse("home"), {"category": "Mandatory", "expense": "netflix subscription", "amount": 10})
+        self.assertEqual(classifier.suggest("netflix subscription")[0], "Mandatory")
+
+        # The next incremental run only trains on the expenses added since, then reloads
+        _, used = classifier.train(incremental=True)
+        self.assertEqual(used, 5)
+        self.assertEqual(classifier.suggest("netflix subscription")[0], "Mandatory")
+
+    def test_suggest_endpoint_and_auto_import(self):
+        classifier.train()
+        response = self.client.get(reverse("suggest_category"), {"description": "house rent for march"})
+        self.assertEqual(response.json()["category"], "Mandatory")
+
+        self.set_budget()
+        report = import_csv(self.user, io.StringIO(
+            "date,description,amount\n"
+            f"{now():%Y-%m-%d},school fees term 2,40\n"
+            f"{now():%Y-%m-%d},medicines for fever,30\n"
+        ), default_category="auto")
+        self.assertEqual(report.imported, 2)
+        self.assertTrue(MandatoryExpense.objects.filter(expense="school fees term 2").exists())
+        self.assertTrue(SuddenExpense.objects.filter(expense="medicines for fever").exists())
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_families_are_consistent_and_reproducible(self):
+        data = synthetic.generate(3, 2, seed=7, prefix="gen")
+
+        self.assertEqual([user.username for user in data.users], ["gen0", "gen1", "gen2"])
+        self.assertEqual(BudgetSummary.objects.filter(user__in=data.users).count(), 6)
+        for user in data.users:
+            self.assertEqual(rollups.check_consistency(user), [])
+            self.assertEqual(
+                ExpenseStats.objects.filter(user=user).aggregate(n=Sum("count"))["n"],
+                sum(model.objects.filter(user=user).count() for model, _ in EXPENSE_CATEGORIES.values()),
+            )
+        self.assertTrue(self.client.post(reverse("login"), {"username": "gen0", "password": synthetic.PASSWORD}).url)
+
+        amounts = sorted(BasicNeedsExpense.objects.values_list("amount", flat=True))
+        UserAccount.objects.all().delete()
+        synthetic.generate(3, 2, seed=7, prefix="gen", stats=False)
+        self.assertEqual(sorted(BasicNeedsExpense.objects.values_list("amount", flat=True)), amounts)
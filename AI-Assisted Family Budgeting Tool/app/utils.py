@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from django.utils.timezone import get_current_timezone
+
+
+def month_bounds(year, month):
+    """
+    Aware [start, end) datetimes for a calendar month.
+    Filtering on this range (instead of timestamp__month/__year, which wraps
+    the column in a function) lets the database seek the (user, timestamp) index.
+    """
+    tz = get_current_timezone()
+    start = datetime(year, month, 1, tzinfo=tz)
+    if month == 12:
+        end = datetime(year + 1, 1, 1, tzinfo=tz)
+    else:
+        end = datetime(year, month + 1, 1, tzinfo=tz)
+    return start, end
+
+
+def shift_month(year, month, delta):
+    """(year, month) ``delta`` months after (or before) year/month."""
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
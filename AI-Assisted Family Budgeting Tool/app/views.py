@@ -1,9 +1,18 @@
-from django.shortcuts import render, redirect
+import io
+from datetime import date
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.timezone import now
-from django.db.models import Sum
-from .models import BudgetDetails, MandatoryExpense, BasicNeedsExpense, SuddenExpense, BudgetSummary, UserAccount
+from django.db.models import F
+from .models import BudgetDetails, MandatoryExpense, BasicNeedsExpense, SuddenExpense, BudgetSummary, UserAccount, EXPENSE_CATEGORIES
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.hashers import make_password, check_password
+from django.utils.crypto import constant_time_compare
+from . import allocation, analytics, anomalies, archive, caching, classifier, exporter, fingerprints, households, media, metrics, money, rollups, sharding
+from .importer import AUTO_CATEGORY, import_csv
+from .middleware import account_required
+from .utils import month_bounds
 
 
 def register(request):
@@ -31,31 +40,30 @@ def register(request):
 
 
         # Check if email already exists
-        if UserAccount.objects.filter(username=username).exists():
+        if sharding.account_exists(username=username):
             error_message= "Username already registered!"
             return render(request, "register.html", {"error_message": error_message})
 
         
-        if UserAccount.objects.filter(email=email).exists():
+        if sharding.account_exists(email=email):
             error_message= "Email already registered!"
             return render(request, "register.html", {"error_message": error_message})
 
             
 
         # Check if phone number already exists
-        if UserAccount.objects.filter(phone_number=phone_number).exists():
+        if sharding.account_exists(phone_number=phone_number):
             error_message= "Phone number already registered!"
             return render(request, "register.html", {"error_message": error_message})
 
 
         # Save user
-        user = UserAccount(
+        sharding.create_account(
             username=username,
             phone_number=phone_number,
             email=email,
             password=make_password(password)  # Hash the password before saving
         )
-        user.save()
         return redirect("login")
 
     return render(request, "register.html", {"error_message": error_message})
@@ -72,7 +80,7 @@ def login_view(request):
             error_message = "Username and password are required!"
         else:
             super_user = User.objects.filter(username=username).first()
-            user = UserAccount.objects.filter(username=username).first()
+            user = sharding.find_account(username=username)  # via the shard map when sharded
             if super_user and super_user.is_superuser:
                 return redirect("/admin/")
 
@@ -95,60 +103,63 @@ def logout_view(request):
 
 
 
-def calculate_savings(user):
-    """
-    Calculate total savings for the logged-in user from all BudgetSummary entries.
-    """
-    total_savings = BudgetSummary.objects.filter(user=user).aggregate(total=Sum('savings'))['total']
-    return total_savings if total_savings else 0
-
+@account_required
 def first(request):
-    # Ensure user is logged in
-    user_id = request.session.get("user_id")
-    if not user_id:
-        return redirect("login")  # Redirect to login if not authenticated
+    user = request.account  # set by CurrentAccountMiddleware
 
-    # Get the logged-in user
-    user = UserAccount.objects.get(user_id=user_id)
-
-    total_savings = calculate_savings(user)
     month = now().month
     year = now().year
 
     if request.method == "POST":
-        actual_salary = float(request.POST["salary"])
-        mandatory_limit = float(request.POST["mandatory_limit"])
-        basic_needs_limit = float(request.POST["basic_needs_limit"])
-        sudden_expenses_limit = float(request.POST["sudden_expenses_limit"])
+        actual_salary = money.rupees(request.POST["salary"])
+        mandatory_limit = money.rupees(request.POST["mandatory_limit"])
+        basic_needs_limit = money.rupees(request.POST["basic_needs_limit"])
+        sudden_expenses_limit = money.rupees(request.POST["sudden_expenses_limit"])
 
         active_salary = mandatory_limit + basic_needs_limit + sudden_expenses_limit
 
-        # Save budget details for the user
-        budget = BudgetDetails(
-            user=user,
-            month=month,
-            year=year,
-            actual_salary=actual_salary,
-            active_salary=active_salary,
-            mandatory_limit=mandatory_limit,
-            basic_needs_limit=basic_needs_limit,
-            sudden_expenses_limit=sudden_expenses_limit,
-        )
-        budget.save()
-
-        # Save initial budget summary for the user
         savings = actual_salary - active_salary
 
-        summary = BudgetSummary(
-            user=user,
-            month=month,
-            year=year,
-            mandatory=0,
-            basic_needs=0,
-            sudden_expenses=0,
-            savings=savings,
-        )
-        summary.save()
+        with sharding.atomic():
+            # There is exactly one budget and one summary per user-month, so
+            # saving the form again updates them in place.
+            previous = BudgetDetails.objects.filter(user=user, month=month, year=year).first()
+
+            BudgetDetails.objects.update_or_create(
+                user=user,
+                month=month,
+                year=year,
+                defaults={
+                    "actual_salary": actual_salary,
+                    "active_salary": active_salary,
+                    "mandatory_limit": mandatory_limit,
+                    "basic_needs_limit": basic_needs_limit,
+                    "sudden_expenses_limit": sudden_expenses_limit,
+                },
+            )
+
+            summary = BudgetSummary.objects.select_for_update().filter(user=user, month=month, year=year).first()
+            if summary is None:
+                # Save initial budget summary for the user
+                BudgetSummary.objects.create(
+                    user=user,
+                    month=month,
+                    year=year,
+                    mandatory=0,
+                    basic_needs=0,
+                    sudden_expenses=0,
+                    savings=savings,
+                )
+                rollups.adjust_savings(user, savings)
+            else:
+                # Keep what was already spent this month, including anything
+                # that had to be drawn from savings under the old budget.
+                drawn = 0
+                if previous:
+                    drawn = (previous.actual_salary - previous.active_salary) - summary.savings
+                new_savings = savings - drawn
+                rollups.adjust_savings(user, new_savings - summary.savings)
+                BudgetSummary.objects.filter(pk=summary.pk).update(savings=new_savings, version=F("version") + 1)
 
         return redirect("home")
 
@@ -156,12 +167,13 @@ def first(request):
     latest_budget = BudgetDetails.objects.filter(user=user, month=month, year=year).last()
     
 
-    # Fetch user-specific expenses
-    mandatory_expense = MandatoryExpense.objects.filter(user=user).aggregate(Sum('amount'))['amount__sum'] or 0
-    basic_needs_expense = BasicNeedsExpense.objects.filter(user=user).aggregate(Sum('amount'))['amount__sum'] or 0
-    sudden_expense = SuddenExpense.objects.filter(user=user).aggregate(Sum('amount'))['amount__sum'] or 0
+    # Fetch user-specific expenses (lifetime totals kept up to date by the rollups)
+    totals = rollups.get_totals(user)
+    mandatory_expense = totals.mandatory
+    basic_needs_expense = totals.basic_needs
+    sudden_expense = totals.sudden_expenses
+    total_savings = totals.savings
 
-    
 
     # Calculate remaining salary (active salary) for the user
     if latest_budget:
@@ -179,172 +191,199 @@ def first(request):
 
 
 
-def check_and_allocate_funds(user, category, amount, month, year):
-    budget = BudgetDetails.objects.filter(user=user, month=month, year=year).last()
-    summary = BudgetSummary.objects.filter(user=user, month=month, year=year).last()
+@account_required
+def home(request):
+    user = request.account
 
-    if not budget or not summary:
-        return False  # No budget exists yet
+    if request.method == "POST":
 
-    # Calculate remaining funds in each category
-    mandatory_remaining = budget.mandatory_limit - summary.mandatory
-    basic_needs_remaining = budget.basic_needs_limit - summary.basic_needs
-    sudden_expenses_remaining = budget.sudden_expenses_limit - summary.sudden_expenses
+        category = request.POST.get("category")
+        expense = request.POST.get("expense")
+        amount = money.rupees(request.POST.get("amount"))
+        image = request.FILES.get("image")
 
-    required = amount
+        # Compare with the user's earlier expenses before this one is counted in
+        verdict = anomalies.check(user, category, amount) if category in EXPENSE_CATEGORIES else None
+
+        # Look for the same receipt on an earlier expense before saving this one
+        fingerprint = fingerprints.fingerprint(image) if image else None
+        similar = fingerprints.find_similar(user, fingerprint) if fingerprint else []
+
+        # Charge the budget and save the expense in one transaction
+        try:
+            allocation.add_expense(user, category, expense, amount, image, fingerprint=fingerprint)
+        except allocation.AllocationError as exc:
+            return render(request, "home.html", {"error_message": str(exc)})
+
+        classifier.learn(expense, category)
+        if verdict:
+            messages.warning(request, verdict.message + " Please double-check it.")
+        for match in similar[:1]:
+            warning = fingerprints.describe(match)
+            if warning:
+                messages.warning(request, warning + " Delete one of them if this was entered twice.")
+
+        return redirect("home")
+
+    # User, savings, remaining salary and this month's budget, cached until the next write
+    dashboard, hit = caching.get_dashboard(user.user_id, now().month, now().year)
+
+    response = render(request, "home.html", dashboard)
+    response["X-Dashboard-Cache"] = "hit" if hit else "miss"
+    return response
 
-    if category == "Mandatory":
-        if required <= mandatory_remaining:
-            summary.mandatory += required
-            required = 0
-        else:
-            summary.mandatory += mandatory_remaining
-            required -= mandatory_remaining
 
-            if required <= basic_needs_remaining:
-                summary.basic_needs += required
-                required = 0
-            else:
-                summary.basic_needs += basic_needs_remaining
-                required -= basic_needs_remaining
-
-                if required <= sudden_expenses_remaining:
-                    summary.sudden_expenses += required
-                    required = 0
-                else:
-                    summary.sudden_expenses += sudden_expenses_remaining
-                    required -= sudden_expenses_remaining
-
-    elif category == "Basic Needs":
-        if required <= basic_needs_remaining:
-            summary.basic_needs += required
-            required = 0
-        else:
-            summary.basic_needs += basic_needs_remaining
-            required -= basic_needs_remaining
 
-            if required <= sudden_expenses_remaining:
-                summary.sudden_expenses += required
-                required = 0
-            else:
-                summary.sudden_expenses += sudden_expenses_remaining
-                required -= sudden_expenses_remaining
 
-    elif category == "Sudden Expense":
-        if required <= sudden_expenses_remaining:
-            summary.sudden_expenses += required
-            required = 0
-        else:
-            summary.sudden_expenses += sudden_expenses_remaining
-            required -= sudden_expenses_remaining
 
-            if required <= basic_needs_remaining:
-                summary.basic_needs += required
-                required = 0
-            else:
-                summary.basic_needs += basic_needs_remaining
-                required -= basic_needs_remaining
-
-    # If there’s still required money left, take from total savings
-    total_savings = get_total_savings(user)  # Get user's total savings
-    if required > 0:
-        if required <= total_savings:
-            summary.savings -= required
-        else:
-            return False  # Not enough total savings available
 
-    summary.save()
-    return True  # Transaction successful
 
+@account_required
+def suggest_category(request):
+    """Category the classifier would pick for ?description=, for the expense form."""
+    category, confidence = classifier.suggest(request.GET.get("description", "")[:255])
+    return JsonResponse({"category": category, "confidence": round(confidence, 3)})
 
-def get_total_savings(user):
-    return (
-        BudgetSummary.objects.filter(user=user).aggregate(total_savings=Sum("savings"))[
-            "total_savings"
-        ]
-        or 0
+
+@account_required
+def import_expenses(request):
+    user = request.account
+    statement = request.FILES.get("statement")
+    if request.method != "POST" or statement is None:
+        return redirect("home")
+    default_category = request.POST.get("default_category") or None
+    if default_category not in (None, AUTO_CATEGORY, *EXPENSE_CATEGORIES):
+        messages.error(request, f"unknown category {default_category!r}")
+        return redirect("home")
+
+    # Stream the upload straight into the importer; large files are spooled to disk by Django
+    report = import_csv(
+        user,
+        io.TextIOWrapper(statement.file, encoding="utf-8-sig", newline=""),
+        default_category=default_category,
     )
+    if report.failed:
+        messages.error(request, f"Statement import stopped, {report.failed}: {report}")
+    else:
+        messages.success(request, f"Statement imported: {report}")
+    for error in report.errors:
+        messages.error(request, error)
+    return redirect("home")
 
 
-def get_remaining_salary(user, month, year):
-    budget = BudgetDetails.objects.filter(user=user, month=month, year=year).last()
-    summary = BudgetSummary.objects.filter(user=user, month=month, year=year).last()
+def export_expenses(request):
+    """
+    Stream the logged-in user's expenses as CSV or NDJSON.
+    Superusers signed in to the admin get every user's expenses (or ?user=<username>).
+    """
+    user = None
+    if request.user.is_superuser:
+        username = request.GET.get("user")
+        if username:
+            user = sharding.find_account(username=username)
+            if user is None:
+                raise Http404("No such user")
+    else:
+        user = request.account
+        if user is None:
+            return redirect("login")
 
-    if not budget or not summary:
-        return 0  # No budget data available
+    fmt = request.GET.get("format", "csv")
+    if fmt not in exporter.FORMATS:
+        return HttpResponseBadRequest("format must be csv or ndjson")
+    try:
+        since = date.fromisoformat(request.GET["since"]) if request.GET.get("since") else None
+        until = date.fromisoformat(request.GET["until"]) if request.GET.get("until") else None
+    except ValueError:
+        return HttpResponseBadRequest("since/until must be YYYY-MM-DD")
 
-    spent_amount = summary.mandatory + summary.basic_needs + summary.sudden_expenses
-    remaining_salary = budget.active_salary - spent_amount
-    return remaining_salary
+    rows = exporter.export_rows(user, since, until)
+    response = StreamingHttpResponse(
+        exporter.render(rows, fmt),
+        content_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+    )
+    name = user.username if user else "all-users"
+    response["Content-Disposition"] = f'attachment; filename="expenses-{name}.{fmt}"'
+    return response
 
 
-def home(request):
-    # Ensure user is logged in
-    user_id = request.session.get("user_id")
-    if not user_id:
-        return redirect("login")  # Redirect to login if not authenticated
+import calendar
+from django.shortcuts import render, redirect,get_object_or_404
+from datetime import datetime
+from django.db.models import Q, Value
+from .models import UserAccount
 
-    # Get the logged-in user
-    user = UserAccount.objects.get(user_id=user_id)  
+HISTORY_PAGE_SIZES = (25, 50, 100, 200)
+DEFAULT_HISTORY_PAGE_SIZE = 50
 
 
-    if request.method == "POST":
-        category = request.POST.get("category")
-        expense = request.POST.get("expense")
-        amount = float(request.POST.get("amount"))
-        image = request.FILES.get("image")
+def _history_page_size(request):
+    try:
+        page_size = int(request.GET.get("page_size", DEFAULT_HISTORY_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_HISTORY_PAGE_SIZE
+    return page_size if page_size in HISTORY_PAGE_SIZES else DEFAULT_HISTORY_PAGE_SIZE
 
-        month = now().month
-        year = now().year
-
-        if check_and_allocate_funds(user, category, amount, month, year):
-            if category == "Mandatory":
-                expense_obj = MandatoryExpense(user=user, expense=expense, amount=amount, image=image)
-                expense_obj.save()
-            elif category == "Basic Needs":
-                expense_obj = BasicNeedsExpense(user=user, expense=expense, amount=amount, image=image)
-                expense_obj.save()
-            elif category == "Sudden Expense":
-                expense_obj = SuddenExpense(user=user, expense=expense, amount=amount, image=image)
-                expense_obj.save()
-            
-            
-            return redirect("home")
-        else:
-            return render(request, "home.html", {"error_message": "Insufficient funds!"})
 
-    total_savings = get_total_savings(user)
-    remaining_salary = get_remaining_salary(user, now().month, now().year)
+def _history_start_number(request, cursor):
+    """Row number of the page's first expense (?start=, after a cursor), at least 1."""
+    if not cursor:
+        return 1
+    try:
+        return max(int(request.GET.get("start", 1)), 1)
+    except ValueError:
+        return 1
 
-    budget_details = BudgetDetails.objects.filter(user=user, month=now().month, year=now().year).first()
-    budget_summary = BudgetSummary.objects.filter(user=user, month=now().month, year=now().year).first()
 
-    return render(request, "home.html", {
-        "user": user,
-        "total_savings": total_savings,
-        "remaining_salary": remaining_salary,
-        "budget_details": budget_details,
-        "budget_summary": budget_summary,
-    })
+def _parse_history_cursor(value):
+    """'<iso timestamp>|<id>|<kind>' -> (timestamp, id, kind), or None for the first page."""
+    if not value:
+        return None
+    try:
+        timestamp, expense_id, kind = value.split("|")
+        return datetime.fromisoformat(timestamp), int(expense_id), int(kind)
+    except ValueError:
+        return None
 
 
+def _before_cursor(cursor, kind):
+    """Rows of one expense table that sort after the cursor in (timestamp, id, kind) DESC order."""
+    timestamp, expense_id, cursor_kind = cursor
+    same_time = Q(timestamp=timestamp, id__lte=expense_id) if kind < cursor_kind else Q(timestamp=timestamp, id__lt=expense_id)
+    return Q(timestamp__lt=timestamp) | same_time
 
 
+def _history_rows(user_id, start, end, cursor, page_size):
+    """
+    One UNION ALL over the three expense tables. Each branch is read from the
+    (user, timestamp) index in order, so the database merges them and stops
+    after one page (plus one row, to tell whether there is a next page)
+    instead of sorting the whole month.
+    """
+    branches = []
+    for kind, (category, (model, _)) in enumerate(EXPENSE_CATEGORIES.items()):
+        rows = model.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+        if cursor:
+            rows = rows.filter(_before_cursor(cursor, kind))
+        branches.append(
+            rows.annotate(kind=Value(kind), category=Value(category))
+            .values("id", "timestamp", "kind", "category", "expense", "amount", "image", "thumbnail", "display_image")
+        )
+    return branches[0].union(*branches[1:], all=True).order_by("-timestamp", "-id", "-kind")[:page_size + 1]
 
 
+def _split_history_page(page, page_size):
+    """(rows to show, cursor for the next page or None)"""
+    if len(page) <= page_size:
+        return page, None
+    page = page[:page_size]
+    last = page[-1]
+    return page, f"{last['timestamp'].isoformat()}|{last['id']}|{last['kind']}"
 
-import calendar
-from django.shortcuts import render, redirect,get_object_or_404
-from datetime import datetime, timedelta
-from django.utils.timezone import get_current_timezone
-from .models import UserAccount, MandatoryExpense, BasicNeedsExpense, SuddenExpense
 
+@account_required
 def month_history(request):
-    user_id = request.session.get("user_id")
-    if not user_id:
-        return redirect("login")
-
-    user = UserAccount.objects.get(user_id=user_id)
+    user = request.account
 
     now = datetime.now()
     current_month = now.month
@@ -352,51 +391,21 @@ def month_history(request):
 
     month = int(request.GET.get("month", current_month))
     year = int(request.GET.get("year", current_year))
+    page_size = _history_page_size(request)
+    cursor = _parse_history_cursor(request.GET.get("after"))
+    start_number = _history_start_number(request, cursor)
 
     expenses = []
+    next_cursor = None
     error_message = ""
-    tz = get_current_timezone()
 
     try:
-        all_expenses = []
-
-        for exp in MandatoryExpense.objects.filter(user=user, timestamp__month=month, timestamp__year=year):
-            ist_time = exp.timestamp.astimezone(tz) + timedelta(hours=5, minutes=30)
-            all_expenses.append({
-                "id": exp.id,
-                "category": "Mandatory",
-                "expense": exp.expense,
-                "amount": exp.amount,
-                "date": ist_time.strftime("%d-%m-%Y"),
-                "time": ist_time.strftime("%H:%M"),
-                "image_url": exp.image.url if exp.image else None
-            })
-
-        for exp in BasicNeedsExpense.objects.filter(user=user, timestamp__month=month, timestamp__year=year):
-            ist_time = exp.timestamp.astimezone(tz) + timedelta(hours=5, minutes=30)
-            all_expenses.append({
-                "id": exp.id,
-                "category": "Basic Needs",
-                "expense": exp.expense,
-                "amount": exp.amount,
-                "date": ist_time.strftime("%d-%m-%Y"),
-                "time": ist_time.strftime("%H:%M"),
-                "image_url": exp.image.url if exp.image else None
-            })
-
-        for exp in SuddenExpense.objects.filter(user=user, timestamp__month=month, timestamp__year=year):
-            ist_time = exp.timestamp.astimezone(tz) + timedelta(hours=5, minutes=30)
-            all_expenses.append({
-                "id": exp.id,
-                "category": "Sudden Expense",
-                "expense": exp.expense,
-                "amount": exp.amount,
-                "date": ist_time.strftime("%d-%m-%Y"),
-                "time": ist_time.strftime("%H:%M"),
-                "image_url": exp.image.url if exp.image else None
-            })
-
-        expenses = all_expenses
+        start, end = month_bounds(year, month)
+
+        page = list(_history_rows(user.user_id, start, end, cursor, page_size))
+        if not page:  # nothing left in the expense tables: maybe an archived month
+            page = archive.history_page(user.user_id, year, month, cursor, page_size)
+        expenses, next_cursor = _split_history_page(page, page_size)
 
     except ValueError:
         error_message = "Invalid month or year selected."
@@ -413,15 +422,104 @@ def month_history(request):
         "selected_year": year,
         "months_list": list(enumerate(calendar.month_name))[1:],  # (1, 'January') -> (2, 'February')
         "error_message": error_message,
+        "page_size": page_size,
+        "page_sizes": HISTORY_PAGE_SIZES,
+        "start_number": start_number,
+        "next_cursor": next_cursor,
+        "next_start_number": start_number + len(expenses),
     })
 
 
-def delete_expense(request, expense_id):
-    user_id = request.session.get("user_id")
-    if not user_id:
-        return redirect("login")
+@account_required
+def household_view(request):
+    """The household's shared budget and combined spend this month, or the forms to start or join one."""
+    user = request.account
+    month, year = now().month, now().year
+
+    if request.method == "POST":
+        action = request.POST.get("action")
+        try:
+            if action == "create":
+                households.create(user, request.POST.get("name", ""))
+            elif action == "join":
+                households.join(user, request.POST.get("code", ""))
+            elif action == "leave":
+                households.leave(user)
+            elif action == "budget" and user.household_id:
+                households.set_budget(user.household, month, year, {
+                    field: request.POST.get(limit) for field, limit in households.LIMITS.items()
+                })
+        except households.HouseholdError as exc:
+            messages.error(request, str(exc))
+        except ValueError:
+            messages.error(request, "Enter the three limits as amounts.")
+        return redirect("household")
+
+    context = {"user": user, "month_name": calendar.month_name[month], "year": year}
+    if user.household_id is not None:
+        context.update(households.dashboard(user.household, month, year))
+    return render(request, "household.html", context)
+
+
+def _analytics_report(request):
+    first, last = analytics.month_range(request.GET.get("start"), request.GET.get("end"))
+    return analytics.report(request.account.user_id, first, last)
+
+
+@account_required
+def spending_analytics(request):
+    """Spend, budget-vs-actual and savings month by month over ?start=YYYY-MM&end=YYYY-MM."""
+    error_message = ""
+    try:
+        report = _analytics_report(request)
+    except ValueError as error:
+        error_message = f"Invalid range: {error}"
+        report = analytics.report(request.account.user_id, *analytics.month_range())
+
+    return render(request, "analytics.html", {
+        "user": request.account,
+        "report": report,
+        "error_message": error_message,
+        "max_months": analytics.MAX_MONTHS,
+    })
+
 
-    user = get_object_or_404(UserAccount, user_id=user_id)
+@account_required
+def analytics_api(request):
+    """The same report as spending_analytics, as JSON."""
+    try:
+        return JsonResponse(_analytics_report(request))
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+
+def receipt(request, name):
+    """A receipt or one of its copies, for the family whose expense it is on (or a superuser); see app.media."""
+    if not request.user.is_superuser:
+        if request.account is None:
+            return redirect("login")
+        if not media.owns(request.account, name):
+            raise Http404("No such receipt")
+    return media.serve(request, name)
+
+
+def static_asset(request, name):
+    """Collected static files with long-lived caching, when DEBUG is off and no front server serves STATIC_URL."""
+    return media.serve_static(request, name)
+
+
+def metrics_view(request):
+    """Request metrics for Prometheus, for holders of settings.METRICS_TOKEN and superusers."""
+    token = settings.METRICS_TOKEN
+    bearer = request.headers.get("Authorization", "")
+    if not (token and constant_time_compare(bearer, f"Bearer {token}")) and not request.user.is_superuser:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@account_required
+def delete_expense(request, expense_id):
+    user = request.account
     expense = None
     category = None
 
@@ -442,18 +540,7 @@ def delete_expense(request, expense_id):
         return redirect("home")
 
     if request.method == "POST":
-        summary = BudgetSummary.objects.filter(user=user, month=now().month, year=now().year).last()
-
-        if summary:
-            if category == "Mandatory":
-                summary.mandatory -= expense.amount
-            elif category == "Basic Needs":
-                summary.basic_needs -= expense.amount
-            elif category == "Sudden Expense":
-                summary.sudden_expenses -= expense.amount
-            summary.save()
-
-        expense.delete()
+        allocation.remove_expense(user, category, expense)
         return redirect("month_history")  # Redirect to home after deletion
 
     return render(request, "delete.html", {"expense": expense, "category": category})
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family.settings')
+# Route the read-heavy pages to app.async_views (see settings.ASYNC_VIEWS)
+os.environ.setdefault('FAMILY_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
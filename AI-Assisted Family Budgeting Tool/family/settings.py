@@ -42,12 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.RequestMetricsMiddleware',  # first, so it times everything below it
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'app.middleware.CurrentAccountMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -55,10 +57,16 @@ ROOT_URLCONF = 'family.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'app.metrics.TimedDjangoTemplates',  # DjangoTemplates, timed for /metrics
         'DIRS': [BASE_DIR,"templates"],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parsed templates are kept in memory (runserver's autoreloader clears them when one changes)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -78,10 +86,69 @@ WSGI_APPLICATION = 'family.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('FAMILY_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Production SQLite profile (FAMILY_SQLITE_PRODUCTION=1): WAL so readers never
+# wait for the writer, a busy timeout instead of "database is locked", write
+# transactions that take the lock up front (BEGIN IMMEDIATE) so two of them can
+# never deadlock upgrading from a read lock, and persistent connections so the
+# pragmas are paid once per connection rather than once per request.
+SQLITE_PRODUCTION = os.environ.get('FAMILY_SQLITE_PRODUCTION', '0') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,  # ms
+    'synchronous': 'NORMAL',  # durable at checkpoints; safe from corruption in WAL mode
+    'cache_size': -64000,  # KiB, so 64 MB of page cache per connection
+    'mmap_size': 268435456,  # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    'transaction_mode': 'IMMEDIATE',
+}
+
+if SQLITE_PRODUCTION:
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Per-family sharding (FAMILY_SHARDS=N): each family's rows live in one of
+# db_shard0.sqlite3 .. db_shard{N-1}.sqlite3 next to the default database,
+# which keeps the shard map and Django's own tables. See app/sharding.py;
+# migrate every database (manage.py migrate --database shardK) and move
+# existing families with manage.py rebalance_shards.
+FAMILY_SHARDS = int(os.environ.get('FAMILY_SHARDS', '0'))
+
+if FAMILY_SHARDS:
+    for index in range(FAMILY_SHARDS):
+        DATABASES[f'shard{index}'] = {
+            **DATABASES['default'],
+            'NAME': Path(DATABASES['default']['NAME']).with_name(f'db_shard{index}.sqlite3'),
+        }
+    DATABASE_ROUTERS = ['app.sharding.ShardRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at e.g. Redis in production.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'family-budget'),
+    }
+}
+
+# Cache alias used for the home() dashboard figures and the signed-in account
+DASHBOARD_CACHE = 'default'
+
+# Sessions are read from the cache and written through to the database,
+# so a signed-in page load does not need a session query
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -118,6 +185,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Outside DEBUG, collectstatic also writes content-hashed copies of the CSS and
+# JS (home.3f9a1c0b2d4e.css) and {% static %} links to them, so browsers can
+# cache them for a year (see app.media.serve_static)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.'
+                   + ('StaticFilesStorage' if DEBUG else 'ManifestStaticFilesStorage'),
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -137,3 +216,32 @@ MEDIA_URL = '/media/'  # URL where media files will be accessible
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Directory where media files will be saved
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Receipt thumbnails / display copies are rendered by this many background threads
+RECEIPT_WORKERS = 2
+# Render them synchronously on commit instead (tests, management commands)
+RECEIPT_PROCESS_INLINE = False
+
+# Receipts are served by app.media; set to "X-Sendfile" or "X-Accel-Redirect"
+# to let the front web server send the file (nginx: an internal location at
+# RECEIPT_ACCEL_PREFIX aliased to MEDIA_ROOT)
+RECEIPT_SENDFILE = os.environ.get("RECEIPT_SENDFILE", "")
+RECEIPT_ACCEL_PREFIX = os.environ.get("RECEIPT_ACCEL_PREFIX", "/protected-media/")
+RECEIPT_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+# Trained category classifier (python manage.py train_classifier)
+CLASSIFIER_PATH = os.environ.get("CLASSIFIER_PATH", str(BASE_DIR / "classifier.npz"))
+
+# Serve first/home/month_history from app.async_views; family/asgi.py turns this on
+ASYNC_VIEWS = os.environ.get("FAMILY_ASYNC_VIEWS", "0") == "1"
+
+# /metrics is served to requests with "Authorization: Bearer <METRICS_TOKEN>"
+# and to superusers; with no token set only superusers can read it. Client
+# addresses are not trusted: behind the front web server they are all loopback.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# Requests slower than this are logged with their slowest queries
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0"))
+
+# close_months moves expenses older than this many months (counting the
+# current one) out of the expense tables into per-year archives
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("ARCHIVE_AFTER_MONTHS", "12"))
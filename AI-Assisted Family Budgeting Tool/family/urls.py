@@ -16,18 +16,34 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from app import views
+from app import api, async_views, views
 from django.conf import settings
-from django.conf.urls.static import static
+
+# Under ASGI the dashboard, budget and history pages have async versions
+pages = async_views if settings.ASYNC_VIEWS else views
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('first',views.first,name="first"),
-    path('home',views.home,name='home'),
-    path('month_history',views.month_history,name='month_history'),
+    path('first',pages.first,name="first"),
+    path('home',pages.home,name='home'),
+    path('month_history',pages.month_history,name='month_history'),
+    path('analytics',views.spending_analytics,name='analytics'),
+    path('household',views.household_view,name='household'),
+    path('api/analytics',views.analytics_api,name='analytics_api'),
+    path('api/expenses',api.expenses,name='api_expenses'),
+    path('api/expenses/<str:category>/<int:expense_id>',api.expense,name='api_expense'),
+    path('metrics',views.metrics_view,name='metrics'),
+    path('suggest',views.suggest_category,name='suggest_category'),
+    path('import',views.import_expenses,name='import_expenses'),
+    path('export',views.export_expenses,name='export_expenses'),
     path('',views.login_view,name="login"),
     path('register',views.register,name="register"),
     path('logout',views.logout_view,name="logout"),
     path('delete/<int:expense_id>/', views.delete_expense, name='delete'),
-]  + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Receipts, checked against the signed-in family (see app.media)
+    path(settings.MEDIA_URL.lstrip('/') + '<path:name>', views.receipt, name='receipt'),
+]
+
+if not settings.DEBUG:  # runserver's staticfiles handler serves them in development
+    urlpatterns.append(path(settings.STATIC_URL.lstrip('/') + '<path:name>', views.static_asset, name='static_asset'))